@@ -7,9 +7,14 @@ GO
 USE Trivia
 GO
 
+-- a removed category is hidden (Removing = 1) and then deleted in batches (see DAL.purge_categories).
+-- to upgrade an existing database:
+-- ALTER TABLE Categories ADD Removing BIT NOT NULL DEFAULT 0;
+
 CREATE TABLE Categories (
     CategoryID INT PRIMARY KEY IDENTITY,
-    CategoryName NVARCHAR(40) NOT NULL UNIQUE CHECK (LEN(CategoryName) > 0)
+    CategoryName NVARCHAR(40) NOT NULL UNIQUE CHECK (LEN(CategoryName) > 0),
+    Removing BIT NOT NULL DEFAULT 0
 )
 GO
 
@@ -19,10 +24,35 @@ CREATE TABLE Questions (
     QuestionType SMALLINT NOT NULL CHECK (QuestionType IN (1, 2)),
     Difficulty SMALLINT NOT NULL CHECK (Difficulty IN (1, 2, 3)),
     Question NVARCHAR(300) NOT NULL,
-    CorrectAnswer NVARCHAR(150) NOT NULL
+    CorrectAnswer NVARCHAR(150) NOT NULL,
+    RowVer ROWVERSION,
+    QuestionHash CHAR(40) NULL,
+    BucketSeq INT NOT NULL
 )
 GO
 
+-- random sampling (see DbSqlServer.get_questions). the questions of every (category, difficulty) bucket
+-- are numbered 1..n without gaps, so a uniform sample is drawn by picking random numbers, and is read with
+-- index seeks. questions are only removed with their category, which is hidden first, so the numbers of the
+-- buckets that are sampled stay dense.
+-- to upgrade an existing database:
+-- ALTER TABLE Questions ADD BucketSeq INT NULL;
+-- WITH s AS (SELECT BucketSeq, ROW_NUMBER() OVER (PARTITION BY CategoryID, Difficulty ORDER BY QuestionID) AS n
+--            FROM Questions)
+-- UPDATE s SET BucketSeq = n;
+-- ALTER TABLE Questions ALTER COLUMN BucketSeq INT NOT NULL;
+
+CREATE UNIQUE INDEX UX_Questions_Bucket ON Questions(CategoryID, Difficulty, BucketSeq)
+GO
+
+-- duplicate detection by the normalized content hash of the question (see DAL.question_hash).
+-- questions added before the hash was stored, and their near-duplicates, have no hash.
+-- to upgrade an existing database, first add the column and then run backfill_question_hashes.py:
+-- ALTER TABLE Questions ADD QuestionHash CHAR(40) NULL;
+
+CREATE UNIQUE INDEX UX_Questions_QuestionHash ON Questions(QuestionHash) WHERE QuestionHash IS NOT NULL
+GO
+
 CREATE TABLE Answers (
     AnswerID INT PRIMARY KEY IDENTITY,
     QuestionID INT FOREIGN KEY REFERENCES Questions(QuestionID) ON DELETE CASCADE,
@@ -30,9 +60,13 @@ CREATE TABLE Answers (
 )
 GO
 
+CREATE INDEX IX_Answers_QuestionID ON Answers(QuestionID) INCLUDE (Answer)
+GO
+
 CREATE TABLE Users (
     UserID INT PRIMARY KEY IDENTITY,
-    UserName NVARCHAR(15) NOT NULL UNIQUE CHECK (LEN(UserName) > 0)
+    UserName NVARCHAR(15) NOT NULL UNIQUE CHECK (LEN(UserName) > 0),
+    RowVer ROWVERSION
 )
 GO
 
@@ -40,9 +74,82 @@ CREATE TABLE Records (
     QuestionID INT FOREIGN KEY REFERENCES Questions(QuestionID) ON DELETE CASCADE,
 	UserID INT FOREIGN KEY REFERENCES Users(UserID) ON DELETE CASCADE,
     Correct SMALLINT CHECK (Correct IN (0, 1)),
+    RowVer ROWVERSION,
     PRIMARY KEY (UserID, QuestionID)
 )
 GO
 
+-- serves the cascading delete of questions
+CREATE INDEX IX_Records_QuestionID ON Records(QuestionID)
+GO
+
+-- the answered questions of every user by bucket, a row per word of a bitmap of the sequence numbers
+-- (see dal.AnsweredSeqs). maintained by update_correct, serves get_questions with exclude_answered.
+-- to upgrade an existing database, create the table and then call rebuild_stats to build it from the records.
+
+CREATE TABLE AnsweredBits (
+    UserID INT FOREIGN KEY REFERENCES Users(UserID) ON DELETE CASCADE,
+    CategoryID INT FOREIGN KEY REFERENCES Categories(CategoryID) ON DELETE CASCADE,
+    Difficulty SMALLINT NOT NULL,
+    Word INT NOT NULL,
+    Bits BIGINT NOT NULL,
+    PRIMARY KEY (UserID, CategoryID, Difficulty, Word)
+)
+GO
+
+-- serves the deletion of the bitmaps of a removed category
+CREATE INDEX IX_AnsweredBits_CategoryID ON AnsweredBits(CategoryID)
+GO
+
+-- change tracking for the incremental exports (see DbSqlServer.export_rows).
+-- to upgrade an existing database, first add the columns:
+-- ALTER TABLE Questions ADD RowVer ROWVERSION; ALTER TABLE Users ADD RowVer ROWVERSION;
+-- ALTER TABLE Records ADD RowVer ROWVERSION;
+
+CREATE INDEX IX_Questions_RowVer ON Questions(RowVer)
+GO
+
+CREATE INDEX IX_Users_RowVer ON Users(RowVer)
+GO
+
+CREATE INDEX IX_Records_RowVer ON Records(RowVer)
+GO
+
+-- statistics counters, maintained by update_correct
+
+CREATE TABLE CategoryStats (
+    CategoryID INT PRIMARY KEY FOREIGN KEY REFERENCES Categories(CategoryID) ON DELETE CASCADE,
+    Correct INT NOT NULL DEFAULT 0,
+    Incorrect INT NOT NULL DEFAULT 0
+)
+GO
+
+CREATE TABLE DifficultyStats (
+    Difficulty SMALLINT PRIMARY KEY CHECK (Difficulty IN (1, 2, 3)),
+    Correct INT NOT NULL DEFAULT 0,
+    Incorrect INT NOT NULL DEFAULT 0
+)
+GO
+
+CREATE TABLE UserStats (
+    UserID INT PRIMARY KEY FOREIGN KEY REFERENCES Users(UserID) ON DELETE CASCADE,
+    Correct INT NOT NULL DEFAULT 0,
+    Incorrect INT NOT NULL DEFAULT 0
+)
+GO
+
+-- the leaderboard (see DAL.get_leaderboard): the users by number of correct answers, and the number of users
+-- per number of correct answers, maintained by update_correct.
+-- to upgrade an existing database, create the index and the table and then call rebuild_stats to fill it.
+
+CREATE INDEX IX_UserStats_Correct ON UserStats(Correct, UserID) INCLUDE (Incorrect)
+GO
+
+CREATE TABLE ScoreCounts (
+    Correct INT PRIMARY KEY,
+    Users INT NOT NULL
+)
+GO
+
 USE Master
 GO
\ No newline at end of file
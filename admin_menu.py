@@ -1,5 +1,7 @@
 from mode import Mode
+from category_remover import CategoryRemover
 from dal import Types, Difficulties
+from opentdb import bulk_import
 
 
 class AdminMenu(Mode):
@@ -10,7 +12,8 @@ class AdminMenu(Mode):
         "Remove category",
         "Add question",
         "Import questions",
-        "Get game statistics"
+        "Get game statistics",
+        "Rebuild statistics"
     ]
 
     MAX_WRONG_ANSWERS = 3
@@ -18,6 +21,9 @@ class AdminMenu(Mode):
 
     def __init__(self):
         super().__init__()
+        # removed categories are deleted in the background, starting with the removals left by former sessions
+        self.remover = CategoryRemover(self.db)
+        self.remover.start()
 
     def start(self):
         self.ui.alert("-- Admin menu --")
@@ -59,8 +65,8 @@ class AdminMenu(Mode):
         """ Asks the admin to choose a category to remove from the database."""
         category = self._choose_category("Please choose a category to remove.")
         if category:
-            self.db.remove_category(category)
-            self.ui.alert("Category removed.")
+            self.remover.remove(category)
+            self.ui.alert("Category removed. Its questions are deleted in the background.")
 
     def add_question(self):
         """
@@ -97,14 +103,14 @@ class AdminMenu(Mode):
 
     def import_questions(self):
         """
-        Asks the admin to choose the amount of questions(max: 50), a category
+        Asks the admin to choose the amount of questions, a category
             from the available categories of the api, and difficulty from the available
             difficulties as given by the data access layer Difficulties class.
+            More than MAX_IMPORT_AMOUNT questions are imported in pages by opentdb.bulk_import.
             Lets the admin know how many questions were added as some might be duplicates.
         """
         extra_options = ["Random"]
-        amount = self.ui.get_user_input(f"How many questions would you like to import? "
-                                        f"(max: {self.db.MAX_IMPORT_AMOUNT}, default: 1):",
+        amount = self.ui.get_user_input("How many questions would you like to import? (default: 1):",
                                         self._validate_pos_num)
         category = self.ui.get_user_choice(self.db.get_opentdb_categories() + extra_options,
                                            f"Choose category or {', '.join(extra_options)}:")
@@ -118,7 +124,14 @@ class AdminMenu(Mode):
         if category in self.db.get_opentdb_categories():
             import_options['category'] = category
         try:
-            count = self.db.import_questions(**import_options)
+            if import_options.get('amount', 1) > self.db.MAX_IMPORT_AMOUNT:
+                self.ui.alert("Importing, this may take a while (opentdb allows a request every 5 seconds)...")
+                stats = bulk_import(self.db, client=self.db.opentdb, **import_options)
+                count = stats['added']
+                if stats['exhausted']:
+                    self.ui.alert(f"opentdb ran out of questions after {stats['fetched']}.")
+            else:
+                count = self.db.import_questions(**import_options)
             self.ui.alert(f"Import successful. {count} questions were added to the database.")
         except ConnectionError:
             self.ui.alert("Something went wrong when trying to import from opentdb. Try again later.")
@@ -130,7 +143,8 @@ class AdminMenu(Mode):
         """
         options = ["Show correct/incorrect answers by category",
                    "Show correct/incorrect answers by difficulty",
-                   f"Show top {self.N_TOP_USERS} users"]
+                   "Show top users",
+                   "Show the rank of a user"]
         choice = self.ui.get_user_choice(options)
         if choice == options[0]:
             result = self.db.get_results_by('category')
@@ -141,12 +155,53 @@ class AdminMenu(Mode):
             result['Difficulty'] = result['Difficulty'].map(lambda x: Difficulties[x])
             result = result.sort_values('Difficulty')
         elif choice == options[2]:
-            result = self.db.get_results_by('user', limit=self.N_TOP_USERS, order_by='Correct', ascending=False)
+            self._show_leaderboard()
+            return
+        elif choice == options[3]:
+            self._show_user_rank()
+            return
         if len(result) > 0:
-            self.ui.show_data(result, bar=choice != options[2])
+            self.ui.show_data(result, bar=True)
         else:  # no data
             self.ui.alert("There is currently no data to show.")
 
+    def _show_leaderboard(self):
+        # shows the top users a page at a time (see DAL.get_leaderboard), as long as the admin asks for more
+        amount = self.ui.get_user_input(f"How many users would you like to see? (default: {self.N_TOP_USERS}):",
+                                        self._validate_pos_num)
+        limit = int(amount) if amount else self.N_TOP_USERS
+        page, cursor = self.db.get_leaderboard(limit)
+        if len(page) == 0:
+            self.ui.alert("There is currently no data to show.")
+            return
+        self.ui.show_data(page)
+        while cursor is not None and self.ui.yes_no(f"Show the next {limit} users?"):
+            page, cursor = self.db.get_leaderboard(limit, after=cursor)
+            if len(page) == 0:
+                break
+            self.ui.show_data(page)
+
+    def _show_user_rank(self):
+        # shows the place of a user on the leaderboard
+        name = self.ui.get_user_input("Enter username:")
+        rank = self.db.get_user_rank(name) if name else None
+        if rank is None:
+            self.ui.alert("There is no such user, or the user didn't answer any question yet.")
+        else:
+            self.ui.alert(f"{name} is ranked {rank['rank']} with {rank['correct']} correct "
+                          f"and {rank['incorrect']} incorrect answers.")
+
+    def rebuild_statistics(self):
+        """ Recomputes the game statistics from the answer records, in case the counters went out of sync."""
+        if self.ui.yes_no("This reads all the answer records and may take a while. Continue?"):
+            self.db.rebuild_stats()
+            self.ui.alert("Statistics rebuilt.")
+
+    def close(self):
+        """ Stops deleting the removed categories (they are deleted by the next session) and closes the mode."""
+        self.remover.close()
+        super().close()
+
     def _validate_wrong_answer_count(self, count):
         # a validation method to use with the ui.get_user_input method
         # validates that the input is a number between 1 and MAX_WRONG_ANSWERS
@@ -0,0 +1,310 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerRecorder:
+    """
+    Records the players' answers in the database in the background (write-behind).
+
+    Every answer is first appended to a local journal file and put in an in-process queue, so the player
+    doesn't wait for the database. A background writer takes the answers from the queue and writes them
+    in batches with DAL.update_correct_many. After each batch a marker is appended to the journal.
+    Answers that were journaled but not written (e.g. the process died) are replayed on the next start.
+    Writing an answer twice is harmless since the last answer of a user to a question overrides the former.
+
+    The journal is a text file with one JSON object per line, either an answer
+        {"seq": 1, "question": ..., "user": ..., "correct": 1}
+    or a marker that all the answers up to a sequence number were written
+        {"flushed": 1}
+    It is truncated whenever all the journaled answers were written.
+    The journal is locked by the recorder that started on it, so two processes (e.g. a game and the server)
+        never truncate each other's unwritten answers: start fails while another recorder holds the lock.
+
+    Attributes:
+        batch_size (int): The maximum number of answers written in a single batch.
+        flush_interval (float): How long (in seconds) the writer waits to fill a batch before writing it.
+        retry_interval (float): How long (in seconds) the writer waits before retrying a failed batch.
+
+    """
+
+    def __init__(self, db, journal_path=None, batch_size=50, flush_interval=0.5, retry_interval=2, fsync=False):
+        """
+        Args:
+            db (DAL): The database to write the answers to.
+            journal_path (str, optional): The path of the journal file. Every running recorder needs a journal
+                of its own (see start). Defaults to answers_<db class name>.journal in the working directory,
+                named after the backend for a wrapped database (e.g. a QuestionCache).
+            batch_size (int): See class attributes. Defaults to 50.
+            flush_interval (float): See class attributes. Defaults to 0.5 seconds.
+            retry_interval (float): See class attributes. Defaults to 2 seconds.
+            fsync (bool): If True, every answer is synced to the disk before record returns.
+                This survives power loss as well as a crash of the process, at the cost of latency.
+                Defaults to False.
+        """
+        self.db = db
+        self.journal_path = journal_path or f"answers_{type(self._backend(db)).__name__}.journal"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self._fsync = fsync
+        self._queue = queue.Queue()
+        self._journal = None
+        self._journal_lock = threading.Lock()
+        self._seq = 0
+        self._pending = 0  # journaled answers that were not written yet (queued or being written)
+        self._oldest_pending = None  # the time the oldest pending answer was recorded
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._writer = None
+        self._stats = {
+            'recorded': 0,
+            'written': 0,
+            'failed': 0,
+            'batches': 0,
+            'retries': 0,
+            'replayed': 0,
+            'last_batch_seconds': 0.0
+        }
+
+    def start(self):
+        """
+        Locks the journal, replays its unwritten answers and starts the background writer.
+        Registers close to be called on interpreter exit.
+
+        Raises:
+            RuntimeError: If the journal is locked by another recorder (of this or another process).
+
+        """
+        if self._writer is not None:
+            return
+        journal = open(self.journal_path, 'a+', encoding='utf-8')
+        try:
+            self._lock(journal)
+        except OSError:
+            journal.close()
+            raise RuntimeError(f"The journal {self.journal_path} is used by another recorder. "
+                               f"Give every process a journal_path of its own.")
+        pending = self._read_journal(journal)
+        # rewrite the journal with only the unwritten answers. this also drops a partial last line.
+        journal.seek(0)
+        journal.truncate()
+        self._journal = journal
+        for entry in pending:
+            self._append(entry)
+            self._enqueue(entry)
+        self._stats['replayed'] = len(pending)
+        if pending:
+            logger.info("Replaying %d unwritten answers from %s", len(pending), self.journal_path)
+        self._stop.clear()
+        self._writer = threading.Thread(target=self._run, name="AnswerRecorder", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, question, user, correct):
+        """
+        Records an answer. Returns as soon as the answer is journaled.
+
+        Args:
+            question: The question id
+            user: The user id
+            correct (bool or int): True (or 1) if the user answered correctly, False (or 0) otherwise.
+
+        """
+        if self._writer is None:
+            raise RuntimeError("The recorder is not started.")
+        with self._journal_lock:
+            self._seq += 1
+            entry = {
+                'seq': self._seq,
+                'question': self.db.encode_id(question),
+                'user': self.db.encode_id(user),
+                'correct': int(correct)
+            }
+            self._append(entry)
+            self._stats['recorded'] += 1
+            # enqueued while holding the journal lock so the journal is not truncated before it is written
+            self._enqueue(entry)
+
+    def flush(self, timeout=None):
+        """
+        Waits until all the recorded answers are written to the database.
+
+        Args:
+            timeout (float, optional): The maximum time to wait in seconds. Defaults to None (no limit).
+
+        Returns:
+            bool: True if all the answers were written, False if the timeout expired first.
+
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout=None):
+        """
+        Writes the remaining answers and stops the background writer.
+            Answers that could not be written stay in the journal and are replayed on the next start.
+
+        Args:
+            timeout (float, optional): The maximum time to wait for the writer in seconds.
+                Defaults to None (no limit).
+
+        """
+        if self._writer is None:
+            return
+        self._stop.set()
+        self._writer.join(timeout)
+        self._writer = None
+        with self._journal_lock:
+            self._journal.close()
+            self._journal = None
+        atexit.unregister(self.close)
+
+    @property
+    def queue_depth(self):
+        """ The number of answers that were recorded but not written yet."""
+        return self._pending
+
+    @property
+    def flush_lag(self):
+        """ How long (in seconds) the oldest unwritten answer has been waiting. 0 if there are none."""
+        oldest = self._oldest_pending
+        return 0.0 if oldest is None else time.monotonic() - oldest
+
+    def stats(self):
+        """
+        Gets the recorder statistics.
+
+        Returns:
+            dict: Counters since the recorder was created along with the current queue state.
+                Keys: [queue_depth, flush_lag, recorded, written, failed, batches, retries, replayed,
+                    last_batch_seconds]
+
+        """
+        stats = dict(self._stats)
+        stats['queue_depth'] = self.queue_depth
+        stats['flush_lag'] = self.flush_lag
+        return stats
+
+    def _enqueue(self, entry):
+        with self._cond:
+            if self._pending == 0:
+                self._oldest_pending = time.monotonic()
+            self._pending += 1
+        self._queue.put((entry, time.monotonic()))
+
+    def _run(self):
+        # the background writer loop. exits when stopped and the queue is empty,
+        # or when stopped and the database keeps failing.
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self._stop.is_set():
+                    return
+                continue
+            while not self._write(batch):
+                self._stats['retries'] += 1
+                if self._stop.wait(self.retry_interval):
+                    return  # shutting down with a failing database, the journal keeps the answers
+
+    def _next_batch(self):
+        # waits for the first answer and then takes up to batch_size answers from the queue.
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = 0 if self._stop.is_set() else deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        # writes a batch of answers. returns False if the database failed and the batch should be retried.
+        records = [(self.db.decode_id(e['question']), self.db.decode_id(e['user']), e['correct'])
+                   for e, _ in batch]
+        start = time.monotonic()
+        try:
+            result = self.db.update_correct_many(records)
+        except Exception:
+            logger.exception("Failed to write %d answers, retrying in %s seconds", len(batch), self.retry_interval)
+            return False
+        self._stats['last_batch_seconds'] = time.monotonic() - start
+        self._stats['batches'] += 1
+        self._stats['written'] += result.added
+        self._stats['failed'] += len(result.failures)
+        for index, reason in result.failures:
+            # invalid answers (e.g. the question was removed) can't be written so they are dropped
+            logger.warning("Dropped answer %s: %s", batch[index][0], reason)
+
+        with self._journal_lock:
+            self._append({'flushed': batch[-1][0]['seq']})
+            with self._cond:
+                self._pending -= len(batch)
+                if self._pending == 0:
+                    self._oldest_pending = None
+                    # all the journaled answers were written
+                    if self._journal is not None:
+                        self._journal.seek(0)
+                        self._journal.truncate()
+                else:
+                    self._oldest_pending = self._queue.queue[0][1] if self._queue.queue else time.monotonic()
+                self._cond.notify_all()
+        return True
+
+    def _append(self, entry):
+        # appends an entry to the journal. must be called while holding the journal lock.
+        if self._journal is None:
+            return  # closed while the writer was still running. the unmarked answers will be replayed.
+        self._journal.write(json.dumps(entry) + '\n')
+        self._journal.flush()
+        if self._fsync:
+            os.fsync(self._journal.fileno())
+
+    @staticmethod
+    def _lock(journal):
+        # locks the journal until it is closed, without waiting. raises OSError if another recorder holds it.
+        if fcntl is not None:
+            fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            journal.seek(0)
+            msvcrt.locking(journal.fileno(), msvcrt.LK_NBLCK, 1)  # the first byte, also of an empty file
+
+    @staticmethod
+    def _backend(db):
+        # the database wrapped by caching layers (see QuestionCache.db)
+        while 'db' in vars(db):
+            db = db.db
+        return db
+
+    def _read_journal(self, journal):
+        # returns the answers in the journal that were not written, in the order they were recorded.
+        entries = []
+        flushed = 0
+        journal.seek(0)
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # a partial line written while the process died
+            if 'flushed' in entry:
+                flushed = max(flushed, entry['flushed'])
+            else:
+                entries.append(entry)
+        pending = [e for e in entries if e['seq'] > flushed]
+        self._seq = max([e['seq'] for e in entries], default=0)
+        return pending
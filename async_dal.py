@@ -0,0 +1,280 @@
+import asyncio
+import functools
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dal import Difficulties, Types
+
+
+class AsyncDAL(ABC):
+    """ The asyncio counterpart of the DAL.
+    Every method of the DAL that accesses the database is a coroutine here, with the same arguments,
+        return values and exceptions (see the matching DAL method for the details).
+    This allows serving many players concurrently from a single event loop instead of a thread per player.
+
+    Attributes:
+        difficulties (list): A list of the possible difficulties defined by the Difficulties enum.
+        types (list): A list of the possible types defined by the Types enum.
+
+    """
+
+    def __init__(self):
+        self.difficulties = list(Difficulties.__members__.keys())
+        self.types = list(Types.__members__.keys())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """ See DAL.close."""
+        pass
+
+    @abstractmethod
+    async def add_question(self, category, q_type, difficulty, question, correct_answer, wrong_answers=None):
+        """ See DAL.add_question."""
+        pass
+
+    @abstractmethod
+    async def add_questions(self, questions):
+        """ See DAL.add_questions."""
+        pass
+
+    @abstractmethod
+    async def import_questions(self, amount=1, difficulty=None, category=None):
+        """ See DAL.import_questions."""
+        pass
+
+    @abstractmethod
+    async def add_category(self, name):
+        """ See DAL.add_category."""
+        pass
+
+    @abstractmethod
+    async def remove_category(self, name):
+        """ See DAL.remove_category."""
+        pass
+
+    @abstractmethod
+    async def hide_category(self, name):
+        """ See DAL.hide_category."""
+        pass
+
+    @abstractmethod
+    async def purge_categories(self, batch_size=None, max_batches=None, progress=None):
+        """ See DAL.purge_categories. progress is called in the thread that runs the purge."""
+        pass
+
+    @abstractmethod
+    async def get_categories(self):
+        """ See DAL.get_categories."""
+        pass
+
+    @abstractmethod
+    async def get_difficulties(self, category):
+        """ See DAL.get_difficulties."""
+        pass
+
+    @abstractmethod
+    async def get_questions(self, amount, category, difficulty, exclude_answered=False, user=None):
+        """ See DAL.get_questions."""
+        pass
+
+    @abstractmethod
+    async def get_all_questions(self, category, difficulty):
+        """ See DAL.get_all_questions."""
+        pass
+
+    @abstractmethod
+    async def get_answered(self, user, category, difficulty):
+        """ See DAL.get_answered."""
+        pass
+
+    @abstractmethod
+    async def add_user(self, name):
+        """ See DAL.add_user."""
+        pass
+
+    @abstractmethod
+    async def update_correct(self, question, user, correct):
+        """ See DAL.update_correct."""
+        pass
+
+    @abstractmethod
+    async def update_correct_many(self, records):
+        """ See DAL.update_correct_many."""
+        pass
+
+    @abstractmethod
+    async def get_results_by(self, by, order_by=None, ascending=True, limit=None):
+        """ See DAL.get_results_by."""
+        pass
+
+    @abstractmethod
+    async def get_leaderboard(self, limit=10, after=None):
+        """ See DAL.get_leaderboard."""
+        pass
+
+    @abstractmethod
+    async def get_user_rank(self, name):
+        """ See DAL.get_user_rank."""
+        pass
+
+    @abstractmethod
+    async def rebuild_stats(self):
+        """ See DAL.rebuild_stats."""
+        pass
+
+    @abstractmethod
+    async def export_watermark(self):
+        """ See DAL.export_watermark."""
+        pass
+
+    @abstractmethod
+    def export_rows(self, table, since=None, batch_size=10000):
+        """ See DAL.export_rows. An asynchronous generator of the batches (async for batch in ...)."""
+        pass
+
+    @abstractmethod
+    async def backfill_question_hashes(self, batch_size=1000):
+        """ See DAL.backfill_question_hashes."""
+        pass
+
+    @abstractmethod
+    async def get_opentdb_categories(self):
+        """ See DAL.get_opentdb_categories."""
+        pass
+
+    def encode_id(self, item_id):
+        """ See DAL.encode_id. This doesn't access the database so it is not a coroutine."""
+        return item_id
+
+    def decode_id(self, value):
+        """ See DAL.decode_id. This doesn't access the database so it is not a coroutine."""
+        return value
+
+
+class ExecutorAsyncDAL(AsyncDAL):
+    """
+    An AsyncDAL that runs the methods of a blocking DAL on a bounded thread pool.
+    The event loop never blocks on the database. The number of threads (and so of concurrent database calls)
+        is fixed, calls beyond it wait in the executor queue without holding a thread.
+    This is how drivers without native asyncio support (e.g. pyodbc, and pymongo under Motor) are used
+        from asyncio code. The wrapped DAL must be thread-safe, which all the implementations are.
+
+    Attributes:
+        db (DAL): The wrapped database.
+        max_workers (int): The maximum number of concurrent database calls.
+
+    """
+
+    def __init__(self, db, max_workers=10):
+        """
+        Args:
+            db (DAL): The database to wrap.
+            max_workers (int): See class attributes. Defaults to 10.
+        """
+        super().__init__()
+        self.db = db
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix=type(self).__name__)
+
+    async def close(self):
+        """ Closes the wrapped database and stops the threads once the running calls are done."""
+        try:
+            await self._run(self.db.close)
+        finally:
+            self._executor.shutdown(wait=False)
+
+    async def add_question(self, category, q_type, difficulty, question, correct_answer, wrong_answers=None):
+        return await self._run(self.db.add_question, category, q_type, difficulty, question,
+                               correct_answer, wrong_answers)
+
+    async def add_questions(self, questions):
+        return await self._run(self.db.add_questions, questions)
+
+    async def import_questions(self, amount=1, difficulty=None, category=None):
+        return await self._run(self.db.import_questions, amount, difficulty, category)
+
+    async def add_category(self, name):
+        return await self._run(self.db.add_category, name)
+
+    async def remove_category(self, name):
+        return await self._run(self.db.remove_category, name)
+
+    async def hide_category(self, name):
+        return await self._run(self.db.hide_category, name)
+
+    async def purge_categories(self, batch_size=None, max_batches=None, progress=None):
+        return await self._run(self.db.purge_categories, batch_size, max_batches, progress)
+
+    async def get_categories(self):
+        return await self._run(self.db.get_categories)
+
+    async def get_difficulties(self, category):
+        return await self._run(self.db.get_difficulties, category)
+
+    async def get_questions(self, amount, category, difficulty, exclude_answered=False, user=None):
+        return await self._run(self.db.get_questions, amount, category, difficulty, exclude_answered, user)
+
+    async def get_all_questions(self, category, difficulty):
+        return await self._run(self.db.get_all_questions, category, difficulty)
+
+    async def get_answered(self, user, category, difficulty):
+        return await self._run(self.db.get_answered, user, category, difficulty)
+
+    async def add_user(self, name):
+        return await self._run(self.db.add_user, name)
+
+    async def update_correct(self, question, user, correct):
+        return await self._run(self.db.update_correct, question, user, correct)
+
+    async def update_correct_many(self, records):
+        return await self._run(self.db.update_correct_many, records)
+
+    async def get_results_by(self, by, order_by=None, ascending=True, limit=None):
+        return await self._run(self.db.get_results_by, by, order_by, ascending, limit)
+
+    async def get_leaderboard(self, limit=10, after=None):
+        return await self._run(self.db.get_leaderboard, limit, after)
+
+    async def get_user_rank(self, name):
+        return await self._run(self.db.get_user_rank, name)
+
+    async def rebuild_stats(self):
+        return await self._run(self.db.rebuild_stats)
+
+    async def export_watermark(self):
+        return await self._run(self.db.export_watermark)
+
+    async def export_rows(self, table, since=None, batch_size=10000):
+        # the batches of the blocking generator are read on the executor one at a time.
+        # the generator keeps its cursor (and connection) until it is exhausted or the loop stops early.
+        batches = self.db.export_rows(table, since, batch_size)
+        end = object()
+        try:
+            while True:
+                batch = await self._run(next, batches, end)
+                if batch is end:
+                    return
+                yield batch
+        finally:
+            await self._run(batches.close)
+
+    async def backfill_question_hashes(self, batch_size=1000):
+        return await self._run(self.db.backfill_question_hashes, batch_size)
+
+    async def get_opentdb_categories(self):
+        return await self._run(self.db.get_opentdb_categories)
+
+    def encode_id(self, item_id):
+        return self.db.encode_id(item_id)
+
+    def decode_id(self, value):
+        return self.db.decode_id(value)
+
+    async def _run(self, func, *args):
+        # runs a blocking call on the executor and waits for its result without blocking the loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
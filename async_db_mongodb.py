@@ -0,0 +1,18 @@
+from async_dal import ExecutorAsyncDAL
+from db_mongodb import DbMongodb
+
+
+class AsyncDbMongodb(ExecutorAsyncDAL):
+    """
+    The asyncio implementation of the DAL using mongodb.
+    Like Motor, the pymongo calls of a DbMongodb run on a bounded thread pool, so the queries are the same
+        as in the blocking implementation. The client has a connection per thread.
+    """
+
+    def __init__(self, max_workers=50, **kwargs):
+        """
+        Args:
+            max_workers (int): The maximum number of concurrent queries (and open connections). Defaults to 50.
+            **kwargs: Other arguments of DbMongodb (e.g. host, port, records_storage).
+        """
+        super().__init__(DbMongodb(max_pool_size=max_workers, **kwargs), max_workers)
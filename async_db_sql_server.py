@@ -0,0 +1,21 @@
+from async_dal import ExecutorAsyncDAL
+from db_sql_server import DbSqlServer
+
+
+class AsyncDbSqlServer(ExecutorAsyncDAL):
+    """
+    The asyncio implementation of the DAL using sql server.
+    pyodbc has no asyncio support, so the calls of a DbSqlServer run on a bounded thread pool.
+    The connection pool has a connection per thread so a call never waits for a connection.
+    """
+
+    def __init__(self, max_workers=10, max_idle=5, max_idle_time=300, pool_timeout=30):
+        """
+        Args:
+            max_workers (int): The maximum number of concurrent queries (and open connections). Defaults to 10.
+            max_idle (int): See DbSqlServer. Defaults to 5.
+            max_idle_time (float): See DbSqlServer. Defaults to 300.
+            pool_timeout (float): See DbSqlServer. Defaults to 30.
+        """
+        super().__init__(DbSqlServer(pool_size=max_workers, max_idle=max_idle, max_idle_time=max_idle_time,
+                                     pool_timeout=pool_timeout), max_workers)
@@ -0,0 +1,28 @@
+"""
+Stores the normalized content hash (see DAL.question_hash) of the questions that were added before
+    the hash was stored, so they are found by the duplicate checks of new questions.
+
+A question whose hash belongs to another question is a near-duplicate of it (e.g. the same text with
+    HTML entities or a different case). It is left without a hash and listed, but not removed,
+    since it may have answer records. The backfill can be stopped and run again at any time.
+
+Usage: python backfill_question_hashes.py [--db sqlite] [--batch-size 1000]
+"""
+import argparse
+import time
+from mode import Mode
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store the content hash of the questions that have none.")
+    parser.add_argument("--db", default='mongodb', choices=list(Mode.possible_dbs))
+    parser.add_argument("--batch-size", type=int, default=1000, help="questions per batch (default: 1000)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with Mode.possible_dbs[args.db]() as trivia_db:
+        hashed, duplicates = trivia_db.backfill_question_hashes(args.batch_size)
+        print(f"Hashed {hashed} questions in {time.perf_counter() - start:.1f} seconds.")
+        if duplicates:
+            print(f"{len(duplicates)} near-duplicate questions were left without a hash:")
+            for q_id in duplicates:
+                print(trivia_db.encode_id(q_id))
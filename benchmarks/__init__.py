@@ -0,0 +1,4 @@
+"""
+Benchmarks for the trivia data access layers.
+Run the modules from the project root, e.g. python -m benchmarks.get_questions_round_trips
+"""
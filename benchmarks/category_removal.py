@@ -0,0 +1,137 @@
+"""
+Measures the latency of a running game while a large category is removed: a thread keeps drawing questions
+    of another category and writing answers to them, while the category is deleted either in a single batch
+    (as remove_category did before the deletion was split into batches) or in bounded batches in the background
+    by CategoryRemover. Reports the latency percentiles of the game calls during each removal, and how long
+    each removal took, as JSON.
+
+The removed category has questions in every difficulty, all answered by a set of users, so the removal also
+    updates the counters of every user. The backends are created as in benchmarks.dal_methods.
+
+Usage: python -m benchmarks.category_removal [--backends sqlite columnar ...] [--questions 50000] [--users 20]
+                                             [--batch-size 1000] [--output results.json]
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+from category_remover import CategoryRemover
+from benchmarks.dal_methods import BACKENDS, DEFAULT_BACKENDS, LOAD_CHUNK_SIZE
+
+REMOVED = "Removed"
+PLAYED = "Played"
+DIFFICULTIES = ['easy', 'medium', 'hard']
+AMOUNT = 10
+
+
+def _questions(category, n):
+    # n boolean questions spread over the difficulties
+    return [{
+        'category': category,
+        'type': 'boolean',
+        'difficulty': DIFFICULTIES[i % len(DIFFICULTIES)],
+        'question': f"{category} {i} benchmark question?",
+        'correct_answer': 'True'
+    } for i in range(n)]
+
+
+def _load(db, questions, users):
+    # adds the removed category, answered by all the users, and the played category
+    for category, n in [(REMOVED, questions), (PLAYED, 1000)]:
+        batch = _questions(category, n)
+        for i in range(0, len(batch), LOAD_CHUNK_SIZE):
+            db.add_questions(batch[i:i + LOAD_CHUNK_SIZE])
+    ids = [q['id'] for d in DIFFICULTIES for q in db.get_all_questions(REMOVED, d)]
+    for u in range(users):
+        user = db.add_user(f"removal_user_{u}")
+        for i in range(0, len(ids), LOAD_CHUNK_SIZE):
+            db.update_correct_many([(q_id, user, (q_id + u) % 2) for q_id in ids[i:i + LOAD_CHUNK_SIZE]])
+
+
+def _play(db, stop, times):
+    # a game loop: draws questions of the played category and answers them, until stopped
+    user = db.add_user("removal_player")
+    while not stop.is_set():
+        start = time.perf_counter()
+        questions = db.get_questions(AMOUNT, PLAYED, 'easy')
+        db.update_correct_many([(q['id'], user, 1) for q in questions])
+        times.append(time.perf_counter() - start)
+
+
+def _during(db, remove):
+    # runs the removal while a game is played, returns the removal time and the game latency percentiles
+    stop = threading.Event()
+    times = []
+    game = threading.Thread(target=_play, args=(db, stop, times))
+    game.start()
+    time.sleep(0.2)  # the game is running before the removal starts
+    start = time.perf_counter()
+    remove()
+    seconds = time.perf_counter() - start
+    stop.set()
+    game.join()
+    p50, p99, top = np.percentile(np.array(times) * 1000, [50, 99, 100])
+    return {'removal_seconds': seconds, 'game_calls': len(times), 'p50_ms': p50, 'p99_ms': p99, 'max_ms': top}
+
+
+def run(backends=None, questions=50000, users=20, batch_size=1000):
+    """
+    Measures a game during the removal of a category in a single batch and in bounded batches.
+
+    Args:
+        backends (list, optional): Names from benchmarks.dal_methods.BACKENDS. Defaults to sqlite and columnar.
+        questions (int): The number of questions of the removed category. Defaults to 50000.
+        users (int): The number of users that answered all of them. Defaults to 20.
+        batch_size (int): The questions per batch of the background removal. Defaults to 1000.
+
+    Returns:
+        dict: The results by backend: {description, single_batch, background} where each has the removal
+            time, the number of game calls during the removal and their p50, p99 and max latencies.
+
+    """
+    results = {}
+    for name in backends or DEFAULT_BACKENDS:
+        results[name] = {}
+        for mode in ['single_batch', 'background']:
+            workdir = tempfile.mkdtemp(prefix="trivia_removal_")
+            try:
+                db, description = BACKENDS[name](workdir)
+                with db:
+                    results[name]['description'] = description
+                    _load(db, questions, users)
+                    db.get_questions(AMOUNT, PLAYED, 'easy')  # warm up
+                    if mode == 'single_batch':
+                        results[name][mode] = _during(
+                            db, lambda: db.hide_category(REMOVED) and db.purge_categories(batch_size=questions))
+                    else:
+                        remover = CategoryRemover(db, batch_size=batch_size)
+                        remover.start()
+                        try:
+                            results[name][mode] = _during(db, lambda: remover.remove(REMOVED) and remover.wait())
+                        finally:
+                            remover.close()
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure a running game during the removal of a category.")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=DEFAULT_BACKENDS)
+    parser.add_argument("--questions", type=int, default=50000,
+                        help="questions of the removed category (default: 50000)")
+    parser.add_argument("--users", type=int, default=20, help="users that answered all of them (default: 20)")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="questions per batch of the background removal (default: 1000)")
+    parser.add_argument("--output", help="a file to write the results to")
+    args = parser.parse_args()
+
+    report = run(args.backends, args.questions, args.users, args.batch_size)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,425 @@
+"""
+Measures every DAL method against each available backend on a seeded synthetic dataset
+    (see benchmarks.synthetic) and reports the latency percentiles, throughput and peak memory as JSON.
+
+The backends:
+    sqlite and columnar - always available, run by default.
+    mongodb - a trivia_benchmark database on the local server (dropped at the start of the run),
+        or a mongomock stand-in if no server is reachable. mongomock scans the collections on every query,
+        so its latencies only show the relative cost of the methods and it is slow at large scales.
+        mongomock has no $bit, so the stand-in sets the answered questions bits with a read and a write.
+    sql_server - a TriviaBenchmark database on the configured server, created from SQL_DB_creation.sql
+        at the start of the run and dropped at its end. The Trivia database is never written to.
+    The server backends run only when requested with --backends.
+The opentdb api is replaced by the synthetic questions, so import_questions measures the database side only.
+
+A method that fails (e.g. an operation the backend doesn't support) is reported as skipped with the error,
+    and the other methods are still measured.
+
+Runs with the same seed and scale use the same data and calls, so their results can be compared
+    with --compare to catch regressions.
+
+Usage: python -m benchmarks.dal_methods [--scale 10k] [--seed 0] [--backends sqlite columnar ...]
+                                        [--output results.json] [--compare baseline.json] [--threshold 0.2]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from dal import DAL, AnsweredSeqs
+from benchmarks.synthetic import SyntheticData, SCALES
+
+DEFAULT_BACKENDS = ['columnar', 'sqlite']
+# the database of the sql_server backend, created and dropped by every run
+SQL_SERVER_DB = 'TriviaBenchmark'
+# the number of timed calls of each method
+ITERATIONS = {
+    'get_categories': 200,
+    'get_difficulties': 200,
+    'get_questions': 200,
+    'get_all_questions': 50,
+    'add_user': 200,
+    'add_question': 100,
+    'add_questions': 20,
+    'import_questions': 20,
+    'update_correct': 200,
+    'update_correct_many': 50,
+    'get_results_by': 20,
+    'rebuild_stats': 3,
+    'export_rows': 3,
+    'remove_category': 4
+}
+LOAD_CHUNK_SIZE = 1000
+BATCH_SIZE = 50  # questions per add_questions/import_questions call and records per update_correct_many call
+
+
+class _OfflineOpenTdb(DAL):
+    # placed between a backend and the DAL in the mro (see _offline), so the backend's import_questions
+    # gets the questions from the queue instead of from the opentdb api.
+    offline_questions = []
+
+    def _import_questions_from_opentdb(self, amount=1, difficulty=None, category=None):
+        questions = self.offline_questions[:amount]
+        del self.offline_questions[:amount]
+        return questions
+
+
+def _offline(cls):
+    return type(cls.__name__, (cls, _OfflineOpenTdb), {'offline_questions': []})
+
+
+# the backend factories return the database and a description of what it runs on
+
+def _columnar(workdir):
+    from db_columnar import DbColumnar
+    return _offline(DbColumnar)(), "in-memory columns"
+
+
+def _sqlite(workdir):
+    from db_sqlite import DbSqlite
+    return _offline(DbSqlite)(os.path.join(workdir, 'benchmark.db')), "a temporary sqlite file"
+
+
+def _mongodb(workdir):
+    from db_mongodb import DbMongodb
+    from pymongo.errors import PyMongoError
+    cls = type('DbMongodb', (_offline(DbMongodb),), {'DB_NAME': 'trivia_benchmark'})
+    db = cls(server_selection_timeout_ms=1000, records_storage=DbMongodb.RECORDS_COLLECTION)
+    try:
+        db.database.client.drop_database(cls.DB_NAME)
+        db.close()
+        return db, "the local mongodb server"
+    except PyMongoError:
+        db.close()
+    try:
+        import mongomock
+    except ImportError:
+        raise RuntimeError("No mongodb server is reachable and mongomock is not installed.")
+    from bson import Int64
+
+    class MockDbMongodb(cls):
+        # the same queries over an in-memory mongomock client
+        @property
+        def database(self):
+            if self._database is None:
+                self._client = mongomock.MongoClient()
+                self._database = self._client.get_database(self.DB_NAME)
+                self._create_indexes(self._database)
+            return self._database
+
+        def _set_answered(self, answered, session=None):
+            # the bitwise OR of $bit, as a read and a write of every bitmap (the benchmark runs on one thread)
+            for (user, category, difficulty), seqs in answered.items():
+                query = {"user_id": user, "category": category, "difficulty": difficulty}
+                doc = self.database.answered.find_one(query, {"words": 1})
+                words = AnsweredSeqs(doc["words"] if doc else None)
+                for word, bits in seqs.words.items():
+                    words.merge(word, bits)
+                self.database.answered.update_one(
+                    query, {"$set": {"words": {str(word): Int64(bits) for word, bits in words.words.items()}}},
+                    upsert=True)
+
+    return MockDbMongodb(records_storage=DbMongodb.RECORDS_COLLECTION), "mongomock (no server reachable)"
+
+
+def _sql_server(workdir):
+    import pyodbc
+    from db_sql_server import DbSqlServer
+    conn_str = DbSqlServer._conn_str.replace(f"Database={DbSqlServer.DB_NAME};", f"Database={SQL_SERVER_DB};")
+    master = DbSqlServer._conn_str.replace(f"Database={DbSqlServer.DB_NAME};", "Database=master;")
+
+    def execute(conn_str, *statements):
+        conn = pyodbc.connect(conn_str, autocommit=True)
+        try:
+            for sql in statements:
+                conn.execute(sql)
+        finally:
+            conn.close()
+
+    def drop():
+        execute(master, f"IF DB_ID('{SQL_SERVER_DB}') IS NOT NULL "
+                        f"ALTER DATABASE {SQL_SERVER_DB} SET SINGLE_USER WITH ROLLBACK IMMEDIATE",
+                f"DROP DATABASE IF EXISTS {SQL_SERVER_DB}")
+
+    class BenchmarkDbSqlServer(_offline(DbSqlServer)):
+        # the same queries on a database of the benchmark, dropped when it is closed
+        DB_NAME = SQL_SERVER_DB
+        _conn_str = conn_str
+
+        def close(self):
+            super().close()
+            drop()
+
+    drop()  # left by a run that was killed
+    execute(master, f"CREATE DATABASE {SQL_SERVER_DB}")
+    try:
+        execute(conn_str, *_sql_server_schema())
+    except Exception:
+        drop()
+        raise
+    return BenchmarkDbSqlServer(), f"a {SQL_SERVER_DB} database on the configured sql server"
+
+
+def _sql_server_schema():
+    # the batches of SQL_DB_creation.sql without the ones that create and select the Trivia database
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SQL_DB_creation.sql')
+    with open(path) as f:
+        batches = re.split(r'^\s*GO\s*$', f.read(), flags=re.MULTILINE | re.IGNORECASE)
+    return [batch for batch in batches
+            if batch.strip() and not re.match(r'\s*(USE|CREATE\s+DATABASE)\b', batch, re.IGNORECASE)]
+
+
+BACKENDS = {
+    'columnar': _columnar,
+    'sqlite': _sqlite,
+    'mongodb': _mongodb,
+    'sql_server': _sql_server
+}
+
+
+def load(db, data):
+    """
+    Loads the dataset into the database with the batch methods.
+
+    Returns:
+        tuple: The ids of the questions and of the users (in the order of data.questions and data.users),
+            and a dictionary with the load measurements.
+
+    """
+    start = time.perf_counter()
+    for i in range(0, len(data.questions), LOAD_CHUNK_SIZE):
+        db.add_questions(data.questions[i:i + LOAD_CHUNK_SIZE])
+    user_ids = [db.add_user(name) for name in data.users]
+    ids = {}
+    for category, difficulty in data.buckets():
+        ids.update((q['question'], q['id']) for q in db.get_all_questions(category, difficulty))
+    question_ids = [ids[q['question']] for q in data.questions]
+    questions_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    records = [(question_ids[q], user_ids[u], c) for q, u, c in data.records.tolist()]
+    for i in range(0, len(records), LOAD_CHUNK_SIZE):
+        db.update_correct_many(records[i:i + LOAD_CHUNK_SIZE])
+    records_seconds = time.perf_counter() - start
+    return question_ids, user_ids, {
+        'questions': len(data.questions),
+        'users': len(data.users),
+        'records': len(records),
+        'questions_seconds': questions_seconds,
+        'records_seconds': records_seconds,
+        'records_per_second': len(records) / records_seconds if records_seconds else None
+    }
+
+
+def _calls(db, data, question_ids, user_ids, seed):
+    # yields (method name, make_call) in the order they are measured.
+    # make_call(i) returns the call of iteration i, so preparing the arguments is not measured.
+    rng = random.Random(seed)
+    buckets = data.buckets()
+    new_question = [0]
+
+    def new_questions(n):
+        # unique questions that are not in the dataset
+        out = []
+        for _ in range(n):
+            new_question[0] += 1
+            bucket = rng.choice(buckets)
+            out.append({'category': bucket[0], 'type': 'boolean', 'difficulty': bucket[1],
+                        'question': f"Benchmark question {new_question[0]}?", 'correct_answer': 'True',
+                        'incorrect_answers': ['False']})
+        return out
+
+    def record():
+        return rng.choice(question_ids), rng.choice(user_ids), rng.randint(0, 1)
+
+    def import_call(i):
+        db.offline_questions[:] = new_questions(BATCH_SIZE)
+        return lambda: db.import_questions(BATCH_SIZE)
+
+    def add_question_call(i):
+        q = new_questions(1)[0]
+        return lambda: db.add_question(q['category'], q['type'], q['difficulty'], q['question'],
+                                       q['correct_answer'])
+
+    results_by = [('category', None, True, None), ('difficulty', None, True, None),
+                  ('user', None, True, None), ('user', 'Correct', False, 3)]
+    removed = list(reversed(data.categories))
+
+    yield 'get_categories', lambda i: db.get_categories
+    yield 'get_difficulties', lambda i: (lambda c=rng.choice(data.categories): db.get_difficulties(c))
+    yield 'get_questions', lambda i: (lambda b=rng.choice(buckets): db.get_questions(10, *b))
+    yield 'get_all_questions', lambda i: (lambda b=rng.choice(buckets): db.get_all_questions(*b))
+    yield 'add_user', lambda i: (lambda u=rng.choice(data.users + [f"new{i}"]): db.add_user(u))
+    yield 'add_question', add_question_call
+    yield 'add_questions', lambda i: (lambda qs=new_questions(BATCH_SIZE): db.add_questions(qs))
+    yield 'import_questions', import_call
+    yield 'update_correct', lambda i: (lambda r=record(): db.update_correct(*r))
+    yield 'update_correct_many', lambda i: (lambda rs=[record() for _ in range(BATCH_SIZE)]:
+                                            db.update_correct_many(rs))
+    yield 'get_results_by', lambda i: (lambda args=results_by[i % len(results_by)]: db.get_results_by(*args))
+    yield 'rebuild_stats', lambda i: db.rebuild_stats
+    # a full export of the answer records, read to the end
+    yield 'export_rows', lambda i: lambda: sum(len(rows) for rows in db.export_rows('records'))
+    # last, since it removes part of the dataset
+    yield 'remove_category', lambda i: (lambda c=removed.pop(): db.remove_category(c))
+
+
+def measure(make_call, iterations):
+    """
+    Measures a method. The first call is traced with tracemalloc for the peak memory and is not timed.
+
+    Returns:
+        dict: The measurements with the keys [calls, p50_ms, p95_ms, p99_ms, mean_ms, ops_per_second, peak_bytes]
+
+    """
+    call = make_call(0)
+    tracemalloc.start()
+    call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies = []
+    for i in range(1, iterations + 1):
+        call = make_call(i)
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'calls': iterations,
+        'p50_ms': p50,
+        'p95_ms': p95,
+        'p99_ms': p99,
+        'mean_ms': latencies.mean(),
+        'ops_per_second': 1000 * iterations / latencies.sum(),
+        'peak_bytes': peak
+    }
+
+
+def run_backend(name, data, seed, iterations=None):
+    """
+    Loads the dataset into a new database of the given backend and measures every method.
+
+    Returns:
+        dict: {'target': what the backend ran on, 'load': load measurements, 'methods': {method: measurements}}
+            or {'skipped': reason} if the backend is not available or the dataset failed to load.
+            A method that failed has {'skipped': reason} instead of its measurements.
+
+    """
+    iterations = {**ITERATIONS, **(iterations or {})}
+    workdir = tempfile.mkdtemp(prefix='trivia_benchmark_')
+    try:
+        try:
+            db, target = BACKENDS[name](workdir)
+        except Exception as e:  # a missing driver or server
+            return {'skipped': f"{type(e).__name__}: {e}"}
+        with db:
+            try:
+                question_ids, user_ids, load_stats = load(db, data)
+            except Exception as e:
+                return {'target': target, 'skipped': f"load failed: {type(e).__name__}: {e}"}
+            methods = {}
+            for method, make_call in _calls(db, data, question_ids, user_ids, seed):
+                try:
+                    methods[method] = measure(make_call, iterations[method])
+                except Exception as e:  # e.g. an operation the backend doesn't support
+                    tracemalloc.stop()
+                    methods[method] = {'skipped': f"{type(e).__name__}: {e}"}
+        return {'target': target, 'load': load_stats, 'methods': methods}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(scale='10k', seed=0, backends=None, iterations=None):
+    """
+    Runs the benchmark of every backend on the dataset of the given scale.
+
+    Args:
+        scale (str): One of benchmarks.synthetic.SCALES or a number of records. Defaults to 10k.
+        seed (int): The seed of the dataset and of the calls. Defaults to 0.
+        backends (list, optional): The backends to run. Defaults to DEFAULT_BACKENDS.
+        iterations (dict, optional): Overrides of ITERATIONS.
+
+    Returns:
+        dict: {'meta': run parameters and environment, 'backends': {backend: see run_backend}}
+
+    """
+    data = SyntheticData.from_scale(scale, seed)
+    results = {
+        'meta': {
+            'scale': scale,
+            'seed': seed,
+            'records': len(data.records),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform()
+        },
+        'backends': {}
+    }
+    for name in backends or DEFAULT_BACKENDS:
+        results['backends'][name] = run_backend(name, data, seed, iterations)
+    # the peak resident memory of the whole run, including the dataset
+    results['meta']['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return results
+
+
+def compare(baseline, current, threshold=0.2, metrics=('p50_ms', 'p95_ms')):
+    """
+    Compares two runs of the benchmark.
+
+    Args:
+        baseline (dict): The results of the former run.
+        current (dict): The results of the new run.
+        threshold (float): The relative slowdown reported as a regression. Defaults to 0.2 (20%).
+        metrics (tuple): The latency metrics to compare.
+
+    Returns:
+        list: A (backend, method, metric, baseline value, current value) tuple for every regression.
+
+    """
+    if (baseline['meta']['scale'], baseline['meta']['seed']) != (current['meta']['scale'], current['meta']['seed']):
+        raise ValueError("The runs have different scales or seeds and cannot be compared.")
+    regressions = []
+    for backend, result in current['backends'].items():
+        old_methods = baseline['backends'].get(backend, {}).get('methods', {})
+        for method, stats in result.get('methods', {}).items():
+            for metric in metrics:
+                old = old_methods.get(method, {}).get(metric)
+                if old and metric in stats and stats[metric] > old * (1 + threshold):
+                    regressions.append((backend, method, metric, old, stats[metric]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the DAL methods of the trivia backends.")
+    parser.add_argument("--scale", default='10k', help=f"one of {list(SCALES)} or a number of records")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backends", nargs='+', choices=list(BACKENDS), default=DEFAULT_BACKENDS)
+    parser.add_argument("--output", help="write the results to this file instead of the standard output")
+    parser.add_argument("--compare", help="a former results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="the relative slowdown of a regression")
+    args = parser.parse_args()
+
+    results = run(args.scale, args.seed, args.backends)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for backend, method, metric, old, new in regressions:
+            print(f"REGRESSION {backend}.{method} {metric}: {old:.3f} -> {new:.3f}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
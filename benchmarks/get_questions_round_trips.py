@@ -0,0 +1,98 @@
+"""
+Measures the number of round trips DbSqlServer.get_questions makes to the server as the amount
+of requested questions grows. The count should stay the same for every amount.
+
+Requires a reachable sql-server instance with the Trivia database.
+Usage: python -m benchmarks.get_questions_round_trips [category] [difficulty]
+"""
+import json
+import sys
+import time
+from db_sql_server import DbSqlServer
+
+AMOUNTS = [1, 5, 10, 25, 50, 100, 500]
+
+
+class _CountingCursor:
+    # wraps a pyodbc cursor and counts the statements sent to the server.
+
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def execute(self, *args, **kwargs):
+        self._counter['round_trips'] += 1
+        self._cursor.execute(*args, **kwargs)
+        return self
+
+    def executemany(self, *args, **kwargs):
+        self._counter['round_trips'] += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, item):
+        return getattr(self._cursor, item)
+
+
+class _CountingConnection:
+    # wraps a pyodbc connection so that all its cursors count their statements.
+
+    def __init__(self, conn, counter):
+        self._conn = conn
+        self._counter = counter
+
+    def cursor(self):
+        return _CountingCursor(self._conn.cursor(), self._counter)
+
+    def __getattr__(self, item):
+        return getattr(self._conn, item)
+
+
+class CountingDbSqlServer(DbSqlServer):
+    """ A DbSqlServer that counts the statements executed on its pooled connections."""
+
+    def __init__(self, **kwargs):
+        self.counter = {'round_trips': 0}
+        super().__init__(**kwargs)
+
+    def _connect(self):
+        return _CountingConnection(super()._connect(), self.counter)
+
+
+def run(category=None, difficulty='easy'):
+    """
+    Calls get_questions with increasing amounts and records the round trips of every call.
+
+    Args:
+        category (str, optional): The category to draw from. Defaults to the first category in the database.
+        difficulty (str): The difficulty to draw from. Defaults to easy.
+
+    Returns:
+        list: A list of dictionaries with the keys [amount, returned, round_trips, seconds].
+
+    """
+    results = []
+    with CountingDbSqlServer(pool_size=1) as db:
+        category = category or db.get_categories()[0]
+        db.get_questions(1, category, difficulty)  # warm up the pool so connecting is not measured
+        for amount in AMOUNTS:
+            db.counter['round_trips'] = 0
+            start = time.perf_counter()
+            questions = db.get_questions(amount, category, difficulty)
+            results.append({
+                'amount': amount,
+                'returned': len(questions),
+                'round_trips': db.counter['round_trips'],
+                'seconds': time.perf_counter() - start
+            })
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(*sys.argv[1:3]), indent=2))
@@ -0,0 +1,119 @@
+"""
+Measures the leaderboard reads as the number of users grows: the top users (get_leaderboard), a page deep in
+    the leaderboard (after a cursor from the middle), the rank of a single user (get_user_rank), and the top
+    users as they were read before the leaderboard (get_results_by ordered by the correct answers, which sorts
+    the counters of all the users). Reports the latency percentiles as JSON.
+
+Every user answers a few random questions, so many users share the same number of correct answers.
+    The backends are created as in benchmarks.dal_methods.
+
+Usage: python -m benchmarks.leaderboard [--backends sqlite columnar ...] [--users 10000 100000]
+                                        [--answers 10] [--limit 10] [--iterations 200] [--output results.json]
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+import numpy as np
+from benchmarks.dal_methods import BACKENDS, DEFAULT_BACKENDS, LOAD_CHUNK_SIZE
+
+CATEGORY = "Leaderboard"
+QUESTIONS = 1000
+
+
+def _measure(call, iterations):
+    # returns the latency percentiles (in milliseconds) of the calls
+    times = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        call(i)
+        times.append(time.perf_counter() - start)
+    p50, p95 = np.percentile(np.array(times) * 1000, [50, 95])
+    return {'p50_ms': p50, 'p95_ms': p95}
+
+
+def _load(db, ids, first, last, answers, rng):
+    # adds the users numbered first..last-1, each answering the given number of random questions
+    records = []
+    for u in range(first, last):
+        user = db.add_user(f"leaderboard_user_{u}")
+        records += [(q_id, user, rng.randint(0, 1)) for q_id in rng.sample(ids, answers)]
+        if len(records) >= LOAD_CHUNK_SIZE:
+            db.update_correct_many(records)
+            records = []
+    if records:
+        db.update_correct_many(records)
+
+
+def run(backends=None, users=(10000, 100000), answers=10, limit=10, iterations=200, seed=0):
+    """
+    Measures the leaderboard reads at every number of users.
+
+    Args:
+        backends (list, optional): Names from benchmarks.dal_methods.BACKENDS. Defaults to sqlite and columnar.
+        users (list): The numbers of users to measure at, in ascending order. Defaults to (10000, 100000).
+        answers (int): The number of questions answered by every user. Defaults to 10.
+        limit (int): The number of users per page. Defaults to 10.
+        iterations (int): The number of timed calls of each measurement. Defaults to 200.
+        seed (int): The seed of the answers. Defaults to 0.
+
+    Returns:
+        dict: The results by backend: {description, users: {number: {top, deep_page, rank, results_by}}}
+            with the p50 and p95 latencies of each.
+
+    """
+    results = {}
+    for name in backends or DEFAULT_BACKENDS:
+        rng = random.Random(seed)
+        workdir = tempfile.mkdtemp(prefix="trivia_leaderboard_")
+        try:
+            db, description = BACKENDS[name](workdir)
+            with db:
+                results[name] = {'description': description, 'users': {}}
+                db.add_questions([{
+                    'category': CATEGORY,
+                    'type': 'boolean',
+                    'difficulty': 'easy',
+                    'question': f"{CATEGORY} {i} benchmark question?",
+                    'correct_answer': 'True'
+                } for i in range(QUESTIONS)])
+                ids = [q['id'] for q in db.get_all_questions(CATEGORY, 'easy')]
+                loaded = 0
+                for size in users:
+                    _load(db, ids, loaded, size, answers, rng)
+                    loaded = size
+                    _, middle = db.get_leaderboard(size // 2)
+                    names = [f"leaderboard_user_{rng.randrange(size)}" for _ in range(iterations)]
+                    results[name]['users'][size] = {
+                        'top': _measure(lambda i: db.get_leaderboard(limit), iterations),
+                        'deep_page': _measure(lambda i: db.get_leaderboard(limit, after=middle), iterations),
+                        'rank': _measure(lambda i: db.get_user_rank(names[i]), iterations),
+                        'results_by': _measure(
+                            lambda i: db.get_results_by('user', limit=limit, order_by='Correct', ascending=False),
+                            iterations)
+                    }
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the leaderboard reads by number of users.")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=DEFAULT_BACKENDS)
+    parser.add_argument("--users", nargs="+", type=int, default=[10000, 100000],
+                        help="numbers of users to measure at (default: 10000 100000)")
+    parser.add_argument("--answers", type=int, default=10, help="questions answered per user (default: 10)")
+    parser.add_argument("--limit", type=int, default=10, help="users per page (default: 10)")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per measurement (default: 200)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="a file to write the results to")
+    args = parser.parse_args()
+
+    report = run(args.backends, sorted(args.users), args.answers, args.limit, args.iterations, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
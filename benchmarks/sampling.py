@@ -0,0 +1,180 @@
+"""
+Compares get_questions (a sample by the sequence numbers of the bucket) with the former random sampling
+    queries of each backend, on a single bucket of 10k, 100k and 1M questions, and checks that the samples
+    are uniform. Reports the latency percentiles of both as JSON.
+
+The former queries:
+    sqlite - ORDER BY random() LIMIT amount.
+    columnar - np.random.choice without replacement over a mask of the question columns.
+    mongodb - $match on (category, difficulty) followed by $sample.
+    sql_server - TOP (amount) ... ORDER BY NEWID().
+The backends are created as in benchmarks.dal_methods (mongodb falls back to mongomock, which is slow
+    at large sizes).
+
+The uniformity check draws many samples from a small bucket and reports the chi-square statistic of the
+    counts of the questions divided by its degrees of freedom, which is close to 1 for a uniform sample.
+
+Usage: python -m benchmarks.sampling [--sizes 10k 100k 1M] [--backends sqlite columnar ...] [--amount 10]
+                                     [--iterations 200] [--output results.json]
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from collections import Counter
+import numpy as np
+from dal import Difficulties
+from benchmarks.dal_methods import BACKENDS, DEFAULT_BACKENDS, LOAD_CHUNK_SIZE
+
+SIZES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1M': 1_000_000
+}
+CATEGORY = "Sampling"
+DIFFICULTY = 'easy'
+UNIFORMITY_BUCKET = 100
+UNIFORMITY_DRAWS = 2000
+
+
+def _questions(n, prefix="Q"):
+    # n boolean questions in a single bucket
+    return [{
+        'category': CATEGORY,
+        'type': 'boolean',
+        'difficulty': DIFFICULTY,
+        'question': f"{prefix}{i} sampling benchmark question?",
+        'correct_answer': 'True'
+    } for i in range(n)]
+
+
+def _former_query(name, db):
+    # returns a function that samples amount questions with the former query of the backend
+    if name == 'sqlite':
+        sql = """
+            SELECT q.QuestionID
+            FROM Questions q JOIN Categories c
+            ON q.CategoryID = c.CategoryID
+            WHERE c.CategoryName = ? AND q.Difficulty = ?
+            ORDER BY random()
+            LIMIT ?
+        """
+        return lambda amount: db._connection().execute(
+            sql, (CATEGORY, Difficulties[DIFFICULTY].value, amount)).fetchall()
+    if name == 'columnar':
+        def former(amount):
+            with db._lock:
+                code = db._category_codes[CATEGORY]
+                mask = (db._q_alive.values & (db._q_category.values == code)
+                        & (db._q_difficulty.values == Difficulties[DIFFICULTY].value))
+                ids = np.flatnonzero(mask)
+                return np.random.choice(ids, min(amount, len(ids)), replace=False)
+        return former
+    if name == 'mongodb':
+        return lambda amount: list(db.database.questions.aggregate([
+            {"$match": {"category": CATEGORY, "difficulty": DIFFICULTY}},
+            {"$sample": {"size": amount}},
+            {"$project": {"_id": 1}}
+        ]))
+    if name == 'sql_server':
+        sql = """
+            SELECT TOP (?) q.QuestionID
+            FROM Questions q JOIN Categories c
+            ON q.CategoryID = c.CategoryID
+            WHERE c.CategoryName = ? AND q.Difficulty = ?
+            ORDER BY NEWID()
+        """
+
+        def former(amount):
+            with db._pool.connection() as conn, conn.cursor() as cursor:
+                return cursor.execute(sql, amount, CATEGORY, Difficulties[DIFFICULTY].value).fetchall()
+        return former
+    raise ValueError(f"Unknown backend {name}.")
+
+
+def _measure(call, iterations):
+    # returns the latency percentiles (in milliseconds) of the calls
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+    p50, p95 = np.percentile(np.array(times) * 1000, [50, 95])
+    return {'p50_ms': p50, 'p95_ms': p95}
+
+
+def _uniformity(db, amount):
+    # chi-square of the question counts over many samples of a small bucket, divided by the degrees of freedom
+    category = f"{CATEGORY} uniformity"
+    db.add_questions([dict(q, category=category) for q in _questions(UNIFORMITY_BUCKET, "U")])
+    counts = Counter()
+    for _ in range(UNIFORMITY_DRAWS):
+        counts.update(q['question'] for q in db.get_questions(amount, category, DIFFICULTY))
+    expected = UNIFORMITY_DRAWS * amount / UNIFORMITY_BUCKET
+    observed = np.array([counts[q['question']] for q in _questions(UNIFORMITY_BUCKET, "U")])
+    return float(((observed - expected) ** 2 / expected).sum() / (UNIFORMITY_BUCKET - 1))
+
+
+def run(backends=None, sizes=None, amount=10, iterations=200):
+    """
+    Measures get_questions and the former query of every backend on buckets of the given sizes.
+
+    Args:
+        backends (list, optional): Names from benchmarks.dal_methods.BACKENDS. Defaults to sqlite and columnar.
+        sizes (list, optional): Names from SIZES. Defaults to all of them.
+        amount (int): The number of questions per sample. Defaults to 10.
+        iterations (int): The number of timed samples of each query. Defaults to 200.
+
+    Returns:
+        dict: The results by backend: {description, uniformity, sizes: {size: {questions, load_seconds,
+            get_questions, former, speedup}}} where get_questions and former have the p50 and p95 latencies.
+
+    """
+    results = {}
+    for name in backends or DEFAULT_BACKENDS:
+        results[name] = {'sizes': {}}
+        for size in sizes or list(SIZES):
+            workdir = tempfile.mkdtemp(prefix="trivia_sampling_")
+            try:
+                db, description = BACKENDS[name](workdir)
+                with db:
+                    results[name]['description'] = description
+                    start = time.perf_counter()
+                    questions = _questions(SIZES[size])
+                    for i in range(0, len(questions), LOAD_CHUNK_SIZE):
+                        db.add_questions(questions[i:i + LOAD_CHUNK_SIZE])
+                    load_seconds = time.perf_counter() - start
+                    db.get_questions(amount, CATEGORY, DIFFICULTY)  # warm up (connections, caches)
+                    new = _measure(lambda: db.get_questions(amount, CATEGORY, DIFFICULTY), iterations)
+                    former_query = _former_query(name, db)
+                    former = _measure(lambda: former_query(amount), iterations)
+                    results[name]['sizes'][size] = {
+                        'questions': SIZES[size],
+                        'load_seconds': load_seconds,
+                        'get_questions': new,
+                        'former': former,
+                        'speedup': former['p50_ms'] / new['p50_ms']
+                    }
+                    if 'uniformity' not in results[name]:
+                        results[name]['uniformity'] = _uniformity(db, amount)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare get_questions with the former sampling queries.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=DEFAULT_BACKENDS)
+    parser.add_argument("--amount", type=int, default=10, help="questions per sample (default: 10)")
+    parser.add_argument("--iterations", type=int, default=200, help="timed samples per query (default: 200)")
+    parser.add_argument("--output", help="a file to write the results to")
+    args = parser.parse_args()
+
+    report = run(args.backends, args.sizes, args.amount, args.iterations)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
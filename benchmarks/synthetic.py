@@ -0,0 +1,81 @@
+"""
+A seeded generator of synthetic trivia data (categories, questions, users and answer records)
+    for benchmarking the data access layers. The same seed and scale always give the same data.
+"""
+import numpy as np
+from dal import Difficulties, Types
+
+# named scales by the number of answer records
+SCALES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1M': 1_000_000
+}
+
+_WORDS = ["which", "planet", "year", "author", "river", "element", "capital", "team", "album", "painter",
+          "largest", "first", "famous", "ancient", "modern", "city", "film", "game", "language", "animal"]
+
+
+class SyntheticData:
+    """
+    A synthetic dataset. The sizes of the questions and users grow with the number of records
+        so the records stay spread over many (question, user) pairs.
+
+    Attributes:
+        seed (int): The seed of the random generator.
+        categories (list): The category names.
+        questions (list): The questions in the opentdb format accepted by DAL.add_questions.
+        users (list): The user names.
+        records (numpy.ndarray): An (n_records, 3) array of (question index, user index, correct),
+            where the indexes point into questions and users.
+
+    """
+
+    N_CATEGORIES = 20
+    N_WRONG_ANSWERS = 3
+
+    def __init__(self, n_records, seed=0):
+        """
+        Args:
+            n_records (int): The number of answer records.
+            seed (int): See class attributes. Defaults to 0.
+        """
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        n_questions = max(100, n_records // 20)
+        n_users = max(10, n_records // 100)
+        self.categories = [f"Category {i:02d}" for i in range(self.N_CATEGORIES)]
+        difficulties = list(Difficulties.__members__)
+        types = rng.choice(list(Types.__members__), n_questions).tolist()
+        words = rng.choice(_WORDS, (n_questions, 8)).tolist()
+        self.questions = []
+        for i in range(n_questions):
+            q = {
+                'category': self.categories[i % self.N_CATEGORIES],
+                'type': types[i],
+                'difficulty': difficulties[(i // self.N_CATEGORIES) % len(difficulties)],
+                # the number keeps the questions unique, the words give them a realistic length
+                'question': f"Q{i} {' '.join(words[i])}?"
+            }
+            if types[i] == Types.boolean.name:
+                q['correct_answer'] = "True" if i % 2 else "False"
+                q['incorrect_answers'] = ["False" if i % 2 else "True"]
+            else:
+                q['correct_answer'] = f"Answer {i}"
+                q['incorrect_answers'] = [f"Wrong {i}.{j}" for j in range(self.N_WRONG_ANSWERS)]
+            self.questions.append(q)
+        self.users = [f"user{i}" for i in range(n_users)]
+        self.records = np.column_stack([
+            rng.integers(0, n_questions, n_records),
+            rng.integers(0, n_users, n_records),
+            rng.integers(0, 2, n_records)
+        ])
+
+    @classmethod
+    def from_scale(cls, scale, seed=0):
+        """ Creates the dataset of a named scale (see SCALES) or a number of records."""
+        return cls(SCALES[scale] if scale in SCALES else int(scale), seed)
+
+    def buckets(self):
+        """ Returns the (category, difficulty) pairs that have questions."""
+        return sorted({(q['category'], q['difficulty']) for q in self.questions})
@@ -0,0 +1,119 @@
+"""
+Measures get_questions with exclude_answered as the history of a user grows, against plain get_questions
+    of the same bucket, and reports the latency percentiles as JSON.
+
+The user answers questions of the measured bucket and of another bucket of the same size (half each),
+    so the latency shows both the answers in the bucket (a larger bitmap) and in the rest of the history
+    (which should not matter). The backends are created as in benchmarks.dal_methods.
+
+Usage: python -m benchmarks.unanswered [--backends sqlite columnar ...] [--bucket 20000]
+                                       [--history 0 1000 5000 10000] [--iterations 200] [--output results.json]
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+import numpy as np
+from benchmarks.dal_methods import BACKENDS, DEFAULT_BACKENDS, LOAD_CHUNK_SIZE
+
+CATEGORY = "Unanswered"
+OTHER_CATEGORY = "Unanswered other"
+DIFFICULTY = 'easy'
+AMOUNT = 10
+
+
+def _questions(category, n):
+    # n boolean questions in a single bucket
+    return [{
+        'category': category,
+        'type': 'boolean',
+        'difficulty': DIFFICULTY,
+        'question': f"{category} {i} benchmark question?",
+        'correct_answer': 'True'
+    } for i in range(n)]
+
+
+def _measure(call, iterations):
+    # returns the latency percentiles (in milliseconds) of the calls
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+    p50, p95 = np.percentile(np.array(times) * 1000, [50, 95])
+    return {'p50_ms': p50, 'p95_ms': p95}
+
+
+def run(backends=None, bucket=20000, history=(0, 1000, 5000, 10000), iterations=200, seed=0):
+    """
+    Measures get_questions with and without exclude_answered at every history size.
+
+    Args:
+        backends (list, optional): Names from benchmarks.dal_methods.BACKENDS. Defaults to sqlite and columnar.
+        bucket (int): The number of questions of each of the two buckets. Defaults to 20000.
+        history (list): The numbers of answered questions to measure at, in ascending order.
+            Must be at most 2 * bucket. Defaults to (0, 1000, 5000, 10000).
+        iterations (int): The number of timed calls of each measurement. Defaults to 200.
+        seed (int): The seed of the answered questions. Defaults to 0.
+
+    Returns:
+        dict: The results by backend: {description, history: {answered: {plain, exclude_answered}}}
+            with the p50 and p95 latencies of each.
+
+    """
+    results = {}
+    for name in backends or DEFAULT_BACKENDS:
+        rng = random.Random(seed)
+        workdir = tempfile.mkdtemp(prefix="trivia_unanswered_")
+        try:
+            db, description = BACKENDS[name](workdir)
+            with db:
+                results[name] = {'description': description, 'history': {}}
+                for category in [CATEGORY, OTHER_CATEGORY]:
+                    questions = _questions(category, bucket)
+                    for i in range(0, len(questions), LOAD_CHUNK_SIZE):
+                        db.add_questions(questions[i:i + LOAD_CHUNK_SIZE])
+                user = db.add_user("unanswered_benchmark")
+                # the questions the user answers, alternating between the buckets
+                ids = [[q['id'] for q in db.get_all_questions(category, DIFFICULTY)]
+                       for category in [CATEGORY, OTHER_CATEGORY]]
+                for bucket_ids in ids:
+                    rng.shuffle(bucket_ids)
+                order = [bucket_ids[i] for i in range(bucket) for bucket_ids in ids]
+                answered = 0
+                for size in history:
+                    for start in range(answered, size, LOAD_CHUNK_SIZE):
+                        db.update_correct_many([(q_id, user, rng.randint(0, 1))
+                                                for q_id in order[start:min(size, start + LOAD_CHUNK_SIZE)]])
+                    answered = size
+                    db.get_questions(AMOUNT, CATEGORY, DIFFICULTY, exclude_answered=True, user=user)  # warm up
+                    results[name]['history'][size] = {
+                        'plain': _measure(lambda: db.get_questions(AMOUNT, CATEGORY, DIFFICULTY), iterations),
+                        'exclude_answered': _measure(
+                            lambda: db.get_questions(AMOUNT, CATEGORY, DIFFICULTY, exclude_answered=True, user=user),
+                            iterations)
+                    }
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure get_questions with exclude_answered by history size.")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=DEFAULT_BACKENDS)
+    parser.add_argument("--bucket", type=int, default=20000, help="questions per bucket (default: 20000)")
+    parser.add_argument("--history", nargs="+", type=int, default=[0, 1000, 5000, 10000],
+                        help="answered questions to measure at (default: 0 1000 5000 10000)")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per measurement (default: 200)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="a file to write the results to")
+    args = parser.parse_args()
+
+    report = run(args.backends, args.bucket, sorted(args.history), args.iterations, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
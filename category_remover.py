@@ -0,0 +1,175 @@
+import atexit
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CategoryRemover:
+    """
+    Removes categories in the background.
+
+    remove hides the category at once (see DAL.hide_category), so it disappears from the menus and no new game
+    gets its questions. A background thread then deletes it with DAL.purge_categories, a batch at a time with
+    a pause between the batches, so the writes of running games are never held up by a long delete.
+    The removals are resumable: the categories that are still hidden when the remover starts (e.g. the process
+    stopped in the middle of a removal) are deleted first. Several removers (e.g. in other processes) can run
+    at the same time.
+
+    Attributes:
+        batch_size (int): The number of questions deleted per batch. None uses DAL.REMOVE_BATCH_SIZE.
+        batch_interval (float): How long (in seconds) the remover pauses between batches.
+        retry_interval (float): How long (in seconds) the remover waits before retrying a failed batch.
+
+    """
+
+    def __init__(self, db, batch_size=None, batch_interval=0.05, retry_interval=2):
+        """
+        Args:
+            db (DAL): The database to remove the categories from.
+            batch_size (int, optional): See class attributes. Defaults to None.
+            batch_interval (float): See class attributes. Defaults to 0.05 seconds.
+            retry_interval (float): See class attributes. Defaults to 2 seconds.
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.retry_interval = retry_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._cond = threading.Condition()
+        self._idle = False  # no category is hidden
+        self._worker = None
+        self._current = None  # the category being deleted
+        # the statistics are updated by the callers of remove and by the background thread
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'requested': 0,
+            'removed': 0,
+            'deleted_questions': 0,
+            'batches': 0,
+            'retries': 0,
+            'last_batch_seconds': 0.0
+        }
+
+    def start(self):
+        """
+        Starts the background thread, which first deletes the categories left hidden by former removals.
+        Registers close to be called on interpreter exit.
+        """
+        if self._worker is not None:
+            return
+        self._stop.clear()
+        self._wake.set()
+        self._worker = threading.Thread(target=self._run, name="CategoryRemover", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def remove(self, name):
+        """
+        Hides a category and deletes it in the background. Returns as soon as the category is hidden.
+
+        Args:
+            name (str): The name of the category to be removed.
+
+        Returns:
+            bool: True if the category was hidden, False if it doesn't exist or is already being removed.
+
+        """
+        if self._worker is None:
+            raise RuntimeError("The remover is not started.")
+        hidden = self.db.hide_category(name)
+        if hidden:
+            with self._stats_lock:
+                self._stats['requested'] += 1
+        with self._cond:
+            self._idle = False
+            self._wake.set()
+        return hidden
+
+    def wait(self, timeout=None):
+        """
+        Waits until all the hidden categories are deleted.
+
+        Args:
+            timeout (float, optional): The maximum time to wait in seconds. Defaults to None (no limit).
+
+        Returns:
+            bool: True if all the categories were deleted, False if the timeout expired first.
+
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._idle, timeout)
+
+    def close(self, timeout=None):
+        """
+        Stops the background thread after the current batch. The categories that were not deleted yet stay
+            hidden and are deleted by the next remover that starts.
+
+        Args:
+            timeout (float, optional): The maximum time to wait for the thread in seconds.
+                Defaults to None (no limit).
+
+        """
+        if self._worker is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._worker.join(timeout)
+        self._worker = None
+        atexit.unregister(self.close)
+
+    def stats(self):
+        """
+        Gets the remover statistics.
+
+        Returns:
+            dict: Counters since the remover was created along with the category being deleted (None if idle).
+                Keys: [removing, requested, removed, deleted_questions, batches, retries, last_batch_seconds]
+
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats['removing'] = self._current
+        return stats
+
+    def _run(self):
+        # the background loop. deletes a batch at a time until no category is hidden,
+        # then sleeps until a category is removed. exits when stopped.
+        while not self._stop.is_set():
+            self._wake.clear()
+            start = time.monotonic()
+            try:
+                done = self.db.purge_categories(self.batch_size, max_batches=1, progress=self._progress)
+            except Exception:
+                logger.exception("Failed to delete a batch of a removed category, retrying in %s seconds",
+                                 self.retry_interval)
+                with self._stats_lock:
+                    self._stats['retries'] += 1
+                self._stop.wait(self.retry_interval)
+                continue
+            if done:
+                with self._cond:
+                    # a category removed while the batch ran is deleted by the next round
+                    if not self._wake.is_set():
+                        self._idle = True
+                        self._cond.notify_all()
+                self._wake.wait()
+            else:
+                with self._stats_lock:
+                    self._stats['last_batch_seconds'] = time.monotonic() - start
+                self._stop.wait(self.batch_interval)
+
+    def _progress(self, category, deleted, done):
+        # the progress callback of purge_categories, called after every batch
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            self._stats['deleted_questions'] += deleted
+            if done:
+                self._stats['removed'] += 1
+                self._current = None
+            else:
+                self._current = category
+        if done:
+            logger.info("Removed category %s", category)
@@ -0,0 +1,236 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """ Raised when no connection became available in the pool within the checkout timeout."""
+    pass
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of long-lived database connections.
+
+    Connections are created lazily by the given factory, handed out with checkout() and returned
+    to the pool with checkin(). The preferred way to use the pool is the connection() context manager
+    which always returns the connection, even if an exception was raised while using it.
+
+    Attributes:
+        max_size (int): The maximum number of open connections (idle + in use).
+        max_idle (int): The maximum number of idle connections kept open. Extra connections returned
+            to the pool are closed.
+        max_idle_time (float): Idle connections older than this (in seconds) are closed on checkout
+            instead of being reused. None means idle connections never expire.
+        timeout (float): How long (in seconds) checkout waits for a free connection. None waits forever.
+
+    """
+
+    def __init__(self, factory, max_size=10, max_idle=5, max_idle_time=300, timeout=30, health_check=None,
+                 discard_on=(Exception,), reset=None):
+        """
+        Args:
+            factory (callable): A function with no arguments that opens a new connection.
+            max_size (int): See class attributes. Defaults to 10.
+            max_idle (int): See class attributes. Defaults to 5.
+            max_idle_time (float): See class attributes. Defaults to 300 seconds.
+            timeout (float): See class attributes. Defaults to 30 seconds.
+            health_check (callable, optional): A function that gets a connection and raises an exception
+                if it is no longer usable. It is called on every checkout of an idle connection.
+                If None, connections are not checked.
+            discard_on (tuple): The exception types that discard the connection when raised inside connection(),
+                since it may be broken. Other exceptions (e.g. a constraint violation) return the connection to
+                the pool after reset. Defaults to any exception.
+            reset (callable, optional): A function that gets a connection returned to the pool after an exception
+                that didn't discard it, and restores it to a clean state (e.g. rolls back the open transaction).
+                The connection is discarded if it raises. If None, the connection is returned as it is.
+
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be positive.")
+        self.max_size = max_size
+        self.max_idle = min(max_idle, max_size)
+        self.max_idle_time = max_idle_time
+        self.timeout = timeout
+        self._factory = factory
+        self._health_check = health_check
+        self._discard_on = discard_on
+        self._reset = reset
+        self._idle = []  # a stack of (connection, time returned to the pool)
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'reused': 0,
+            'failed_health_checks': 0,
+            'expired': 0,
+            'waits': 0,
+            'timeouts': 0
+        }
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager that checks out a connection and checks it back in when done.
+        If an exception of the discard_on types is raised inside the block the connection is discarded, since it
+            may be broken. After other exceptions the connection is reset and reused.
+
+        Yields:
+            A connection created by the pool factory.
+
+        """
+        conn = self.checkout()
+        try:
+            yield conn
+        except BaseException as e:
+            self.checkin(conn, discard=not isinstance(e, Exception) or isinstance(e, self._discard_on)
+                         or not self._reset_after_error(conn))
+            raise
+        else:
+            self.checkin(conn)
+
+    def checkout(self):
+        """
+        Gets a connection from the pool. Idle connections are reused when possible (newest first),
+            otherwise a new connection is opened as long as the pool is not full.
+
+        Returns:
+            A connection created by the pool factory.
+
+        Raises:
+            PoolTimeoutError: If the pool is full and no connection was returned in time.
+            RuntimeError: If the pool is closed.
+
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                conn = self._wait_for_slot(deadline)
+            if conn is None:
+                break
+            # the health check is a round trip to the server so it runs outside of the lock
+            if self._is_healthy(conn):
+                with self._cond:
+                    self._stats['checkouts'] += 1
+                    self._stats['reused'] += 1
+                return conn
+            with self._cond:
+                self._stats['failed_health_checks'] += 1
+                self._in_use -= 1
+                self._close(conn)
+                self._cond.notify()
+        try:
+            conn = self._factory()
+        except BaseException:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['created'] += 1
+            self._stats['checkouts'] += 1
+        return conn
+
+    def checkin(self, conn, discard=False):
+        """
+        Returns a connection to the pool.
+
+        Args:
+            conn: A connection previously returned by checkout.
+            discard (bool): If True, the connection is closed instead of being kept for reuse.
+                Defaults to False.
+
+        """
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed or len(self._idle) >= self.max_idle:
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        """ Closes all the idle connections. Connections in use are closed when they are checked in."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._close(self._idle.pop()[0])
+            self._cond.notify_all()
+
+    def stats(self):
+        """
+        Gets the current pool statistics.
+
+        Returns:
+            dict: Counters since the pool was created along with the current pool state.
+                Keys: [size, idle, in_use, max_size, max_idle, created, closed, checkouts, reused,
+                    failed_health_checks, expired, waits, timeouts]
+
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._in_use + len(self._idle),
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'max_size': self.max_size,
+                'max_idle': self.max_idle
+            })
+            return stats
+
+    def _wait_for_slot(self, deadline):
+        # helper method for checkout. must be called while holding the lock.
+        # reserves a slot in the pool and returns an idle connection to reuse,
+        # or None if a new connection should be opened in the reserved slot.
+        while True:
+            if self._closed:
+                raise RuntimeError("The connection pool is closed.")
+            while self._idle:
+                conn, returned_at = self._idle.pop()
+                if self.max_idle_time is not None and time.monotonic() - returned_at > self.max_idle_time:
+                    self._stats['expired'] += 1
+                    self._close(conn)
+                    continue
+                self._in_use += 1
+                return conn
+            if self._in_use < self.max_size:
+                self._in_use += 1
+                return None
+            self._stats['waits'] += 1
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                self._stats['timeouts'] += 1
+                raise PoolTimeoutError(f"No connection available after {self.timeout} seconds.")
+            self._cond.wait(remaining)
+
+    def _is_healthy(self, conn):
+        # helper method for checkout. checks an idle connection before handing it out.
+        if self._health_check is None:
+            return True
+        try:
+            self._health_check(conn)
+        except Exception:
+            return False
+        return True
+
+    def _reset_after_error(self, conn):
+        # helper method for connection. resets a connection that is kept after an exception,
+        # returns False if it failed (the connection is discarded).
+        if self._reset is None:
+            return True
+        try:
+            self._reset(conn)
+        except Exception:
+            return False
+        return True
+
+    def _close(self, conn):
+        # helper method to close a connection, ignoring errors of already broken connections.
+        self._stats['closed'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -1,5 +1,10 @@
+import hashlib
+import html
+import random
+import pandas as pd
 from abc import ABC, abstractmethod
-import requests
+from lookup_cache import LookupCache
+from opentdb import OpenTdbClient
 from enum import Enum, unique
 
 
@@ -24,6 +29,138 @@ class Types(Enum):
     multiple = 2
 
 
+class BatchResult:
+    """
+    The result of writing a batch of items (e.g. questions or answer records) to the database.
+
+    Attributes:
+        added (int): The number of items that were written.
+        failures (list): A list of (index, reason) tuples for the items that were not written,
+            where index is the position of the item in the batch and reason is a message.
+
+    """
+
+    def __init__(self):
+        self.added = 0
+        self.failures = []
+
+    def fail(self, index, reason):
+        """ Records that the item at the given index of the batch was not written."""
+        self.failures.append((index, str(reason)))
+
+    @property
+    def duplicates(self):
+        """ The number of questions that were not added because they were already in the database."""
+        return sum(1 for _, reason in self.failures if reason == DAL.DUPLICATE_QUESTION)
+
+    def __repr__(self):
+        return f"BatchResult(added={self.added}, failed={len(self.failures)})"
+
+
+class AnsweredSeqs:
+    """
+    The sequence numbers (see DAL.get_questions) of the questions of one bucket that a user answered,
+        as a bitmap of WORD_BITS bit words: number n is bit (n - 1) % WORD_BITS of word (n - 1) // WORD_BITS.
+    The implementations store a row (or a field) per word, so the bitmap of a bucket is read with a single
+        seek no matter how many questions the user answered in other buckets, and an answer sets its bit with
+        a bitwise OR of the word.
+    Works as a set of the numbers for len, in and iteration.
+
+    Attributes:
+        words (dict): word index: bits. Words without bits are left out.
+
+    """
+
+    WORD_BITS = 32
+
+    def __init__(self, words=None):
+        """
+        Args:
+            words (dict, optional): See class attributes. The keys and values may be anything int accepts
+                (e.g. the string keys of a mongodb document). Defaults to None (no answered questions).
+        """
+        self.words = {int(word): int(bits) for word, bits in (words or {}).items() if bits}
+        self._count = sum(bits.bit_count() for bits in self.words.values())
+
+    @classmethod
+    def position(cls, seq):
+        """ Gets the (word index, bits) of a sequence number, where only the bit of the number is set."""
+        return (seq - 1) // cls.WORD_BITS, 1 << ((seq - 1) % cls.WORD_BITS)
+
+    def add(self, seq):
+        """ Adds a sequence number to the bitmap."""
+        self.merge(*self.position(seq))
+
+    def merge(self, word, bits):
+        """ Sets the given bits of a word (a bitwise OR with the word)."""
+        old = self.words.get(word, 0)
+        self.words[word] = old | bits
+        self._count += (old | bits).bit_count() - old.bit_count()
+
+    def __contains__(self, seq):
+        word, bit = self.position(seq)
+        return bool(self.words.get(word, 0) & bit)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for word, bits in self.words.items():
+            while bits:
+                low = bits & -bits
+                yield word * self.WORD_BITS + low.bit_length()
+                bits ^= low
+
+    def sample(self, size, amount, present=False):
+        """
+        Draws distinct numbers uniformly from the numbers of 1..size that are not in the bitmap
+            (or, if present is True, that are in it). The numbers are picked by their rank among the bits of
+            the words, so the cost is O(size / WORD_BITS) (O(len(words)) if present) rather than O(size).
+
+        Args:
+            size (int): The largest number.
+            amount (int): The number of numbers to draw. Fewer are drawn if there are not enough numbers.
+            present (bool): Whether to draw the numbers in the bitmap. Defaults to False.
+
+        Returns:
+            list: The numbers, in random order.
+
+        """
+        if size <= 0 or amount <= 0:
+            return []
+        last_word, last_bit = self.position(size)
+        full = (1 << self.WORD_BITS) - 1
+        candidates = []  # (word index, bits of the numbers to draw from)
+        for word in (sorted(self.words) if present else range(last_word + 1)):
+            if word > last_word:
+                break
+            bits = self.words.get(word, 0) if present else ~self.words.get(word, 0) & full
+            if word == last_word:
+                bits &= (last_bit << 1) - 1
+            if bits:
+                candidates.append((word, bits))
+        total = sum(bits.bit_count() for _, bits in candidates)
+        ranks = sorted(random.sample(range(total), min(amount, total)))
+        seqs = []
+        first = 0  # the rank of the first number of the word
+        i = 0
+        for word, bits in candidates:
+            count = bits.bit_count()
+            while i < len(ranks) and ranks[i] < first + count:
+                # the (rank - first)th set bit of the word
+                word_bits = bits
+                for _ in range(ranks[i] - first):
+                    word_bits &= word_bits - 1
+                seqs.append(word * self.WORD_BITS + (word_bits & -word_bits).bit_length())
+                i += 1
+            first += count
+        random.shuffle(seqs)
+        return seqs
+
+    def __repr__(self):
+        return f"AnsweredSeqs(count={self._count})"
+
+
 class DAL(ABC):
     """ A Data Abstract Layer that supplies the functions used to interact with the database.
 
@@ -34,12 +171,50 @@ class DAL(ABC):
     """
 
     MAX_IMPORT_AMOUNT = 50
+    # implementations with limited field sizes should override these. None means unlimited.
+    MAX_QUESTION_LENGTH = None
+    MAX_ANSWER_LENGTH = None
+    DUPLICATE_QUESTION = "Question already in the database."
+    # sizes of the name to id caches of categories and users.
+    LOOKUP_CACHE_SIZE = 10000
+    # how long (in seconds) the categories are cached, to pick up changes made by other processes.
+    CATEGORIES_CACHE_TTL = 60
+    # the number of questions deleted per batch by purge_categories
+    REMOVE_BATCH_SIZE = 1000
+    # the random draws per number of _sample_seqs before it picks among the numbers that are not excluded
+    _SAMPLE_DRAWS = 4
+    # the tables streamed by export_rows and their columns. version is the change version of the row.
+    EXPORT_TABLES = {
+        'questions': ('id', 'category', 'type', 'difficulty', 'question', 'correct_answer', 'version'),
+        'answers': ('question_id', 'answer', 'version'),
+        'users': ('id', 'name', 'version'),
+        'records': ('question_id', 'user_id', 'correct', 'version')
+    }
 
     def __init__(self):
-        self.opentdb_api = "https://opentdb.com/api.php"
-        self._opentdb_categories = None
+        # the opentdb client keeps its connections alive between imports
+        self.opentdb = OpenTdbClient()
         self.difficulties = list(Difficulties.__members__.keys())
         self.types = list(Types.__members__.keys())
+        # lookup caches for the implementations. populated on first use and updated by add_category,
+        # hide_category and add_user. the category list is kept under the key 'all'.
+        self._category_ids = LookupCache(self.LOOKUP_CACHE_SIZE, ttl=self.CATEGORIES_CACHE_TTL)
+        self._user_ids = LookupCache(self.LOOKUP_CACHE_SIZE)
+        self._category_list = LookupCache(1, ttl=self.CATEGORIES_CACHE_TTL)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Releases the resources held by the instance (e.g. open connections).
+        The default implementation does nothing. Implementations that hold connections should override it.
+
+        """
+        pass
 
     @abstractmethod
     def add_question(self, category, q_type, difficulty, question, correct_answer, wrong_answers=None):
@@ -56,12 +231,37 @@ class DAL(ABC):
                 For boolean questions, this is assumed to be None.
 
         Raises:
-            ValueError: If any of the parameters is invalid or if the question already exists.
+            ValueError: If any of the parameters is invalid or if the question already exists
+                (questions with the same question_hash are the same question).
                 Certain implementations may define valid differently. (e.g. maximum length)
 
         """
         pass
 
+    def add_questions(self, questions):
+        """
+        Adds a batch of questions to the database.
+            Invalid or duplicate questions are skipped and reported without aborting the batch.
+            The default implementation adds the questions one by one. Implementations should override it
+            with a bulk insert.
+
+        Args:
+            questions (list): A list of questions in the opentdb result format. Each question is a dictionary
+                with the keys [category, type, difficulty, question, correct_answer, incorrect_answers].
+
+        Returns:
+            BatchResult: The number of added questions and the reason each of the others was not added.
+
+        """
+        result = BatchResult()
+        for i, q in enumerate(questions):
+            try:
+                self.add_question(*self._validate_question(q))
+                result.added += 1
+            except ValueError as e:
+                result.fail(i, e)
+        return result
+
     @abstractmethod
     def import_questions(self, amount=1, difficulty=None, category=None):
         """
@@ -99,19 +299,70 @@ class DAL(ABC):
         """
         pass
 
-    @abstractmethod
     def remove_category(self, name):
         """
         Removes a category from the database. This will also remove all questions under that category,
             along with any other reference of these questions. (e.g. score records)
             If the category does not exist, does nothing.
+            The category is hidden (see hide_category) and then deleted by purge_categories, so games keep
+            running while a large category is deleted. Use category_remover.CategoryRemover to delete it
+            in the background.
+
+        Args:
+            name (str): The name of the category to be removed.
+
+        """
+        self.hide_category(name)
+        self.purge_categories()
+
+    @abstractmethod
+    def hide_category(self, name):
+        """
+        Hides a category to be deleted by purge_categories. A hidden category is left out of get_categories,
+            get_difficulties, get_questions, get_all_questions and get_results_by at once, and can't be added
+            again until it is deleted. This is a single short write.
 
         Args:
             name (str): The name of the category to be removed.
 
+        Returns:
+            bool: True if the category was hidden, False if it doesn't exist or is already hidden.
+
         """
         pass
 
+    def purge_categories(self, batch_size=None, max_batches=None, progress=None):
+        """
+        Deletes the hidden categories (see hide_category) in batches, each written in a short transaction of
+            its own, so the writes of running games are not blocked for long. A batch deletes batch_size
+            questions of a category along with their answers and records (which are subtracted from the
+            statistics counters), or batch_size rows of the answered questions bitmaps of the category once
+            its questions are deleted, or finally the category itself.
+            The purge can be stopped and run again at any time, also by another process.
+
+        Args:
+            batch_size (int, optional): The number of questions (or bitmap rows) deleted per batch.
+                Defaults to REMOVE_BATCH_SIZE.
+            max_batches (int, optional): Stop after this many batches. Defaults to None (until all the hidden
+                categories are deleted).
+            progress (callable, optional): Called after every batch with the name of the category, the number
+                of questions deleted by the batch and whether the category is now deleted.
+
+        Returns:
+            bool: True if all the hidden categories are deleted, False if max_batches was reached first.
+
+        """
+        batch_size = batch_size or self.REMOVE_BATCH_SIZE
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            batch = self._purge_batch(batch_size)
+            if batch is None:
+                return True
+            batches += 1
+            if progress:
+                progress(*batch)
+        return False
+
     @abstractmethod
     def get_categories(self):
         """
@@ -138,14 +389,20 @@ class DAL(ABC):
         pass
 
     @abstractmethod
-    def get_questions(self, amount, category, difficulty):
+    def get_questions(self, amount, category, difficulty, exclude_answered=False, user=None):
         """
-        Gets questions from the database.
+        Gets random questions from the database. Every set of amount questions of the category and difficulty
+            is equally likely, in a random order.
 
         Args:
             amount (int): The amount of questions to get.
             category (str): The category of the questions to get.
             difficulty (str): The difficulty of the questions to get.
+            exclude_answered (bool): If True, the questions the user already answered are left out of the draw.
+                If there are less than amount other questions, all of them are returned along with random
+                answered questions. The answered questions are read from a bitmap per user and bucket
+                (see AnsweredSeqs), so the cost doesn't grow with the history of the user. Defaults to False.
+            user (optional): The user id (see add_user). Required if exclude_answered is True.
 
         Returns:
             list: A list of the questions available for the given criteria.
@@ -153,6 +410,44 @@ class DAL(ABC):
                 The questions are a dictionary with the keys:
                     [id, type, question, correct_answer, wrong_answers(if type is multiple)]
 
+        Raises:
+            ValueError: If exclude_answered is True and no user is given.
+
+        """
+        pass
+
+    @abstractmethod
+    def get_all_questions(self, category, difficulty):
+        """
+        Gets all the questions of the given category and difficulty. Used to cache the questions locally.
+
+        Args:
+            category (str): The category of the questions to get.
+            difficulty (str): The difficulty of the questions to get.
+
+        Returns:
+            list: A list of the questions in the same format as get_questions, in no particular order.
+                The questions also have the key seq: their number in the bucket (see get_answered),
+                or None if they are not numbered.
+
+        """
+        pass
+
+    @abstractmethod
+    def get_answered(self, user, category, difficulty):
+        """
+        Gets the questions of the given category and difficulty that the user answered, by their number
+            in the bucket (the seq key of get_all_questions). Read with a single seek, like get_questions with
+            exclude_answered. Used to exclude the answered questions from locally cached questions.
+
+        Args:
+            user: The user id (see add_user).
+            category (str): The category of the questions.
+            difficulty (str): The difficulty of the questions.
+
+        Returns:
+            AnsweredSeqs: The numbers of the answered questions.
+
         """
         pass
 
@@ -185,10 +480,35 @@ class DAL(ABC):
         """
         pass
 
+    def update_correct_many(self, records):
+        """
+        Updates the database with a batch of answers. See update_correct.
+            Invalid records are skipped and reported without aborting the batch.
+            The default implementation updates the records one by one. Implementations should override it
+            with a bulk write.
+
+        Args:
+            records (list): A list of (question, user, correct) tuples.
+                If the same question and user appear more than once, the last one wins.
+
+        Returns:
+            BatchResult: The number of written records and the reason each of the others was not written.
+
+        """
+        result = BatchResult()
+        for i, (question, user, correct) in enumerate(records):
+            try:
+                self.update_correct(question, user, correct)
+                result.added += 1
+            except ValueError as e:
+                result.fail(i, e)
+        return result
+
     @abstractmethod
     def get_results_by(self, by, order_by=None, ascending=True, limit=None):
         """
         Gets the number of correct/incorrect questions grouped by the given parameter.
+            The numbers are read from counters maintained by update_correct (see rebuild_stats).
 
         Args:
             by (str): The parameter to group by. Should be one of [user, category, difficulty]
@@ -210,6 +530,136 @@ class DAL(ABC):
         """
         pass
 
+    @abstractmethod
+    def get_leaderboard(self, limit=10, after=None):
+        """
+        Gets a page of the users ordered by the number of correct answers, best first (ties by the user id,
+            descending). The page is read from an index of the user counters maintained by update_correct,
+            starting after the cursor (keyset pagination), and the ranks from the number of users per number
+            of correct answers, so the cost doesn't grow with the number of users or with the depth of the page.
+
+        Args:
+            limit (int): The number of users in the page. Defaults to 10.
+            after (tuple, optional): The cursor returned with the former page, to get the users that follow it.
+                Defaults to None (the top users).
+
+        Returns:
+            tuple: A pandas.DataFrame with the columns [Name, Rank, Correct, Incorrect], and the cursor of the
+                next page (None if there are no more users). Users with the same number of correct answers have
+                the same rank: one more than the number of users with more correct answers.
+
+        """
+        pass
+
+    @abstractmethod
+    def get_user_rank(self, name):
+        """
+        Gets the place of a user on the leaderboard (see get_leaderboard).
+
+        Args:
+            name (str): The name of the user.
+
+        Returns:
+            dict: The rank of the user and its number of correct and incorrect answers with the keys
+                [rank, correct, incorrect], or None if the user doesn't exist or didn't answer any question.
+
+        """
+        pass
+
+    @abstractmethod
+    def rebuild_stats(self):
+        """
+        Recomputes the statistics counters read by get_results_by and get_leaderboard, and the answered questions
+            bitmaps (see AnsweredSeqs), from the answer records.
+            Both are maintained by update_correct, so this is only needed to verify them, to fix them
+            (e.g. after records were changed directly in the database) or to build the bitmaps of the records
+            written before they were kept.
+
+        """
+        pass
+
+    @abstractmethod
+    def export_watermark(self):
+        """
+        Starts an export. Must be called before the rows of the export are read, so the rows that are changed
+            while they are exported are exported again by the next export. The exports are at least once,
+            the row with the highest version wins.
+
+        Returns:
+            int: The version to pass as since to export_rows on the next (incremental) export.
+
+        """
+        pass
+
+    @abstractmethod
+    def export_rows(self, table, since=None, batch_size=10000):
+        """
+        Streams the raw rows of a table with a server-side cursor, in batches.
+            Deleted rows (e.g. of a removed category) are not exported by incremental exports.
+
+        Args:
+            table (str): One of EXPORT_TABLES.
+            since (int, optional): Export only the rows added or changed since the export that got this
+                version from export_watermark. Defaults to None (all the rows).
+            batch_size (int): The maximum number of rows in a batch. Defaults to 10000.
+
+        Yields:
+            list: A batch of rows. Each row is a tuple of the EXPORT_TABLES columns of the table.
+                The ids are encoded by encode_id, type and difficulty are the enum names
+                and the answers of a question have the version of the question.
+
+        Raises:
+            ValueError: If the table is invalid.
+
+        """
+        pass
+
+    @abstractmethod
+    def backfill_question_hashes(self, batch_size=1000):
+        """
+        Stores the content hash (see question_hash) of the questions that were added before it was stored.
+            A question whose hash belongs to another question is a near-duplicate of it. It is left without
+            a hash and is not removed, since it may have answer records.
+            The backfill can be stopped and run again at any time.
+
+        Args:
+            batch_size (int): The number of questions hashed together. Defaults to 1000.
+
+        Returns:
+            tuple: The number of hashed questions and a list of the ids of the near-duplicate questions.
+
+        """
+        pass
+
+    @staticmethod
+    def question_hash(question):
+        """
+        Computes the content hash that identifies duplicate questions. The text is normalized first,
+            so questions that only differ in HTML entities (as returned by opentdb), whitespace or case
+            have the same hash.
+
+        Args:
+            question (str): The text of the question.
+
+        Returns:
+            str: The SHA-1 hex digest of the normalized text (40 characters).
+
+        """
+        normalized = " ".join(html.unescape(question).split()).casefold()
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+    def encode_id(self, item_id):
+        """
+        Converts a question or user id to a value that can be stored as JSON (e.g. in a local journal file).
+            The default implementation returns the id as is, which suits integer ids.
+
+        """
+        return item_id
+
+    def decode_id(self, value):
+        """ The inverse of encode_id."""
+        return value
+
     def get_opentdb_categories(self):
         """
         Gets all the categories available at https://opentdb.com.
@@ -218,16 +668,8 @@ class DAL(ABC):
             list: A list of the names of the categories.
 
         """
-        # on the first call to this method, the categories will be kept in a dictionary
-        # with the name as key and the id (as provided by the api) as value.
-        # the categories are unlikely to be changed during a game session so there is no need
-        # to do it more than once.
-        if self._opentdb_categories is None:
-            self._opentdb_categories = dict()
-            with requests.get(r"https://opentdb.com/api_category.php") as result:
-                for cat in result.json()['trivia_categories']:
-                    self._opentdb_categories[cat['name']] = cat['id']
-        return list(self._opentdb_categories.keys())
+        # the categories are unlikely to be changed during a game session so the client fetches them once.
+        return list(self.opentdb.categories().keys())
 
     def _import_questions_from_opentdb(self, amount=1, difficulty=None, category=None):
         # The code below is shared among different implementations of this class.
@@ -235,25 +677,115 @@ class DAL(ABC):
         # Classes that implement this interface should call the parent method to get the
         # list and then save it in the database.
 
-        # prepare the query string
-        api_query = self.opentdb_api + f"?amount={amount}"
+        if difficulty and difficulty not in Difficulties.__members__:
+            raise ValueError(f"Invalid difficulty {difficulty}. The possible difficulties are {self.difficulties}")
+        # raises ValueError for an invalid category and ConnectionError (OpenTdbError) if the request failed
+        return self.opentdb.questions(amount, category, difficulty)
+
+    @classmethod
+    def _validate_question(cls, q):
+        # validates a question in the opentdb format (as accepted by add_questions) and returns it as
+        # a tuple of the add_question arguments: (category, type, difficulty, question, correct, wrong answers).
+        # raises ValueError with the reason if the question is invalid.
+        # a class method, so questions can be validated without a database (e.g. in worker processes).
+        try:
+            category, question, correct_answer = q['category'], q['question'], q['correct_answer']
+            q_type, difficulty = q['type'], q['difficulty']
+        except KeyError as e:
+            raise ValueError(f"Missing field {e}.")
+        if q_type not in Types.__members__ or difficulty not in Difficulties.__members__:
+            raise ValueError(f"Invalid question type {q_type} or difficulty {difficulty}.")
+        wrong_answers = list(q.get('incorrect_answers') or []) if q_type == Types.multiple.name else None
+        if not category or not question or not correct_answer:
+            raise ValueError("Category, question and correct answer cannot be empty.")
+        if q_type == Types.multiple.name and not wrong_answers:
+            raise ValueError("Multiple choice questions must have at least one wrong answer.")
+        if cls.MAX_QUESTION_LENGTH and len(question) > cls.MAX_QUESTION_LENGTH:
+            raise ValueError(f"Too many characters for the question (max: {cls.MAX_QUESTION_LENGTH}).")
+        if cls.MAX_ANSWER_LENGTH and any(len(a) > cls.MAX_ANSWER_LENGTH
+                                         for a in [correct_answer] + (wrong_answers or [])):
+            raise ValueError(f"Too many characters for one of the answers (max: {cls.MAX_ANSWER_LENGTH}).")
+        return category, q_type, difficulty, question, correct_answer, wrong_answers
+
+    @classmethod
+    def _sample_seqs(cls, size, amount, exclude=()):
+        # helper method for get_questions. draws amount distinct numbers uniformly from 1..size (the sequence
+        # numbers of a bucket of questions), without the excluded numbers (an AnsweredSeqs or a set of numbers
+        # from 1..size). the numbers are drawn at random and redrawn when excluded or drawn before, which costs
+        # O(amount) unless most of the numbers are excluded. after _SAMPLE_DRAWS draws per number, the rest are
+        # picked among the zero bits of a bitmap of the excluded and drawn numbers (see AnsweredSeqs.sample).
+        # the numbers are in random order.
+        available = size - len(exclude)
+        amount = min(amount, available)
+        if amount <= 0:
+            return []
+        if not exclude:
+            return random.sample(range(1, size + 1), amount)
+        picked = {}  # a dict keeps the order of the draws
+        for _ in range(cls._SAMPLE_DRAWS * amount):
+            seq = random.randint(1, size)
+            if seq not in exclude:
+                picked[seq] = None
+                if len(picked) == amount:
+                    return list(picked)
+        taken = AnsweredSeqs(exclude.words) if isinstance(exclude, AnsweredSeqs) else AnsweredSeqs()
+        for seq in picked if isinstance(exclude, AnsweredSeqs) else list(exclude) + list(picked):
+            taken.add(seq)
+        seqs = list(picked) + taken.sample(size, amount - len(picked))
+        random.shuffle(seqs)
+        return seqs
+
+    @classmethod
+    def _sample_unanswered(cls, size, amount, answered, tried=()):
+        # helper method for get_questions with exclude_answered. draws like _sample_seqs, but the numbers in
+        # answered (an AnsweredSeqs) are drawn only when there are not enough other numbers.
+        # the numbers in tried (drawn before by the caller) are not drawn at all.
+        excluded = answered
+        if tried:
+            excluded = AnsweredSeqs(answered.words)
+            for seq in tried:
+                excluded.add(seq)
+        seqs = cls._sample_seqs(size, amount, excluded)
+        if len(seqs) < amount:
+            # the answered numbers that were not tried
+            rest = AnsweredSeqs(answered.words)
+            if tried:
+                tried_seqs = AnsweredSeqs()
+                for seq in tried:
+                    tried_seqs.add(seq)
+                rest = AnsweredSeqs({word: bits & ~tried_seqs.words.get(word, 0) for word, bits in rest.words.items()})
+            seqs += rest.sample(size, amount - len(seqs), present=True)
+        return seqs
 
-        if difficulty:  # not default (i.e random)
-            try:
-                api_query += f"&difficulty={Difficulties[difficulty].name}"
-            except KeyError:
-                raise ValueError(f"Invalid difficulty {difficulty}."
-                                 f" The possible difficulties are {self.difficulties}")
-
-        if category:  # not default (i.e random)
-            if category not in self.get_opentdb_categories():
-                raise ValueError(f"Invalid category {category}.")
-            else:
-                api_query += f"&category={self._opentdb_categories[category]}"  # the api category id
-
-        # try to get the requested questions from opentdb
-        with requests.get(api_query) as result:
-            result = result.json()
-            if result["response_code"] != 0:
-                raise(ConnectionError("There was an error when trying to get the questions from opentdb"))
-            return result['results']
+    @abstractmethod
+    def _purge_batch(self, batch_size):
+        # helper method for purge_categories. deletes a batch of a hidden category (see purge_categories) in a
+        # transaction. returns (category name, deleted questions, whether the category is deleted),
+        # or None if no category is hidden.
+        pass
+
+    @staticmethod
+    def _leaderboard_page(rows, above, counts, limit):
+        # helper method for get_leaderboard. rows are the (correct, user id, name, incorrect) of the page in order,
+        # above is the number of users with more correct answers than the first row, and counts are the numbers
+        # of users by number of correct answers, for the numbers in the page except the lowest.
+        # returns the page and the cursor of the next page.
+        ranks = {}
+        for correct in sorted({row[0] for row in rows}, reverse=True):
+            ranks[correct] = above + 1
+            above += counts.get(correct, 0)
+        page = pd.DataFrame([(name, ranks[correct], correct, incorrect) for correct, _, name, incorrect in rows],
+                            columns=['Name', 'Rank', 'Correct', 'Incorrect'])
+        cursor = (rows[-1][0], rows[-1][1]) if rows and len(rows) == limit else None
+        return page, cursor
+
+    @staticmethod
+    def _check_answered_user(exclude_answered, user):
+        # helper method for get_questions
+        if exclude_answered and user is None:
+            raise ValueError("A user is required to exclude the answered questions.")
+
+    def _check_export_table(self, table):
+        # helper method for export_rows
+        if table not in self.EXPORT_TABLES:
+            raise ValueError(f"Invalid table {table}. The tables are {list(self.EXPORT_TABLES)}.")
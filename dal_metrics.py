@@ -0,0 +1,197 @@
+import bisect
+import json
+import os
+import threading
+import time
+from dal import DAL, BatchResult
+
+
+class _MethodStats:
+    # the measurements of a single method of a single backend
+
+    __slots__ = ('calls', 'errors', 'rows', 'seconds', 'buckets', 'lock')
+
+    def __init__(self, n_buckets):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (n_buckets + 1)  # the last one is +Inf
+        self.lock = threading.Lock()
+
+
+class DalMetrics:
+    """
+    Collects the call counts, error counts, latency histograms and the number of returned rows (or documents)
+        of the DAL methods, labelled by backend (the class name) and method.
+
+    A database is measured by instrumenting it, which replaces its public methods with measuring wrappers
+        on the instance (so calls between the methods of the database are measured as well).
+        When the metrics are disabled, instrument returns the database untouched, so there is no overhead at all.
+
+    Attributes:
+        enabled (bool): Whether instrument wraps the databases.
+
+    """
+
+    # the upper bounds (in seconds) of the latency histogram buckets
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    # the methods of the DAL that are measured. encode_id and decode_id don't access the database.
+    METHODS = tuple(name for name in dir(DAL) if not name.startswith('_') and callable(getattr(DAL, name))
+                    and name not in {'encode_id', 'decode_id', 'close'})
+
+    def __init__(self, enabled=False):
+        """
+        Args:
+            enabled (bool): See class attributes. Defaults to False.
+        """
+        self.enabled = enabled
+        self._stats = {}  # (backend, method): _MethodStats
+        self._lock = threading.Lock()
+
+    def instrument(self, db):
+        """
+        Measures all the DAL methods of the database from now on, if the metrics are enabled.
+
+        Args:
+            db (DAL): The database to instrument.
+
+        Returns:
+            DAL: The same database.
+
+        """
+        if not self.enabled or getattr(db, '_metrics', None) is self:
+            return db
+        backend = type(db).__name__
+        for method in self.METHODS:
+            if hasattr(db, method):
+                setattr(db, method, self._wrap(method, getattr(db, method), self._get_stats(backend, method)))
+        db._metrics = self
+        return db
+
+    def snapshot(self):
+        """
+        Gets the current measurements.
+
+        Returns:
+            list: A dictionary per measured (backend, method) with the keys
+                [backend, method, calls, errors, rows, seconds, buckets]
+                where buckets is a list of [upper bound, cumulative count] with the last bound being "+Inf".
+
+        """
+        with self._lock:
+            items = sorted(self._stats.items())
+        out = []
+        for (backend, method), stats in items:
+            with stats.lock:
+                counts = list(stats.buckets)
+                entry = {
+                    'backend': backend,
+                    'method': method,
+                    'calls': stats.calls,
+                    'errors': stats.errors,
+                    'rows': stats.rows,
+                    'seconds': stats.seconds
+                }
+            cumulative = 0
+            entry['buckets'] = []
+            for bound, count in zip(list(self.BUCKETS) + ["+Inf"], counts):
+                cumulative += count
+                entry['buckets'].append([bound, cumulative])
+            out.append(entry)
+        return out
+
+    def to_json(self):
+        """ Returns the snapshot as a JSON string."""
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self):
+        """ Returns the measurements in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, field):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for entry in snapshot:
+                lines.append(f'{name}{{{self._labels(entry)}}} {entry[field]}')
+
+        metric("trivia_dal_calls_total", "counter", "Calls of the DAL methods.", 'calls')
+        metric("trivia_dal_errors_total", "counter", "Calls of the DAL methods that raised an exception.", 'errors')
+        metric("trivia_dal_rows_total", "counter", "Rows or documents returned or written by the DAL methods.", 'rows')
+        name = "trivia_dal_latency_seconds"
+        lines.append(f"# HELP {name} Latency of the DAL methods.")
+        lines.append(f"# TYPE {name} histogram")
+        for entry in snapshot:
+            labels = self._labels(entry)
+            for bound, count in entry['buckets']:
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{{labels}}} {entry["seconds"]}')
+            lines.append(f'{name}_count{{{labels}}} {entry["calls"]}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """ Removes all the measurements. Instrumented databases keep being measured."""
+        with self._lock:
+            for stats in self._stats.values():
+                with stats.lock:
+                    stats.calls = stats.errors = stats.rows = 0
+                    stats.seconds = 0.0
+                    stats.buckets = [0] * len(stats.buckets)
+
+    def _get_stats(self, backend, method):
+        with self._lock:
+            stats = self._stats.get((backend, method))
+            if stats is None:
+                stats = self._stats[(backend, method)] = _MethodStats(len(self.BUCKETS))
+            return stats
+
+    def _wrap(self, method, func, stats):
+        buckets = self.BUCKETS
+
+        def measured(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                seconds = time.perf_counter() - start
+                with stats.lock:
+                    stats.calls += 1
+                    stats.errors += 1
+                    stats.seconds += seconds
+                    stats.buckets[bisect.bisect_left(buckets, seconds)] += 1
+                raise
+            seconds = time.perf_counter() - start
+            rows = self._count_rows(method, result)
+            with stats.lock:
+                stats.calls += 1
+                stats.rows += rows
+                stats.seconds += seconds
+                stats.buckets[bisect.bisect_left(buckets, seconds)] += 1
+            return result
+
+        measured.__wrapped__ = func
+        measured.__doc__ = func.__doc__
+        return measured
+
+    @staticmethod
+    def _count_rows(method, result):
+        # the number of rows or documents a method returned or wrote
+        if method == 'import_questions':
+            return result or 0  # the number of added questions
+        if isinstance(result, BatchResult):
+            return result.added
+        if result is None:
+            return 0
+        try:
+            return len(result)  # lists and data frames
+        except TypeError:
+            return 1  # an id
+
+    @staticmethod
+    def _labels(entry):
+        return f'backend="{entry["backend"]}",method="{entry["method"]}"'
+
+
+# the metrics of the process. enabled by setting the TRIVIA_DAL_METRICS environment variable to 1.
+METRICS = DalMetrics(enabled=os.environ.get('TRIVIA_DAL_METRICS') == '1')
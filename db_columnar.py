@@ -0,0 +1,637 @@
+from dal import *
+import os
+import sys
+import threading
+import numpy as np
+import pandas as pd
+
+
+class _Column:
+    # a growable numpy array. the capacity is doubled when full, so appending is amortized O(1).
+
+    def __init__(self, dtype, values=None):
+        values = np.asarray(values if values is not None else [], dtype=dtype)
+        self._data = np.empty(max(16, len(values)), dtype=dtype)
+        self._data[:len(values)] = values
+        self._size = len(values)
+
+    def append(self, value):
+        if self._size == len(self._data):
+            self._data = np.resize(self._data, 2 * len(self._data))
+        self._data[self._size] = value
+        self._size += 1
+
+    @property
+    def values(self):
+        # a view of the filled part of the array
+        return self._data[:self._size]
+
+    def __len__(self):
+        return self._size
+
+
+class DbColumnar(DAL):
+    """
+    Implementation of the DAL that keeps all the data in memory in numpy columns, for load tests
+        and ephemeral game servers. The data can optionally be kept in a .npz file (see path).
+
+    Questions are rows of parallel columns (category code, type, difficulty, alive flag) with the texts
+        interned in lists, and the question id is the row number. Categories and users are small integer
+        codes. A removed question is only marked as not alive, so the ids never change. A removed category is
+        deleted at once by hide_category (a few array operations under the lock), so purge_categories
+        has nothing left to delete.
+    Records are kept as a sorted int64 array of (question id << 32 | user id) keys (two int32 columns packed
+        into one, so they can be searched with np.searchsorted) with a parallel int8 column of the results.
+        New records go to a small buffer that is merged into the sorted arrays when it fills up.
+    The ids of the questions of every (category, difficulty) bucket are kept in a growable column, so
+        get_questions samples positions of the bucket without scanning the questions. The position of a question
+        in its bucket is its sequence number in the answered questions bitmaps of the users (see AnsweredSeqs),
+        which are built from the records on load.
+    get_results_by counts the records with np.bincount, so there are no counters to maintain.
+    The leaderboard (see get_leaderboard) is kept up to date by update_correct: the number of correct and
+        answered questions of every user in two columns, the number of users per number of correct answers
+        in an array, and a sorted int64 array of (correct << 32 | user code) keys for the order. A user whose
+        number of correct answers changes gets a new key in a small buffer, which is merged into the sorted
+        array when it fills up, and the former key is skipped as stale until the merge drops it.
+    Questions, users and records have a version column for the incremental exports: written rows get
+        the current version, which export_watermark increments.
+    All the methods are serialized by a single lock.
+    """
+
+    # the number of new records kept in the buffer before they are merged into the sorted arrays
+    _MERGE_THRESHOLD = 65536
+    # the number of new keys kept in the leaderboard buffer before they are merged into the sorted keys
+    _LEADERBOARD_MERGE_THRESHOLD = 4096
+    # batches of records up to this size set their answered bits one at a time, larger ones (e.g. rebuild_stats)
+    # group the bits by word with array operations first
+    _MARK_LOOP_THRESHOLD = 64
+    _USER_BITS = 32
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str, optional): A .npz file to load the data from (if it exists) and to save it to on close.
+                Defaults to None (the data is lost on close).
+        """
+        super().__init__()
+        self.path = path
+        self._lock = threading.RLock()
+        self._categories = []  # code: name, or None if removed
+        self._category_codes = {}
+        self._users = []
+        self._user_codes = {}
+        self._u_version = _Column(np.int64)
+        self._q_category = _Column(np.int32)
+        self._q_type = _Column(np.int8)
+        self._q_difficulty = _Column(np.int8)
+        self._q_alive = _Column(np.bool_)
+        self._q_version = _Column(np.int64)
+        self._q_text = []
+        self._q_correct = []
+        self._q_wrong = []  # a tuple of the wrong answers of every question
+        # the content hash of every question (see DAL.question_hash), None for the removed questions
+        # and the near-duplicates found by backfill_question_hashes
+        self._q_hash = []
+        self._q_ids = {}  # question hash: id
+        self._buckets = {}  # (category code, difficulty): _Column of the ids of the questions
+        self._q_seq = _Column(np.int32)  # the position (from 1) of every question in its bucket
+        self._answered = {}  # (user code, category code, difficulty): AnsweredSeqs
+        self._r_keys = np.empty(0, dtype=np.int64)
+        self._r_correct = np.empty(0, dtype=np.int8)
+        self._r_version = np.empty(0, dtype=np.int64)
+        # key: correct, for records that are not in the sorted arrays yet. export_watermark merges the buffer,
+        # so the buffered records always have the current version.
+        self._r_buffer = {}
+        # the leaderboard: the number of correct and answered questions of every user, the number of users
+        # per number of correct answers (of the users that answered), and the sorted keys with their buffer
+        self._u_correct = _Column(np.int64)
+        self._u_total = _Column(np.int64)
+        self._score_users = np.zeros(1, dtype=np.int64)
+        self._lb_keys = np.empty(0, dtype=np.int64)
+        self._lb_buffer = set()
+        self._version = 1
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def close(self):
+        """ Saves the data to the file given as path, if any."""
+        if self.path:
+            self.save(self.path)
+
+    def save(self, path):
+        """
+        Saves all the data to a single .npz file.
+
+        Args:
+            path (str): The path of the file.
+
+        """
+        with self._lock:
+            self._merge_records()
+            wrong = [a for answers in self._q_wrong for a in answers]
+            # strings are saved as unicode arrays so loading doesn't need pickle
+            np.savez_compressed(
+                path,
+                categories=np.array([c if c is not None else '' for c in self._categories], dtype=str),
+                categories_alive=np.array([c is not None for c in self._categories], dtype=np.bool_),
+                users=np.array(self._users, dtype=str),
+                u_version=self._u_version.values,
+                version=np.array(self._version),
+                q_category=self._q_category.values,
+                q_type=self._q_type.values,
+                q_difficulty=self._q_difficulty.values,
+                q_alive=self._q_alive.values,
+                q_version=self._q_version.values,
+                q_text=np.array([t or '' for t in self._q_text], dtype=str),
+                q_correct=np.array([a or '' for a in self._q_correct], dtype=str),
+                q_wrong=np.array(wrong, dtype=str),
+                q_wrong_offsets=np.cumsum([0] + [len(answers) for answers in self._q_wrong]),
+                q_hash=np.array([h or '' for h in self._q_hash], dtype=str),
+                r_keys=self._r_keys,
+                r_correct=self._r_correct,
+                r_version=self._r_version
+            )
+
+    def load(self, path):
+        """
+        Replaces the data with the data saved in a .npz file by save.
+
+        Args:
+            path (str): The path of the file.
+
+        """
+        with np.load(path) as data, self._lock:
+            alive = data['categories_alive']
+            self._categories = [sys.intern(str(c)) if a else None for c, a in zip(data['categories'], alive)]
+            self._category_codes = {c: i for i, c in enumerate(self._categories) if c is not None}
+            self._users = [str(u) for u in data['users']]
+            self._user_codes = {u: i for i, u in enumerate(self._users)}
+            self._u_version = _Column(np.int64, data['u_version'])
+            self._version = int(data['version'])
+            self._q_category = _Column(np.int32, data['q_category'])
+            self._q_type = _Column(np.int8, data['q_type'])
+            self._q_difficulty = _Column(np.int8, data['q_difficulty'])
+            self._q_alive = _Column(np.bool_, data['q_alive'])
+            self._q_version = _Column(np.int64, data['q_version'])
+            q_alive = data['q_alive']
+            self._q_text = [sys.intern(str(t)) if a else None for t, a in zip(data['q_text'], q_alive)]
+            self._q_correct = [sys.intern(str(t)) if a else None for t, a in zip(data['q_correct'], q_alive)]
+            wrong = [sys.intern(str(a)) for a in data['q_wrong']]
+            offsets = data['q_wrong_offsets']
+            self._q_wrong = [tuple(wrong[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)]
+            self._q_hash = [str(h) or None for h in data['q_hash']]
+            self._q_ids = {h: i for i, h in enumerate(self._q_hash) if h is not None}
+            self._index_buckets()
+            self._r_keys = data['r_keys']
+            self._r_correct = data['r_correct']
+            self._r_version = data['r_version']
+            self._r_buffer = {}
+            self._answered = {}
+            self._mark_answered(self._r_keys)
+            self._index_leaderboard()
+
+    def add_question(self, category, q_type, difficulty, question, correct_answer, wrong_answers=None):
+        if not question or not correct_answer:
+            raise ValueError("Question and correct answer cannot be empty.")
+        try:
+            q_type_value, difficulty_value = Types[q_type].value, Difficulties[difficulty].value
+        except KeyError:
+            raise ValueError(f"Invalid question type {q_type} or difficulty {difficulty}.")
+        q_hash = self.question_hash(question)
+        with self._lock:
+            if q_hash in self._q_ids:
+                raise ValueError(self.DUPLICATE_QUESTION)
+            cat_code = self.add_category(category)
+            self._q_ids[q_hash] = len(self._q_text)
+            self._q_hash.append(q_hash)
+            bucket = self._buckets.get((cat_code, difficulty_value))
+            if bucket is None:
+                bucket = self._buckets[(cat_code, difficulty_value)] = _Column(np.int64)
+            bucket.append(len(self._q_text))
+            self._q_seq.append(len(bucket))
+            self._q_category.append(cat_code)
+            self._q_type.append(q_type_value)
+            self._q_difficulty.append(difficulty_value)
+            self._q_alive.append(True)
+            self._q_version.append(self._version)
+            self._q_text.append(sys.intern(question))
+            self._q_correct.append(sys.intern(correct_answer))
+            answers = wrong_answers if q_type == Types.multiple.name and wrong_answers else []
+            self._q_wrong.append(tuple(sys.intern(a) for a in answers))
+
+    def add_questions(self, questions):
+        # there are no round trips to save, so the default one by one implementation is used
+        return super().add_questions(questions)
+
+    def import_questions(self, amount=1, difficulty=None, category=None):
+        # import questions from the opentdb website
+        questions = super()._import_questions_from_opentdb(amount, difficulty, category)
+
+        # add the questions to the database.
+        # some questions can be duplicates so return how many were added
+        return self.add_questions(questions).added
+
+    def add_category(self, name):
+        if not name:
+            raise ValueError("Category name cannot be empty.")
+        with self._lock:
+            code = self._category_codes.get(name)
+            if code is None:
+                code = len(self._categories)
+                self._categories.append(sys.intern(name))
+                self._category_codes[name] = code
+            return code
+
+    def hide_category(self, name):
+        with self._lock:
+            code = self._category_codes.pop(name, None)
+            if code is None:
+                return False
+            self._categories[code] = None
+            for difficulty in Difficulties:
+                self._buckets.pop((code, difficulty.value), None)
+            for key in [key for key in self._answered if key[1] == code]:
+                del self._answered[key]
+            removed = np.flatnonzero(self._q_alive.values & (self._q_category.values == code))
+            self._q_alive.values[removed] = False
+            for q_id in removed:
+                if self._q_hash[q_id] is not None:
+                    del self._q_ids[self._q_hash[q_id]]
+                self._q_text[q_id] = self._q_correct[q_id] = self._q_hash[q_id] = None
+                self._q_wrong[q_id] = ()
+            # remove the records of the removed questions, and their results from the leaderboard
+            self._merge_records()
+            keep = ~np.isin(self._r_keys >> self._USER_BITS, removed)
+            users = self._r_keys[~keep] & ((1 << self._USER_BITS) - 1)
+            self._move_users(users, -self._r_correct[~keep].astype(np.int64), np.full(len(users), -1))
+            self._r_keys = self._r_keys[keep]
+            self._r_correct = self._r_correct[keep]
+            self._r_version = self._r_version[keep]
+            return True
+
+    def get_categories(self):
+        with self._lock:
+            return [c for c in self._categories if c is not None]
+
+    def get_difficulties(self, category):
+        with self._lock:
+            code = self._category_codes.get(category)
+            if code is None:
+                return []
+            return [d.name for d in Difficulties if (code, d.value) in self._buckets]
+
+    def get_questions(self, amount, category, difficulty, exclude_answered=False, user=None):
+        self._check_answered_user(exclude_answered, user)
+        with self._lock:
+            ids = self._bucket(category, difficulty)
+            # positions in the bucket. O(amount), while np.random.choice without replacement permutes the bucket.
+            if exclude_answered:
+                key = (user, self._category_codes.get(category), Difficulties[difficulty].value)
+                seqs = self._sample_unanswered(len(ids), amount, self._answered.get(key, AnsweredSeqs()))
+            else:
+                seqs = self._sample_seqs(len(ids), amount)
+            picked = [ids[seq - 1] for seq in seqs]
+            return [self._to_question(q_id) for q_id in picked]
+
+    def get_all_questions(self, category, difficulty):
+        with self._lock:
+            # the number of a question is its position in the bucket
+            return [dict(self._to_question(q_id), seq=seq)
+                    for seq, q_id in enumerate(self._bucket(category, difficulty), 1)]
+
+    def get_answered(self, user, category, difficulty):
+        with self._lock:
+            answered = self._answered.get((user, self._category_codes.get(category), Difficulties[difficulty].value))
+            return AnsweredSeqs(answered.words if answered else None)
+
+    def add_user(self, name):
+        if not name:
+            raise ValueError("Username cannot be empty.")
+        with self._lock:
+            code = self._user_codes.get(name)
+            if code is None:
+                code = len(self._users)
+                self._users.append(name)
+                self._user_codes[name] = code
+                self._u_version.append(self._version)
+                self._u_correct.append(0)
+                self._u_total.append(0)
+            return code
+
+    def update_correct(self, question, user, correct):
+        result = self.update_correct_many([(question, user, correct)])
+        if result.failures:
+            raise ValueError(result.failures[0][1])
+
+    def update_correct_many(self, records):
+        result = BatchResult()
+        if not records:
+            return result
+        try:
+            batch = np.array(records, dtype=np.int64).reshape(-1, 3)
+        except (TypeError, ValueError, OverflowError):
+            # some ids are not integers, these records are invalid
+            valid = [i for i, (q, u, _) in enumerate(records)
+                     if isinstance(q, (int, np.integer)) and isinstance(u, (int, np.integer))]
+            for i in sorted(set(range(len(records))) - set(valid)):
+                result.fail(i, "Invalid question or user id.")
+            sub = self.update_correct_many([records[i] for i in valid])
+            result.added = sub.added
+            for index, reason in sub.failures:
+                result.fail(valid[index], reason)
+            return result
+        questions, users, correct = batch[:, 0], batch[:, 1], batch[:, 2]
+        with self._lock:
+            # the whole batch is validated and written with array operations
+            ok = (questions >= 0) & (questions < len(self._q_text)) & (users >= 0) & (users < len(self._users))
+            ok[ok] = self._q_alive.values[questions[ok]]
+            for i in np.flatnonzero(~ok):
+                result.fail(int(i), "Invalid question or user id.")
+            bad_value = ok & (correct != 0) & (correct != 1)
+            for i in np.flatnonzero(bad_value):
+                result.fail(int(i), f"Invalid value {correct[i]} for correct.")
+            ok &= ~bad_value
+            result.added = int(ok.sum())
+            if not result.added:
+                return result
+            # keep only the last answer of each (question, user) pair
+            keys = ((questions[ok] << self._USER_BITS) | users[ok])[::-1]
+            keys, last = np.unique(keys, return_index=True)
+            values = correct[ok][::-1][last].astype(np.int8)
+            self._mark_answered(keys)
+            # the former results of the records, to update the leaderboard: -1 for new records
+            old = np.full(len(keys), -1, dtype=np.int64)
+            # records that are already in the sorted arrays are updated in place
+            if len(self._r_keys):
+                pos = np.searchsorted(self._r_keys, keys).clip(max=len(self._r_keys) - 1)
+                found = self._r_keys[pos] == keys
+                old[found] = self._r_correct[pos[found]]
+                changed = pos[found][self._r_correct[pos[found]] != values[found]]
+                self._r_correct[pos[found]] = values[found]
+                self._r_version[changed] = self._version
+            else:
+                found = np.zeros(len(keys), dtype=np.bool_)
+            buffered = keys[~found].tolist()
+            old[~found] = [self._r_buffer.get(key, -1) for key in buffered]
+            self._r_buffer.update(zip(buffered, values[~found].tolist()))
+            self._move_users(keys & ((1 << self._USER_BITS) - 1), values - old.clip(min=0), (old < 0).astype(np.int64))
+            if len(self._r_buffer) >= self._MERGE_THRESHOLD:
+                self._merge_records()
+        return result
+
+    def get_results_by(self, by, order_by=None, ascending=True, limit=None):
+        if order_by and order_by not in {'Correct', 'Incorrect'}:
+            raise ValueError("order_by must be either 'Correct' or 'Incorrect' (case-sensitive)")
+        if by not in {'category', 'difficulty', 'user'}:
+            raise ValueError(f"Invalid value {by} for parameter by."
+                             f"Can only return results by category, difficulty or user.")
+        with self._lock:
+            self._merge_records()
+            questions = self._r_keys >> self._USER_BITS
+            if by == 'user':
+                groups = (self._r_keys & ((1 << self._USER_BITS) - 1)).astype(np.int64)
+                names, label = self._users, "Name"
+            elif by == 'category':
+                groups = self._q_category.values[questions]
+                names, label = self._categories, "Category"
+            else:
+                groups = self._q_difficulty.values[questions]
+                names, label = [None] + [d.name for d in Difficulties], "Difficulty"
+            total = np.bincount(groups, minlength=len(names))
+            correct = np.bincount(groups, weights=self._r_correct, minlength=len(names)).astype(np.int64)
+            keys = np.flatnonzero(total)
+            result = pd.DataFrame({
+                label: [names[k] for k in keys],
+                "Correct": correct[keys],
+                "Incorrect": total[keys] - correct[keys]
+            })
+        if order_by:
+            result = result.sort_values([order_by, label], ascending=[ascending, True])
+        else:
+            result = result.sort_values(label, ascending=ascending)
+        if limit:
+            result = result.head(limit)
+        return result.reset_index(drop=True)
+
+    def get_leaderboard(self, limit=10, after=None):
+        with self._lock:
+            # the keys below the cursor, best first: from the sorted keys (read backwards in growing chunks,
+            # skipping the stale keys) and from the buffer
+            bound = (after[0] << self._USER_BITS) | after[1] if after else None
+            end = len(self._lb_keys) if after is None else int(np.searchsorted(self._lb_keys, bound))
+            keys = []
+            chunk = limit + 64
+            while end > 0 and len(keys) < limit:
+                candidates = self._lb_keys[max(0, end - chunk):end]
+                keys.extend(candidates[self._is_ranked(candidates)][::-1].tolist())
+                end -= len(candidates)
+                chunk *= 2
+            buffered = np.fromiter(self._lb_buffer, dtype=np.int64, count=len(self._lb_buffer))
+            if bound is not None:
+                buffered = buffered[buffered < bound]
+            keys += buffered[self._is_ranked(buffered)].tolist()
+            keys = sorted(set(keys), reverse=True)[:limit]
+            rows = []
+            for key in keys:
+                correct, user = key >> self._USER_BITS, key & ((1 << self._USER_BITS) - 1)
+                rows.append((correct, user, self._users[user], int(self._u_total.values[user]) - correct))
+            above, counts = 0, {}
+            if rows:
+                above = int(self._score_users[rows[0][0] + 1:].sum())
+                low, top = rows[-1][0], rows[0][0]
+                scores = np.flatnonzero(self._score_users[low + 1:top + 1]) + low + 1
+                counts = dict(zip(scores.tolist(), self._score_users[scores].tolist()))
+        return self._leaderboard_page(rows, above, counts, limit)
+
+    def get_user_rank(self, name):
+        with self._lock:
+            code = self._user_codes.get(name)
+            if code is None or not self._u_total.values[code]:
+                return None
+            correct = int(self._u_correct.values[code])
+            return {'rank': int(self._score_users[correct + 1:].sum()) + 1, 'correct': correct,
+                    'incorrect': int(self._u_total.values[code]) - correct}
+
+    def rebuild_stats(self):
+        # the results are counted from the records on every call,
+        # only the answered questions bitmaps and the leaderboard are rebuilt
+        with self._lock:
+            self._merge_records()
+            self._answered = {}
+            self._mark_answered(self._r_keys)
+            self._index_leaderboard()
+
+    def export_watermark(self):
+        with self._lock:
+            self._merge_records()
+            self._version += 1
+            return self._version
+
+    def export_rows(self, table, since=None, batch_size=10000):
+        self._check_export_table(table)
+        since = since or 0
+        # the columns of the exported rows are copied under the lock (numpy arrays and lists of references),
+        # and the rows are created one batch at a time without blocking the game
+        with self._lock:
+            self._merge_records()
+            if table == 'users':
+                ids = np.flatnonzero(self._u_version.values >= since)
+                columns = [ids, [self._users[i] for i in ids], self._u_version.values[ids]]
+            elif table == 'records':
+                ids = np.flatnonzero(self._r_version >= since)
+                keys = self._r_keys[ids]
+                columns = [keys >> self._USER_BITS, keys & ((1 << self._USER_BITS) - 1), self._r_correct[ids],
+                           self._r_version[ids]]
+            else:
+                ids = np.flatnonzero(self._q_alive.values & (self._q_version.values >= since))
+                if table == 'answers':
+                    counts = [len(self._q_wrong[i]) for i in ids]
+                    columns = [np.repeat(ids, counts), [a for i in ids for a in self._q_wrong[i]],
+                               np.repeat(self._q_version.values[ids], counts)]
+                else:
+                    types = [None] + [t.name for t in Types]
+                    difficulties = [None] + [d.name for d in Difficulties]
+                    columns = [ids, [self._categories[c] for c in self._q_category.values[ids]],
+                               [types[t] for t in self._q_type.values[ids]],
+                               [difficulties[d] for d in self._q_difficulty.values[ids]],
+                               [self._q_text[i] for i in ids], [self._q_correct[i] for i in ids],
+                               self._q_version.values[ids]]
+        for start in range(0, len(columns[0]), batch_size):
+            batch = [c[start:start + batch_size] for c in columns]
+            yield list(zip(*[c.tolist() if isinstance(c, np.ndarray) else c for c in batch]))
+
+    def backfill_question_hashes(self, batch_size=1000):
+        # the questions are in memory, so they are all hashed in a single pass
+        hashed, duplicates = 0, []
+        with self._lock:
+            for q_id in np.flatnonzero(self._q_alive.values).tolist():
+                if self._q_hash[q_id] is not None:
+                    continue
+                q_hash = self.question_hash(self._q_text[q_id])
+                if q_hash in self._q_ids:
+                    duplicates.append(q_id)
+                else:
+                    self._q_ids[q_hash] = q_id
+                    self._q_hash[q_id] = q_hash
+                    hashed += 1
+        return hashed, duplicates
+
+    def _purge_batch(self, batch_size):
+        # hide_category deletes the category at once
+        return None
+
+    def _bucket(self, category, difficulty):
+        # returns the ids of the questions of the given category and difficulty
+        bucket = self._buckets.get((self._category_codes.get(category), Difficulties[difficulty].value))
+        return bucket.values if bucket is not None else np.empty(0, dtype=np.int64)
+
+    def _index_buckets(self):
+        # builds the bucket index and the positions of the questions from the question columns (after load)
+        ids = np.flatnonzero(self._q_alive.values)
+        keys = self._q_category.values[ids].astype(np.int64) * 4 + self._q_difficulty.values[ids]
+        order = np.argsort(keys, kind='stable')  # the ids of every bucket stay in ascending order
+        ids, keys = ids[order], keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else []
+        ends = list(starts[1:]) + [len(keys)]
+        self._buckets = {}
+        seqs = np.zeros(len(self._q_alive), dtype=np.int32)
+        for start, end in zip(starts, ends):
+            self._buckets[(int(keys[start]) // 4, int(keys[start]) % 4)] = _Column(np.int64, ids[start:end])
+            seqs[ids[start:end]] = np.arange(1, end - start + 1)
+        self._q_seq = _Column(np.int32, seqs)
+
+    def _mark_answered(self, keys):
+        # sets the bits of the questions of record keys (unique, of alive questions) in the answered questions
+        # bitmaps of the users. must be called while holding the lock.
+        questions = keys >> self._USER_BITS
+        users = keys & ((1 << self._USER_BITS) - 1)
+        categories = self._q_category.values[questions]
+        difficulties = self._q_difficulty.values[questions]
+        seqs = self._q_seq.values[questions]
+        if len(keys) <= self._MARK_LOOP_THRESHOLD:
+            for user, category, difficulty, seq in zip(users.tolist(), categories.tolist(), difficulties.tolist(),
+                                                       seqs.tolist()):
+                self._answered_seqs((user, category, difficulty)).add(seq)
+            return
+        seqs = seqs.astype(np.int64) - 1
+        words, inverse = np.unique(np.stack([users, categories, difficulties, seqs // AnsweredSeqs.WORD_BITS], axis=1),
+                                   axis=0, return_inverse=True)
+        bits = np.zeros(len(words), dtype=np.int64)
+        np.bitwise_or.at(bits, inverse.reshape(-1), np.left_shift(1, seqs % AnsweredSeqs.WORD_BITS))
+        for (user, category, difficulty, word), word_bits in zip(words.tolist(), bits.tolist()):
+            self._answered_seqs((user, category, difficulty)).merge(word, word_bits)
+
+    def _answered_seqs(self, key):
+        # the answered questions bitmap of a (user code, category code, difficulty), created if it doesn't exist.
+        # must be called while holding the lock.
+        answered = self._answered.get(key)
+        if answered is None:
+            answered = self._answered[key] = AnsweredSeqs()
+        return answered
+
+    def _index_leaderboard(self):
+        # builds the leaderboard from the records (after load). must be called while holding the lock.
+        self._merge_records()
+        users = self._r_keys & ((1 << self._USER_BITS) - 1)
+        total = np.bincount(users, minlength=len(self._users)).astype(np.int64)
+        correct = np.bincount(users, weights=self._r_correct, minlength=len(self._users)).astype(np.int64)
+        self._u_total, self._u_correct = _Column(np.int64, total), _Column(np.int64, correct)
+        ranked = np.flatnonzero(total)
+        self._score_users = np.bincount(correct[ranked], minlength=1).astype(np.int64)
+        self._lb_keys = np.sort((correct[ranked] << self._USER_BITS) | ranked)
+        self._lb_buffer = set()
+
+    def _move_users(self, users, correct, total):
+        # adds the changes of the numbers of correct and answered questions (parallel arrays, a user can repeat)
+        # to the users, and moves them in the leaderboard. must be called while holding the lock.
+        if not len(users):
+            return
+        users, inverse = np.unique(users, return_inverse=True)
+        correct = np.bincount(inverse, weights=correct).astype(np.int64)
+        total = np.bincount(inverse, weights=total).astype(np.int64)
+        moved = (correct != 0) | (total != 0)
+        users, correct, total = users[moved], correct[moved], total[moved]
+        old_correct, old_total = self._u_correct.values[users], self._u_total.values[users]
+        new_correct, new_total = old_correct + correct, old_total + total
+        self._u_correct.values[users] = new_correct
+        self._u_total.values[users] = new_total
+        if len(new_correct) and new_correct.max() >= len(self._score_users):
+            self._score_users = np.concatenate([
+                self._score_users, np.zeros(2 * new_correct.max() + 1 - len(self._score_users), dtype=np.int64)])
+        np.subtract.at(self._score_users, old_correct[old_total > 0], 1)
+        np.add.at(self._score_users, new_correct[new_total > 0], 1)
+        ranked = new_total > 0
+        self._lb_buffer.update(((new_correct[ranked] << self._USER_BITS) | users[ranked]).tolist())
+        if len(self._lb_buffer) >= self._LEADERBOARD_MERGE_THRESHOLD:
+            keys = np.concatenate([self._lb_keys, np.fromiter(self._lb_buffer, dtype=np.int64)])
+            self._lb_keys = np.unique(keys[self._is_ranked(keys)])
+            self._lb_buffer = set()
+
+    def _is_ranked(self, key):
+        # whether a leaderboard key (or an array of keys) is the current key of a user that answered
+        user = key & ((1 << self._USER_BITS) - 1)
+        return (self._u_correct.values[user] == key >> self._USER_BITS) & (self._u_total.values[user] > 0)
+
+    def _to_question(self, q_id):
+        # converts a question row to the format returned by get_questions
+        q_id = int(q_id)
+        question = {
+            'id': q_id,
+            'type': Types(int(self._q_type.values[q_id])).name,
+            'question': self._q_text[q_id],
+            'correct_answer': self._q_correct[q_id]
+        }
+        if question['type'] == Types.multiple.name:
+            question['wrong_answers'] = list(self._q_wrong[q_id])
+        return question
+
+    def _merge_records(self):
+        # merges the buffered records into the sorted arrays. must be called while holding the lock.
+        if not self._r_buffer:
+            return
+        keys = np.concatenate([self._r_keys, np.fromiter(self._r_buffer.keys(), dtype=np.int64)])
+        correct = np.concatenate([self._r_correct, np.fromiter(self._r_buffer.values(), dtype=np.int8)])
+        version = np.concatenate([self._r_version, np.full(len(self._r_buffer), self._version, dtype=np.int64)])
+        order = np.argsort(keys, kind='stable')
+        self._r_keys, self._r_correct, self._r_version = keys[order], correct[order], version[order]
+        self._r_buffer = {}
@@ -1,23 +1,130 @@
 from dal import *
+import json
 import pandas as pd
-from pymongo import MongoClient
-from pymongo.errors import DuplicateKeyError, WriteError
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from bson import Int64, ObjectId, Timestamp, json_util
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReturnDocument, UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError, WriteError
+from slow_query_log import SLOW_QUERIES, SlowQueryLog
 
 
 class DbMongodb(DAL):
     """
     Implementation of the DAL using mongodb with pymongo.
+    A single MongoClient (and its connection pool) is created on first use and shared by all the methods
+        until close() is called.
+
+    The answer records can be stored in one of two layouts (see records_storage):
+        EMBEDDED_RECORDS - a questions array in each user document: {question_id, correct}.
+        RECORDS_COLLECTION - a records collection with a document per answer: {user_id, question_id, correct}
+            and a unique index on (user_id, question_id). Use migrate_mongodb_records.py to move existing
+            embedded records to the collection.
+
+    The questions of every (category, difficulty) bucket are numbered by a seq field, from a counter per bucket
+        in the buckets collection, so get_questions draws random numbers and reads them with index seeks instead
+        of $sample scanning the bucket. Numbers of questions that failed to insert are skipped by redrawing.
+        Use number_mongodb_questions.py to number the questions added before the seq field.
+    The answered questions of every user are kept by bucket in the answered collection, as a bitmap of the seq
+        numbers (see AnsweredSeqs): {user_id, category, difficulty, words: {word index: bits}}. update_correct
+        sets the bits with $bit, get_questions with exclude_answered reads the bitmap of the bucket with a single
+        seek. Use rebuild_stats to build the bitmaps of the records written before they were kept.
+    A removed category is hidden by a removing flag on its document and on the counters of its buckets,
+        and is then deleted by purge_categories in batches of questions found with the bucket index.
+    The leaderboard (see get_leaderboard) is read from an index of the user counters by number of correct answers,
+        and the ranks from the number of users per number of correct answers in the scores collection:
+        {correct, users}, which update_correct maintains from the counters of the users before and after a change.
+    update_correct and update_correct_many write the records, the counters and the answered questions bitmaps
+        in a single transaction when the server supports them (a replica set or a sharded cluster). On a standalone
+        server they are written one after the other, and a process that dies in between leaves the counters off
+        until rebuild_stats.
+        Use rebuild_stats to build the counts of a database created before they were kept.
     """
 
-    def __init__(self):
+    DB_NAME = 'trivia'
+    EMBEDDED_RECORDS = 'embedded'
+    RECORDS_COLLECTION = 'collection'
+    _DUPLICATE_KEY_ERROR = 11000
+    # maximum number of ids in a single $in query
+    _IN_CHUNK_SIZE = 10000
+    # mongodb has no transactional change counter. the versions of the exported rows are times
+    # (the creation time in the ObjectId of questions and users, and a server timestamp set when a record
+    # is written), so an incremental export starts this many seconds before the former export started,
+    # to cover the writes that were in flight and differences between the clocks of the clients and the server.
+    EXPORT_LAG = 60
+    # the versions of the records collection and of the embedded records (per user)
+    _VERSION = {"version": {"$type": "timestamp"}}
+    _RECORDS_VERSION = {"records_version": {"$type": "timestamp"}}
+    # the server topologies that support multi-document transactions
+    _TRANSACTION_TOPOLOGIES = {"ReplicaSetWithPrimary", "Sharded", "LoadBalanced"}
+
+    def __init__(self, host=None, port=None, max_pool_size=100, min_pool_size=0, max_idle_time_ms=None,
+                 connect_timeout_ms=20000, server_selection_timeout_ms=30000, socket_timeout_ms=None,
+                 write_concern=None, records_storage=EMBEDDED_RECORDS, slow_query_log=SLOW_QUERIES):
+        """
+        Args:
+            host (str, optional): The server host name or a mongodb:// uri. Defaults to localhost.
+            port (int, optional): The server port. Defaults to 27017.
+            max_pool_size (int): The maximum number of connections to each server. Defaults to 100.
+            min_pool_size (int): The minimum number of connections kept open to each server. Defaults to 0.
+            max_idle_time_ms (int, optional): Idle connections older than this are closed. Defaults to None (never).
+            connect_timeout_ms (int): Timeout for opening a connection. Defaults to 20000.
+            server_selection_timeout_ms (int): Timeout for finding an available server. Defaults to 30000.
+            socket_timeout_ms (int, optional): Timeout for a single operation. Defaults to None (no timeout).
+            write_concern (dict, optional): Write concern options (e.g. {'w': 1, 'j': False}) used for all writes.
+                Defaults to None (the server default).
+            records_storage (str): Where the answer records are stored. One of EMBEDDED_RECORDS or
+                RECORDS_COLLECTION. Defaults to EMBEDDED_RECORDS.
+            slow_query_log (SlowQueryLog, optional): Where aggregation pipelines slower than its threshold are
+                recorded with their explain output. Defaults to the log of the process
+                (see slow_query_log.SLOW_QUERIES).
+        """
+        if records_storage not in {self.EMBEDDED_RECORDS, self.RECORDS_COLLECTION}:
+            raise ValueError(f"Invalid records storage {records_storage}.")
         super().__init__()
-        with MongoClient() as client:
-            db = client['trivia']
-            # creating indexes for fields that should be unique.
-            # this also allows faster find operations on these fields.
-            db.categories.create_index("name", unique=True)
-            db.questions.create_index("question", unique=True)
-            db.users.create_index("name", unique=True)
+        self.records_storage = records_storage
+        self._slow_queries = slow_query_log
+        self._client_options = {
+            'host': host,
+            'port': port,
+            'maxPoolSize': max_pool_size,
+            'minPoolSize': min_pool_size,
+            'maxIdleTimeMS': max_idle_time_ms,
+            'connectTimeoutMS': connect_timeout_ms,
+            'serverSelectionTimeoutMS': server_selection_timeout_ms,
+            'socketTimeoutMS': socket_timeout_ms
+        }
+        self._write_concern = WriteConcern(**write_concern) if write_concern else None
+        self._client = None
+        self._database = None
+        self._transactions = False
+        self._client_lock = threading.Lock()
+
+    @property
+    def database(self):
+        """ The trivia database of the shared client. The client is created on first access."""
+        if self._database is None:
+            with self._client_lock:
+                if self._database is None:
+                    self._client = MongoClient(**self._client_options)
+                    db = self._client.get_database(self.DB_NAME, write_concern=self._write_concern)
+                    self._create_indexes(db)
+                    topology = getattr(self._client, 'topology_description', None)
+                    self._transactions = topology is not None and \
+                        topology.topology_type_name in self._TRANSACTION_TOPOLOGIES
+                    self._database = db
+        return self._database
+
+    def close(self):
+        """ Closes the shared client. A new client will be created if the instance is used again."""
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+            self._database = None
 
     def add_question(self, category, q_type, difficulty, question, correct_answer, wrong_answers=None):
         q = {
@@ -25,148 +132,827 @@ class DbMongodb(DAL):
             "type": q_type,
             "difficulty": difficulty,
             "question": question,
-            "correct_answer": correct_answer
+            "correct_answer": correct_answer,
+            "hash": self.question_hash(question)
         }
         if wrong_answers:
             q["wrong_answers"] = wrong_answers
-        with MongoClient() as client:
-            db = client['trivia']
-            self.add_category(category)
+        db = self.database
+        self.add_category(category)
+        # a known duplicate doesn't take a sequence number
+        if db.questions.find_one({"hash": q["hash"]}, {"_id": 1}) is not None:
+            raise ValueError(self.DUPLICATE_QUESTION)
+        q["seq"] = self._reserve_seqs(category, difficulty, 1)
+        try:
+            db.questions.insert_one(q)
+        except DuplicateKeyError:
+            raise ValueError(self.DUPLICATE_QUESTION)
+        except WriteError:
+            # at the time of writing this code, document validation error (jsonSchema) doesn't supply
+            # additional information about the specific field that failed validation.
+            # can add some checks on type and difficulty here to narrow it down
+            raise ValueError("Validation failed. Check that all the parameters are valid.")
+
+    def add_questions(self, questions):
+        result = BatchResult()
+        docs = []
+        indexes = []  # the index in the batch of each document in docs
+        seen = set()
+        for i, q in enumerate(questions):
             try:
-                db.questions.insert_one(q)
-            except DuplicateKeyError:
-                raise ValueError("Question already exists.")
-            except WriteError:
-                # at the time of writing this code, document validation error (jsonSchema) doesn't supply
-                # additional information about the specific field that failed validation.
-                # can add some checks on type and difficulty here to narrow it down
-                raise ValueError("Validation failed. Check that all the parameters are valid.")
+                category, q_type, difficulty, question, correct_answer, wrong_answers = self._validate_question(q)
+            except ValueError as e:
+                result.fail(i, e)
+                continue
+            doc = {
+                "category": category,
+                "type": q_type,
+                "difficulty": difficulty,
+                "question": question,
+                "correct_answer": correct_answer,
+                "hash": self.question_hash(question)
+            }
+            if doc["hash"] in seen:
+                result.fail(i, self.DUPLICATE_QUESTION)
+                continue
+            seen.add(doc["hash"])
+            if wrong_answers:
+                doc["wrong_answers"] = wrong_answers
+            docs.append(doc)
+            indexes.append(i)
+        if not docs:
+            return result
+
+        # the known duplicates are dropped with a single lookup, so they don't take sequence numbers
+        db = self.database
+        existing = {doc["hash"] for doc in db.questions.find({"hash": {"$in": list(seen)}}, {"hash": 1})}
+        new_docs, new_indexes = [], []
+        for i, doc in zip(indexes, docs):
+            if doc["hash"] in existing:
+                result.fail(i, self.DUPLICATE_QUESTION)
+            else:
+                new_docs.append(doc)
+                new_indexes.append(i)
+        docs, indexes = new_docs, new_indexes
+        if not docs:
+            return result
+
+        # resolve every category of the batch once and number the questions of every bucket
+        buckets = defaultdict(list)
+        for doc in docs:
+            buckets[(doc["category"], doc["difficulty"])].append(doc)
+        # the questions of a category that can't be added (e.g. it is being removed) fail
+        failed = {}
+        for category in {category for category, _ in buckets}:
+            try:
+                self.add_category(category)
+            except ValueError as e:
+                failed[category] = e
+        if failed:
+            kept = []
+            for i, doc in zip(indexes, docs):
+                if doc["category"] in failed:
+                    result.fail(i, failed[doc["category"]])
+                else:
+                    kept.append((i, doc))
+            indexes, docs = [i for i, _ in kept], [doc for _, doc in kept]
+            if not docs:
+                return result
+        for (category, difficulty), bucket_docs in buckets.items():
+            if category in failed:
+                continue
+            first = self._reserve_seqs(category, difficulty, len(bucket_docs))
+            for seq, doc in enumerate(bucket_docs, first):
+                doc["seq"] = seq
+        try:
+            result.added = len(db.questions.insert_many(docs, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            result.added = e.details['nInserted']
+            for error in e.details['writeErrors']:
+                if error['code'] == self._DUPLICATE_KEY_ERROR:
+                    reason = self.DUPLICATE_QUESTION
+                else:
+                    reason = "Validation failed. Check that all the parameters are valid."
+                result.fail(indexes[error['index']], reason)
+        return result
 
     def import_questions(self, amount=1, difficulty=None, category=None):
         # import questions from the opentdb website
         questions = super()._import_questions_from_opentdb(amount, difficulty, category)
 
-        # add the questions to the database
-        count = 0  # some questions can be duplicates so count how many were added
-        for q in questions:
-            try:
-                self.add_question(q['category'], q['type'], q['difficulty'], q['question'],
-                                  q['correct_answer'], q['incorrect_answers'])
-                count += 1
-            except ValueError:  # duplicate question
-                pass
-        return count
+        # add the questions to the database.
+        # some questions can be duplicates so return how many were added
+        return self.add_questions(questions).added
 
     def add_category(self, name):
-        with MongoClient() as client:
-            db = client['trivia']
-            try:
-                return db.categories.insert_one({"name": name}).inserted_id
-            except DuplicateKeyError:
-                return db.categories.find_one({"name": name})['_id']
-            except WriteError:
-                raise ValueError("Category name cannot be empty.")
-
-    def remove_category(self, name):
-        with MongoClient() as client:
-            db = client['trivia']
-            # delete records of questions answered in the given category
-            records_in_category = db.users.aggregate([
-                {"$unwind": "$questions"},
-                {"$lookup": {
-                    "from": "questions",
-                    "localField": "questions.question_id",
-                    "foreignField": "_id",
-                    "as": "details"
-                }},
-                {"$unwind": "$details"},
-                {"$match": {"details.category": name}},
-                {"$project": {"question_id": "$questions.question_id"}},
-                {"$group": {"_id": "$_id", "questions": {"$push": "$question_id"}}}
-            ])
-            for record in records_in_category:
-                db.users.update_one(
-                    {"_id": record["_id"]},
-                    {"$pull": {"questions": {"question_id": {"$in": record["questions"]}}}}
-                )
-            # delete questions of the given category
-            db.questions.delete_many({"category": name})
-            # delete the category
-            db.categories.delete_one({"name": name})
+        cat_id = self._category_ids.get(name)
+        if cat_id is not None:
+            return cat_id
+        db = self.database
+        try:
+            cat_id = db.categories.insert_one({"name": name}).inserted_id
+        except DuplicateKeyError:
+            doc = db.categories.find_one({"name": name})
+            if doc.get("removing"):
+                raise ValueError(f"Category {name} is being removed.")
+            cat_id = doc['_id']
+        except WriteError:
+            raise ValueError("Category name cannot be empty.")
+        self._category_ids.put(name, cat_id)
+        self._category_list.clear()
+        return cat_id
+
+    def hide_category(self, name):
+        self._category_ids.pop(name)
+        self._category_list.clear()
+        db = self.database
+        hidden = db.categories.update_one({"name": name, "removing": {"$ne": True}},
+                                          {"$set": {"removing": True}}).modified_count > 0
+        # get_questions reads the counters of the buckets first, so it doesn't need another lookup
+        db.buckets.update_many({"category": name}, {"$set": {"removing": True}})
+        db.stats.delete_one({"by": "category", "key": name})
+        return hidden
 
     def get_categories(self):
-        with MongoClient() as client:
-            db = client['trivia']
-            return [cat['name'] for cat in db.categories.find()]
+        categories = self._category_list.get('all')
+        if categories is None:
+            categories = [cat['name'] for cat in self.database.categories.find({"removing": {"$ne": True}})]
+            self._category_list.put('all', categories)
+        return list(categories)
 
     def get_difficulties(self, category):
-        with MongoClient() as client:
-            db = client['trivia']
-            difficulties = db.questions.distinct("difficulty", {"category": category})
-            return sorted([d for d in difficulties], key=lambda x: Difficulties[x].value)
-
-    def get_questions(self, amount, category, difficulty):
-        with MongoClient() as client:
-            db = client['trivia']
-            questions = db.questions.aggregate([
+        db = self.database
+        if self._is_hidden(category):
+            return []
+        difficulties = db.questions.distinct("difficulty", {"category": category})
+        return sorted([d for d in difficulties], key=lambda x: Difficulties[x].value)
+
+    def get_questions(self, amount, category, difficulty, exclude_answered=False, user=None):
+        self._check_answered_user(exclude_answered, user)
+        db = self.database
+        bucket = db.buckets.find_one({"category": category, "difficulty": difficulty})
+        if bucket is not None and bucket.get("removing"):
+            return []
+        if bucket is None:
+            # the questions of the bucket were not numbered (see number_questions), so they aren't in the
+            # answered questions bitmaps either
+            if self._is_hidden(category):
+                return []
+            return self._aggregate(db.questions, [
                 {"$match": {"category": category, "difficulty": difficulty}},
                 {"$sample": {"size": amount}},
-                {"$project": {"_id": 0, "id": "$_id", "type": 1, "question": 1, "correct_answer": 1, "wrong_answers": 1}}
+                {"$project": {"_id": 0, "id": "$_id", "type": 1, "question": 1, "correct_answer": 1,
+                              "wrong_answers": 1}}
             ])
-            return [q for q in questions]
+        # random numbers of the bucket are read with seeks of the (category, difficulty, seq) index. numbers
+        # without a question (that failed to insert) are replaced by new draws, which keeps the sample uniform.
+        answered = None
+        if exclude_answered:
+            answered = self.get_answered(user, category, difficulty)
+        picked, tried = [], set()
+        while len(picked) < amount:
+            if answered is None:
+                seqs = self._sample_seqs(bucket["size"], amount - len(picked), tried)
+            else:
+                seqs = self._sample_unanswered(bucket["size"], amount - len(picked), answered, tried)
+            if not seqs:
+                break
+            tried.update(seqs)
+            picked += db.questions.find(
+                {"category": category, "difficulty": difficulty, "seq": {"$in": seqs}},
+                {"_id": 1, "type": 1, "question": 1, "correct_answer": 1, "wrong_answers": 1}
+            )
+        random.shuffle(picked)
+        return [self._to_question(q) for q in picked]
+
+    def get_all_questions(self, category, difficulty):
+        if self._is_hidden(category):
+            return []
+        questions = self.database.questions.find(
+            {"category": category, "difficulty": difficulty},
+            {"_id": 1, "type": 1, "question": 1, "correct_answer": 1, "wrong_answers": 1, "seq": 1}
+        )
+        return [dict(self._to_question(q), seq=q.get("seq")) for q in questions]
+
+    def get_answered(self, user, category, difficulty):
+        doc = self.database.answered.find_one({"user_id": user, "category": category, "difficulty": difficulty},
+                                              {"words": 1})
+        return AnsweredSeqs(doc["words"] if doc else None)
 
     def add_user(self, name):
-        with MongoClient() as client:
-            db = client['trivia']
-            try:
-                return db.users.insert_one({"name": name}).inserted_id
-            except DuplicateKeyError:
-                return db.users.find_one({"name": name})['_id']
-            except WriteError:
-                raise ValueError("Username cannot be empty.")
+        user_id = self._user_ids.get(name)
+        if user_id is not None:
+            return user_id
+        db = self.database
+        try:
+            user_id = db.users.insert_one({"name": name}).inserted_id
+        except DuplicateKeyError:
+            user_id = db.users.find_one({"name": name})['_id']
+        except WriteError:
+            raise ValueError("Username cannot be empty.")
+        self._user_ids.put(name, user_id)
+        return user_id
 
     def update_correct(self, question, user, correct):
-        with MongoClient() as client:
-            db = client['trivia']
-            result = db.users.update_one({"_id": user, "questions": {"$elemMatch": {"question_id": question}}}, {
-                "$set": {"questions.$.correct": correct}
-            })
-            if result.matched_count == 0:
-                db.users.update_one({"_id": user}, {
-                    "$addToSet": {"questions": {"question_id": question, "correct": correct}}
-                })
+        # the record is set with a find-and-modify that returns the former result (see _set_record), and the
+        # counters and the answered questions bitmap are updated from it in the same transaction
+        # (see _in_transaction)
+        correct = int(correct)
+        details = self.database.questions.find_one({"_id": question}, {"category": 1, "difficulty": 1, "seq": 1})
+        if details is None:
+            raise ValueError("Invalid question or user id.")
+
+        def write(session):
+            old = self._set_record(question, user, correct, session)
+            self._apply_changes([(details, user, correct, old)], session)
+        self._in_transaction(write)
+
+    def update_correct_many(self, records):
+        # the former results of the batch are read with a single query and the records are then set with
+        # a single bulk write, in the same transaction as the counters and the answered questions bitmaps
+        # (see _in_transaction). a record answered concurrently fails the transaction, which is then repeated.
+        result = BatchResult()
+        db = self.database
+        # only the last answer of a (question, user) pair is kept, as if they were set one after the other
+        latest = {}
+        for i, (question, user, correct) in enumerate(records):
+            latest[(question, user)] = (i, int(correct))
+        question_ids = list({question for question, _ in latest})
+        details = {q["_id"]: q for q in db.questions.find({"_id": {"$in": question_ids}},
+                                                          {"category": 1, "difficulty": 1, "seq": 1})}
+        for (question, user), (i, _) in list(latest.items()):
+            if question not in details:
+                result.fail(i, "Invalid question or user id.")
+                del latest[(question, user)]
+        if not latest:
+            return result
+
+        def write(session):
+            old, missing_users = self._read_records(list(latest), session)
+            records = {pair: value for pair, value in latest.items() if pair[1] not in missing_users}
+            if not records:
+                return missing_users
+            new = self._write_records(records, old, session)
+            changes = []
+            for pair, (_, correct) in records.items():
+                # a record that was neither read nor inserted was added concurrently, which counted it
+                former = None if pair in new else old.get(pair, correct)
+                changes.append((details[pair[0]], pair[1], correct, former))
+            self._apply_changes(changes, session)
+            return missing_users
+        missing_users = self._in_transaction(write)
+        for (question, user), (i, _) in latest.items():
+            if user in missing_users:
+                result.fail(i, "Invalid question or user id.")
+            else:
+                result.added += 1
+        return result
 
     def get_results_by(self, by, order_by=None, ascending=True, limit=None):
-        pipeline = [{"$unwind": "$questions"}]
-        if by != 'user':
-            pipeline.append({"$lookup": {
-                "from": "questions",
-                "localField": "questions.question_id",
-                "foreignField": "_id",
-                "as": "details"
-            }})
-            pipeline.append({"$unwind": "$details"})
-            pipeline.append({"$project": {"_id": 0, f"{by}": f"$details.{by}", "questions": 1}})
+        if by not in {'category', 'difficulty', 'user'}:
+            raise ValueError(f"Invalid value {by} for parameter by."
+                             f"Can only return results by category, difficulty or user.")
+        label = "Name" if by == 'user' else by.capitalize()
+        sort_field = order_by.lower() if order_by else "key"
+        # the counters of users are kept by id, the names are looked up for the returned users only
+        lookup_names = [
+            {"$lookup": {"from": "users", "localField": "key", "foreignField": "_id", "as": "user"}},
+            {"$unwind": "$user"},
+            {"$addFields": {"key": "$user.name"}}
+        ]
+        pipeline = [{"$match": {"by": by, "$or": [{"correct": {"$gt": 0}}, {"incorrect": {"$gt": 0}}]}}]
+        if by == 'user' and not order_by:
+            pipeline += lookup_names
+        sort = {sort_field: 1 if ascending else -1}
+        if sort_field != "key":
+            sort["key"] = 1  # a stable order for ties
+        pipeline.append({"$sort": sort})
+        if limit is not None:
+            pipeline.append({"$limit": limit})
+        if by == 'user' and order_by:
+            pipeline += lookup_names
+        pipeline.append({"$project": {"_id": 0, label: "$key", "Correct": "$correct", "Incorrect": "$incorrect"}})
+        results = self._aggregate(self.database.stats, pipeline)
+        return pd.DataFrame(results, columns=[label, "Correct", "Incorrect"])
+
+    def get_leaderboard(self, limit=10, after=None):
+        db = self.database
+        query = {"by": "user", "$nor": [{"correct": 0, "incorrect": 0}]}
+        if after:
+            query["$or"] = [{"correct": {"$lt": after[0]}}, {"correct": after[0], "key": {"$lt": after[1]}}]
+        pipeline = [
+            {"$match": query},
+            {"$sort": {"correct": -1, "key": -1}},
+            {"$limit": limit},
+            {"$lookup": {"from": "users", "localField": "key", "foreignField": "_id", "as": "user"}},
+            {"$unwind": "$user"},
+            {"$project": {"_id": 0, "key": 1, "name": "$user.name", "correct": 1, "incorrect": 1}}
+        ]
+        rows = [(doc["correct"], doc["key"], doc["name"], doc["incorrect"])
+                for doc in self._aggregate(db.stats, pipeline)]
+        above, counts = 0, {}
+        if rows:
+            above = self._count_users_above(rows[0][0])
+            counts = {doc["correct"]: doc["users"]
+                      for doc in db.scores.find({"correct": {"$gt": rows[-1][0], "$lte": rows[0][0]}})}
+        return self._leaderboard_page(rows, above, counts, limit)
+
+    def get_user_rank(self, name):
+        db = self.database
+        user = db.users.find_one({"name": name}, {"_id": 1})
+        stats = user and db.stats.find_one({"by": "user", "key": user["_id"]})
+        if not stats or stats["correct"] + stats["incorrect"] == 0:
+            return None
+        return {'rank': self._count_users_above(stats["correct"]) + 1,
+                'correct': stats["correct"], 'incorrect': stats["incorrect"]}
+
+    def rebuild_stats(self):
+        # the counters are computed into a new collection which then replaces the current one,
+        # so readers never see partial counters.
+        db = self.database
+        db.stats_rebuild.drop()
+        scores = defaultdict(int)
+        for by in ['category', 'difficulty', 'user']:
+            docs = [{"by": by, "key": key, "correct": correct, "incorrect": incorrect}
+                    for key, correct, incorrect in self._recompute_results(by)]
+            if docs:
+                db.stats_rebuild.insert_many(docs)
+            if by == 'user':
+                for doc in docs:
+                    scores[doc["correct"]] += 1
+        db.stats_rebuild.create_index([("by", ASCENDING), ("key", ASCENDING)], unique=True)
+        db.stats_rebuild.create_index([("by", ASCENDING), ("correct", DESCENDING), ("key", DESCENDING)])
+        db.stats_rebuild.rename("stats", dropTarget=True)
+        db.scores_rebuild.drop()
+        if scores:
+            db.scores_rebuild.insert_many([{"correct": correct, "users": users} for correct, users in scores.items()])
+        db.scores_rebuild.create_index("correct", unique=True)
+        db.scores_rebuild.rename("scores", dropTarget=True)
+
+        # the answered questions bitmaps, from the numbered questions of the records
+        collection, pipeline = self._records_source()
+        pipeline += [
+            {"$lookup": {"from": "questions", "localField": "question_id", "foreignField": "_id", "as": "details"}},
+            {"$unwind": "$details"},
+            {"$match": {"details.seq": {"$exists": True}}},
+            {"$project": {"user_id": 1, "category": "$details.category", "difficulty": "$details.difficulty",
+                          "seq": "$details.seq"}}
+        ]
+        answered = defaultdict(AnsweredSeqs)
+        for doc in self._aggregate(collection, pipeline, allowDiskUse=True):
+            answered[(doc["user_id"], doc["category"], doc["difficulty"])].add(doc["seq"])
+        db.answered_rebuild.drop()
+        docs = [{"user_id": user, "category": category, "difficulty": difficulty,
+                 "words": {str(word): Int64(bits) for word, bits in seqs.words.items()}}
+                for (user, category, difficulty), seqs in answered.items()]
+        if docs:
+            db.answered_rebuild.insert_many(docs)
+        db.answered_rebuild.create_index([("user_id", ASCENDING), ("category", ASCENDING), ("difficulty", ASCENDING)],
+                                         unique=True)
+        db.answered_rebuild.rename("answered", dropTarget=True)
+
+    def export_watermark(self):
+        return (int(time.time()) - self.EXPORT_LAG) << 32
+
+    def export_rows(self, table, since=None, batch_size=10000):
+        self._check_export_table(table)
+        db = self.database
+        encode = self.encode_id
+        if table in {'questions', 'answers', 'users'}:
+            # these documents are never changed, so their version is the creation time in their ObjectId
+            query = {}
+            if since is not None:
+                query = {"_id": {"$gte": ObjectId.from_datetime(datetime.fromtimestamp(since >> 32, timezone.utc))}}
+            if table == 'users':
+                docs = db.users.find(query, {"name": 1}, batch_size=batch_size)
+                to_rows = lambda d: [(encode(d["_id"]), d["name"], self._id_version(d["_id"]))]
+            elif table == 'answers':
+                query["wrong_answers"] = {"$exists": True}
+                docs = db.questions.find(query, {"wrong_answers": 1}, batch_size=batch_size)
+                to_rows = lambda d: [(encode(d["_id"]), a, self._id_version(d["_id"])) for a in d["wrong_answers"]]
+            else:
+                docs = db.questions.find(query, {"wrong_answers": 0}, batch_size=batch_size)
+                to_rows = lambda d: [(encode(d["_id"]), d["category"], d["type"], d["difficulty"], d["question"],
+                                      d["correct_answer"], self._id_version(d["_id"]))]
+        elif self.records_storage == self.RECORDS_COLLECTION:
+            query = {} if since is None else {"version": {"$gte": Timestamp(since >> 32, since & 0xffffffff)}}
+            docs = db.records.find(query, {"_id": 0}, batch_size=batch_size)
+            to_rows = lambda d: [(encode(d["question_id"]), encode(d["user_id"]), d["correct"],
+                                  self._timestamp_version(d.get("version")))]
         else:
-            by = "name"
+            # the embedded records of a user share the version of the user's latest record change
+            query = {} if since is None else {"records_version": {"$gte": Timestamp(since >> 32, since & 0xffffffff)}}
+            query["questions"] = {"$exists": True}
+            docs = db.users.find(query, {"questions": 1, "records_version": 1}, batch_size=batch_size)
+            to_rows = lambda d: [(encode(r["question_id"]), encode(d["_id"]), r["correct"],
+                                  self._timestamp_version(d.get("records_version"))) for r in d["questions"]]
+        batch = []
+        for doc in docs:
+            batch += to_rows(doc)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        if batch:
+            yield batch
+
+    def backfill_question_hashes(self, batch_size=1000):
+        questions = self.database.questions
+        hashed, duplicates = 0, []
+        query = {"hash": {"$exists": False}}
+        while True:
+            docs = list(questions.find(query, {"question": 1}).sort("_id", ASCENDING).limit(batch_size))
+            if not docs:
+                break
+            query["_id"] = {"$gt": docs[-1]["_id"]}  # the near-duplicates are not read again
+            ops = [UpdateOne({"_id": doc["_id"], "hash": {"$exists": False}},
+                             {"$set": {"hash": self.question_hash(doc["question"])}}) for doc in docs]
+            try:
+                hashed += questions.bulk_write(ops, ordered=False).modified_count
+            except BulkWriteError as e:
+                # a hash that belongs to another question is not stored, and fails on the unique index
+                if any(error['code'] != self._DUPLICATE_KEY_ERROR for error in e.details['writeErrors']):
+                    raise
+                hashed += e.details['nModified']
+                duplicates += [docs[error['index']]["_id"] for error in e.details['writeErrors']]
+        return hashed, duplicates
+
+    def number_questions(self, batch_size=1000):
+        """
+        Numbers the questions that were added before the seq field, after the questions of their bucket.
+            Until then get_questions doesn't pick them (unless their bucket has no numbered questions).
+            Can be stopped and run again at any time.
+
+        Args:
+            batch_size (int): The number of questions numbered with a single bulk write. Defaults to 1000.
+
+        Returns:
+            int: The number of numbered questions.
+
+        """
+        questions = self.database.questions
+        numbered = 0
+        query = {"seq": {"$exists": False}}
+        while True:
+            docs = list(questions.find(query, {"category": 1, "difficulty": 1}).sort("_id", ASCENDING)
+                        .limit(batch_size))
+            if not docs:
+                break
+            query["_id"] = {"$gt": docs[-1]["_id"]}
+            buckets = defaultdict(list)
+            for doc in docs:
+                buckets[(doc["category"], doc["difficulty"])].append(doc["_id"])
+            ops = []
+            for (category, difficulty), ids in buckets.items():
+                first = self._reserve_seqs(category, difficulty, len(ids))
+                ops += [UpdateOne({"_id": q_id, "seq": {"$exists": False}}, {"$set": {"seq": seq}})
+                        for seq, q_id in enumerate(ids, first)]
+            numbered += questions.bulk_write(ops, ordered=False).modified_count
+        return numbered
+
+    def _purge_batch(self, batch_size):
+        db = self.database
+        cat = db.categories.find_one({"removing": True}, {"name": 1})
+        if cat is None:
+            return None
+        name = cat["name"]
+        batch_size = min(batch_size, self._IN_CHUNK_SIZE)
+        # the numbered questions are found with the bucket index, the others (see number_questions) last
+        question_ids = [q["_id"] for q in db.questions.find({"category": name, "seq": {"$exists": True}},
+                                                           {"_id": 1}).limit(batch_size)]
+        if not question_ids:
+            question_ids = [q["_id"] for q in db.questions.find({"category": name}, {"_id": 1}).limit(batch_size)]
+        if question_ids:
+            # the records of the questions are counted, deleted, and only then subtracted from the difficulty and
+            # user counters. there is no transaction, so if the process dies in between the counters keep the
+            # deleted records (until rebuild_stats), but a resumed purge never subtracts them twice: their
+            # questions are deleted last, and the next batch finds them without records.
+            deltas = defaultdict(lambda: [0, 0])
+            for by in ['difficulty', 'user']:
+                for key, correct, incorrect in self._recompute_results(by, question_ids):
+                    deltas[(by, key)][0] -= correct
+                    deltas[(by, key)][1] -= incorrect
+            if self.records_storage == self.RECORDS_COLLECTION:
+                # using the index on question_id
+                db.records.delete_many({"question_id": {"$in": question_ids}})
+            else:
+                # using the index on questions.question_id
+                db.users.update_many({"questions.question_id": {"$in": question_ids}},
+                                     {"$pull": {"questions": {"question_id": {"$in": question_ids}}}})
+            self._inc_stats(deltas)
+            db.questions.delete_many({"_id": {"$in": question_ids}})
+            return name, len(question_ids), False
+        answered_ids = [doc["_id"] for doc in db.answered.find({"category": name}, {"_id": 1}).limit(batch_size)]
+        if answered_ids:
+            db.answered.delete_many({"_id": {"$in": answered_ids}})
+            return name, 0, False
+        # delete the sequence counters of the buckets, and the category along with its counters
+        db.buckets.delete_many({"category": name})
+        db.stats.delete_one({"by": "category", "key": name})
+        db.categories.delete_one({"_id": cat["_id"]})
+        return name, 0, True
+
+    def _is_hidden(self, category):
+        # whether the category is being removed (see hide_category)
+        return self.database.categories.find_one({"name": category, "removing": True}, {"_id": 1}) is not None
+
+    def _reserve_seqs(self, category, difficulty, count):
+        # reserves count consecutive sequence numbers of a bucket (see get_questions) and returns the first one.
+        # the counter is created by the first reservation of the bucket.
+        query = {"category": category, "difficulty": difficulty}
+        update = {"$inc": {"size": count}}
+        try:
+            bucket = self.database.buckets.find_one_and_update(query, update, upsert=True,
+                                                               return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:  # another client created the counter at the same time
+            bucket = self.database.buckets.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+        return bucket["size"] - count + 1
+
+    @staticmethod
+    def _id_version(object_id):
+        # the export version of a document that is never changed: its creation time
+        return int(object_id.generation_time.timestamp()) << 32
+
+    @staticmethod
+    def _timestamp_version(timestamp):
+        # the export version of a bson timestamp set by $currentDate. 0 for documents written without it.
+        return (timestamp.time << 32 | timestamp.inc) if timestamp else 0
+
+    def _in_transaction(self, write):
+        # runs write(session) in a transaction and returns its result, so the records, the counters and the
+        # answered questions bitmaps change together. the transaction is repeated after transient errors
+        # (e.g. a write conflict with a concurrent answer) and after duplicate keys of counters created by
+        # a concurrent transaction, which then exist. without transactions it runs write(None).
+        self.database  # connects and finds whether the server supports transactions
+        if not self._transactions:
+            return write(None)
+        while True:
+            try:
+                with self._client.start_session() as session:
+                    return session.with_transaction(write)
+            except DuplicateKeyError:
+                pass
+            except BulkWriteError as e:
+                if any(error['code'] != self._DUPLICATE_KEY_ERROR for error in e.details['writeErrors']):
+                    raise
+
+    def _set_record(self, question, user, correct, session=None):
+        # helper method for update_correct. sets the record of the user for the question and
+        # returns the former result, or None if the user didn't answer the question before.
+        db = self.database
+        if self.records_storage == self.RECORDS_COLLECTION:
+            # a single round trip that inserts the record or updates the existing one
+            before = db.records.find_one_and_update({"user_id": user, "question_id": question},
+                                                    {"$set": {"correct": correct}, "$currentDate": self._VERSION},
+                                                    projection={"correct": 1}, upsert=True,
+                                                    return_document=ReturnDocument.BEFORE, session=session)
+            return before["correct"] if before else None
+        before = db.users.find_one_and_update({"_id": user, "questions": {"$elemMatch": {"question_id": question}}},
+                                              {"$set": {"questions.$.correct": correct},
+                                               "$currentDate": self._RECORDS_VERSION},
+                                              projection={"questions": {"$elemMatch": {"question_id": question}}},
+                                              return_document=ReturnDocument.BEFORE, session=session)
+        if before:
+            return before["questions"][0]["correct"]
+        result = db.users.update_one({"_id": user, "questions.question_id": {"$ne": question}},
+                                     {"$push": {"questions": {"question_id": question, "correct": correct}},
+                                      "$currentDate": self._RECORDS_VERSION}, session=session)
+        if result.matched_count == 0:
+            if db.users.count_documents({"_id": user}, limit=1, session=session) == 0:
+                raise ValueError("Invalid question or user id.")
+            return self._set_record(question, user, correct, session)  # the record was added concurrently
+        return None
+
+    def _read_records(self, pairs, session=None):
+        # helper method for update_correct_many. reads the records of the given (question, user) pairs with
+        # a single query. returns {(question, user): correct} of the existing records, and the set of users
+        # that don't exist (only for EMBEDDED_RECORDS, the records collection doesn't check them).
+        db = self.database
+        question_ids = list({question for question, _ in pairs})
+        user_ids = list({user for _, user in pairs})
+        if self.records_storage == self.RECORDS_COLLECTION:
+            # using the unique index on (user_id, question_id). the query can match records of other pairs
+            # of the same users and questions, which are skipped.
+            docs = db.records.find({"user_id": {"$in": user_ids}, "question_id": {"$in": question_ids}},
+                                   {"_id": 0, "user_id": 1, "question_id": 1, "correct": 1}, session=session)
+            return {(d["question_id"], d["user_id"]): d["correct"] for d in docs}, set()
+        pipeline = [{"$match": {"_id": {"$in": user_ids}}},
+                    {"$project": {"questions": {"$filter": {"input": {"$ifNull": ["$questions", []]}, "as": "r",
+                                                            "cond": {"$in": ["$$r.question_id", question_ids]}}}}}]
+        old, found = {}, set()
+        for doc in db.users.aggregate(pipeline, session=session):
+            found.add(doc["_id"])
+            for r in doc["questions"]:
+                old[(r["question_id"], doc["_id"])] = r["correct"]
+        return old, set(user_ids) - found
+
+    def _write_records(self, records, old, session=None):
+        # helper method for update_correct_many. sets the records {(question, user): (index, correct)}
+        # with a single bulk write, given the existing ones read by _read_records.
+        # returns the set of (question, user) pairs that were inserted.
+        pairs = list(records)
+        if self.records_storage == self.RECORDS_COLLECTION:
+            ops = [UpdateOne({"user_id": user, "question_id": question},
+                             {"$set": {"correct": records[(question, user)][1]}, "$currentDate": self._VERSION},
+                             upsert=True)
+                   for question, user in pairs]
+            result = self.database.records.bulk_write(ops, ordered=False, session=session)
+            return {pairs[i] for i in result.upserted_ids}
+        ops = []
+        for question, user in pairs:
+            correct = records[(question, user)][1]
+            if (question, user) in old:
+                ops.append(UpdateOne({"_id": user, "questions.question_id": question},
+                                     {"$set": {"questions.$.correct": correct},
+                                      "$currentDate": self._RECORDS_VERSION}))
+            else:
+                # doesn't match if the record was added concurrently, which then keeps the other answer
+                ops.append(UpdateOne({"_id": user, "questions.question_id": {"$ne": question}},
+                                     {"$push": {"questions": {"question_id": question, "correct": correct}},
+                                      "$currentDate": self._RECORDS_VERSION}))
+        self.database.users.bulk_write(ops, ordered=False, session=session)
+        return {pair for pair in pairs if pair not in old}
+
+    def _apply_changes(self, changes, session=None):
+        # updates the counters and the answered questions bitmaps for the records that were set.
+        # changes is a list of (question details, user, correct, former result or None)
+        deltas = defaultdict(lambda: [0, 0])
+        answered = defaultdict(AnsweredSeqs)  # (user, category, difficulty): the bits of the batch
+        for q, user, correct, old in changes:
+            if "seq" in q:
+                answered[(user, q["category"], q["difficulty"])].add(q["seq"])
+            if old == correct:
+                continue
+            for key in [("category", q["category"]), ("difficulty", q["difficulty"]), ("user", user)]:
+                deltas[key][0] += correct - (old or 0)
+                deltas[key][1] += (1 - correct) - (0 if old is None else 1 - old)
+        self._inc_stats(deltas, session)
+        self._set_answered(answered, session)
+
+    def _set_answered(self, answered, session=None):
+        # sets bits in the answered questions bitmaps of the users.
+        # answered is a dictionary of (user, category, difficulty): AnsweredSeqs of the bits to set
+        ops = [UpdateOne({"user_id": user, "category": category, "difficulty": difficulty},
+                         {"$bit": {f"words.{word}": {"or": Int64(bits)} for word, bits in seqs.words.items()}},
+                         upsert=True)
+               for (user, category, difficulty), seqs in answered.items()]
+        self._bulk_upsert(self.database.answered, ops, session)
+
+    def _inc_stats(self, deltas, session=None):
+        # adds the given deltas to the statistics counters.
+        # deltas is a dictionary of (by, key): [correct delta, incorrect delta]
+        # the category and difficulty counters are written with a single bulk write. every user counter is written
+        # with a find-and-modify that returns it after the change, which moves the user between the counts of the
+        # leaderboard by its numbers of correct answers before and after the change (a user without answers isn't
+        # counted), so the counts stay exact when the user answers concurrently.
+        db = self.database
+        deltas = {key: (dc, di) for key, (dc, di) in deltas.items() if dc or di}
+        self._bulk_upsert(db.stats, [UpdateOne({"by": by, "key": key}, {"$inc": {"correct": dc, "incorrect": di}},
+                                               upsert=True)
+                                     for (by, key), (dc, di) in deltas.items() if by != 'user'], session)
+        moves = defaultdict(int)  # number of correct answers: change of the number of users
+        for (by, key), (dc, di) in deltas.items():
+            if by != 'user':
+                continue
+            after = self._inc_user_stats(key, dc, di, session)
+            if after["correct"] - dc + after["incorrect"] - di > 0:
+                moves[after["correct"] - dc] -= 1
+            if after["correct"] + after["incorrect"] > 0:
+                moves[after["correct"]] += 1
+        self._bulk_upsert(db.scores, [UpdateOne({"correct": correct}, {"$inc": {"users": users}}, upsert=True)
+                                      for correct, users in moves.items() if users], session)
+
+    def _inc_user_stats(self, user, dc, di, session=None):
+        # adds the deltas to the counters of the user and returns them after the change: {correct, incorrect}
+        query = {"by": "user", "key": user}
+        update = {"$inc": {"correct": dc, "incorrect": di}}
+        projection = {"_id": 0, "correct": 1, "incorrect": 1}
+        try:
+            return self.database.stats.find_one_and_update(query, update, projection, upsert=True,
+                                                           return_document=ReturnDocument.AFTER, session=session)
+        except DuplicateKeyError:  # another client created the counters at the same time
+            if session is not None:
+                raise  # the transaction is repeated (see _in_transaction)
+            return self.database.stats.find_one_and_update(query, update, projection,
+                                                           return_document=ReturnDocument.AFTER)
+
+    def _bulk_upsert(self, collection, ops, session=None):
+        # writes a batch of upserts. the upserts that lost a race with another client inserting the same document
+        # are repeated, and now update it. in a transaction the failure aborts it, and the whole transaction
+        # is repeated (see _in_transaction).
+        while ops:
+            try:
+                collection.bulk_write(ops, ordered=False, session=session)
+                return
+            except BulkWriteError as e:
+                failed = [ops[error['index']] for error in e.details['writeErrors']
+                          if error['code'] == self._DUPLICATE_KEY_ERROR]
+                if session is not None or len(failed) < len(e.details['writeErrors']):
+                    raise
+                ops = failed
+
+    def _count_users_above(self, correct):
+        # returns the number of users with more correct answers than the given number
+        pipeline = [{"$match": {"correct": {"$gt": correct}}}, {"$group": {"_id": None, "users": {"$sum": "$users"}}}]
+        docs = self._aggregate(self.database.scores, pipeline)
+        return docs[0]["users"] if docs else 0
+
+    def _records_source(self, question_ids=None):
+        # returns the collection that holds the answer records along with pipeline stages that produce
+        # a {user_id, question_id, correct} document per record, for both storage layouts.
+        # if question_ids is given, only the records of these questions are produced.
+        db = self.database
+        if self.records_storage == self.RECORDS_COLLECTION:
+            stages = [] if question_ids is None else [{"$match": {"question_id": {"$in": question_ids}}}]
+            return db.records, stages
+        stages = [{"$unwind": "$questions"}]
+        if question_ids is not None:
+            stages.append({"$match": {"questions.question_id": {"$in": question_ids}}})
+        stages.append({"$project": {
+            "_id": 0, "user_id": "$_id", "question_id": "$questions.question_id", "correct": "$questions.correct"
+        }})
+        return db.users, stages
+
+    def _recompute_results(self, by, question_ids=None):
+        # computes the number of correct/incorrect answers grouped by the given parameter from the records.
+        # yields (key, correct, incorrect) where the key of users is their id.
+        # the records are first grouped by their foreign key, so the $lookup runs once per question
+        # instead of once per record.
+        collection, pipeline = self._records_source(question_ids)
         pipeline.append({"$group": {
-            "_id": f"${by}",
-            "correct": {"$sum": "$questions.correct"},
-            "incorrect": {"$sum": {"$add": [1, {"$multiply": ["$questions.correct", -1]}]}}
+            "_id": "$user_id" if by == 'user' else "$question_id",
+            "correct": {"$sum": "$correct"},
+            "incorrect": {"$sum": {"$subtract": [1, "$correct"]}}
         }})
-        pipeline.append({"$project": {
-            "_id": 0,
-            f"{by.capitalize()}": "$_id",
-            "Correct": "$correct",
-            "Incorrect": "$incorrect"}
-        })
-        order = order_by.capitalize() if order_by else by.capitalize()
-        pipeline.append({"$sort": {f"{order}": 1 if ascending else -1}})
-        if limit is not None:
-            pipeline.append({"$limit": limit})
+        if by != 'user':
+            pipeline += [
+                {"$lookup": {"from": "questions", "localField": "_id", "foreignField": "_id", "as": "details"}},
+                {"$unwind": "$details"},
+                {"$group": {"_id": f"$details.{by}", "correct": {"$sum": "$correct"}, "incorrect": {"$sum": "$incorrect"}}}
+            ]
+        for doc in self._aggregate(collection, pipeline, allowDiskUse=True):
+            yield doc["_id"], doc["correct"], doc["incorrect"]
+
+    def _aggregate(self, collection, pipeline, **kwargs):
+        # runs an aggregation pipeline and returns all its documents.
+        # if the slow query log is enabled, a slow pipeline is recorded with the explain output of the server.
+        if self._slow_queries is None:
+            return list(collection.aggregate(pipeline, **kwargs))
+        start = time.perf_counter()
+        docs = list(collection.aggregate(pipeline, **kwargs))
+        seconds = time.perf_counter() - start
+        if self._slow_queries.is_slow(seconds):
+            command = {"aggregate": collection.name, "pipeline": pipeline, "cursor": {}, **kwargs}
+            try:
+                plan = self.database.command({"explain": command, "verbosity": "queryPlanner"})
+                plan = json_util.dumps(plan)
+            except PyMongoError as e:
+                plan = f"no plan: {e}"
+            # the values are logged as the parameters, so pipelines of the same shape are grouped in the report
+            statement = f"{collection.name}.aggregate({json.dumps(SlowQueryLog.shape(pipeline))})"
+            self._slow_queries.record(type(self).__name__, statement, pipeline, seconds, plan)
+        return docs
+
+    @staticmethod
+    def _to_question(doc):
+        # converts a question document to the format returned by get_questions
+        doc['id'] = doc.pop('_id')
+        return doc
+
+    def encode_id(self, item_id):
+        return str(item_id)
 
-        with MongoClient() as client:
-            db = client['trivia']
-            results = db.users.aggregate(pipeline)
-            return pd.DataFrame(list(results), columns=[by.capitalize(), "Correct", "Incorrect"])
+    def decode_id(self, value):
+        return ObjectId(value)
 
+    @staticmethod
+    def _create_indexes(db):
+        # creating indexes for fields that should be unique.
+        # this also allows faster find operations on these fields.
+        db.categories.create_index("name", unique=True)
+        db.questions.create_index("question", unique=True)
+        # duplicate detection by the normalized content hash (see DAL.question_hash). the questions added
+        # before the hash was stored, and their near-duplicates, have no hash.
+        db.questions.create_index("hash", unique=True, partialFilterExpression={"hash": {"$type": "string"}})
+        # serves get_questions by the sequence numbers of the buckets, and get_all_questions
+        db.questions.create_index([("category", ASCENDING), ("difficulty", ASCENDING), ("seq", ASCENDING)],
+                                  unique=True, partialFilterExpression={"seq": {"$exists": True}})
+        db.buckets.create_index([("category", ASCENDING), ("difficulty", ASCENDING)], unique=True)
+        # the answered questions bitmaps of the users by bucket, category serves purge_categories
+        db.answered.create_index([("user_id", ASCENDING), ("category", ASCENDING), ("difficulty", ASCENDING)],
+                                 unique=True)
+        db.answered.create_index("category")
+        db.users.create_index("name", unique=True)
+        db.users.create_index("questions.question_id")
+        # a user answers each question once, the latest answer replaces the former.
+        # the unique index also serves the per-user queries, question_id serves removing questions.
+        db.records.create_index([("user_id", ASCENDING), ("question_id", ASCENDING)], unique=True)
+        db.records.create_index("question_id")
+        # serve the incremental exports
+        db.records.create_index("version")
+        db.users.create_index("records_version", sparse=True)
+        # statistics counters: {by: category/difficulty/user, key: name or user id, correct, incorrect}
+        db.stats.create_index([("by", ASCENDING), ("key", ASCENDING)], unique=True)
+        # the leaderboard: the users by number of correct answers, and the number of users per number of
+        # correct answers: {correct, users}
+        db.stats.create_index([("by", ASCENDING), ("correct", DESCENDING), ("key", DESCENDING)])
+        db.scores.create_index("correct", unique=True)
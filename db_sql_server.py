@@ -1,17 +1,81 @@
 from dal import *
+from connection_pool import ConnectionPool
+from slow_query_log import SLOW_QUERIES
+import random
+import threading
+import time
 import pyodbc
 import pandas as pd
 
 
+class _LoggedCursor:
+    # a pyodbc cursor that records the statements slower than the threshold of the slow query log.
+    # everything else is delegated to the cursor.
+
+    def __init__(self, cursor, db):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_db', db)
+
+    def execute(self, sql, *params):
+        start = time.perf_counter()
+        self._cursor.execute(sql, *params)
+        self._db._check_slow(sql, params, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, params):
+        start = time.perf_counter()
+        self._cursor.executemany(sql, params)
+        seconds = time.perf_counter() - start
+        if params:
+            self._db._check_slow(sql, [params[0]], seconds, rows=len(params))
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+
+class _LoggedConnection:
+    # a pyodbc connection whose cursors are _LoggedCursor. used when the slow query log is enabled.
+
+    def __init__(self, conn, db):
+        self._conn = conn
+        self._db = db
+
+    def cursor(self):
+        return _LoggedCursor(self._conn.cursor(), self._db)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
 class DbSqlServer(DAL):
     """
     Implementation of the DAL using sql-server with pyodbc.
+    All the methods share a pool of long-lived connections owned by the instance.
     """
 
     DB_NAME = 'Trivia'
     SERVER = 'localhost\SQLEXPRESS'
     MAX_QUESTION_LENGTH = 300
     MAX_ANSWER_LENGTH = 150
+    # sql-server allows up to 2100 parameters per statement.
+    _MAX_PARAMS = 2000
+    # rows per multi-row insert of questions (6 parameters each)
+    _INSERT_CHUNK_SIZE = _MAX_PARAMS // 6
+    # rows per MERGE of answer records (3 parameters each)
+    _MERGE_CHUNK_SIZE = _MAX_PARAMS // 3
 
     # Must change the Server attribute according to the device
     _conn_str = "Driver={ODBC Driver 13 for SQL Server};" \
@@ -19,154 +83,585 @@ class DbSqlServer(DAL):
                 f"Database={DB_NAME};" \
                 "Trusted_Connection=yes;"
 
-    # sql for the get_results_by method.
+    # sql for the get_results_by method. reads the statistics counters maintained by update_correct.
     _sql_get_results_by = {
         'category': """
-            SELECT c.CategoryName as Category, SUM(r.Correct) as Correct, SUM(1 - r.Correct) as Incorrect
-            FROM Categories c JOIN Questions q
-            ON c.CategoryID = q.CategoryID
-            JOIN Records r
-            ON r.QuestionID = q.QuestionID
-            GROUP BY c.CategoryName
+            SELECT c.CategoryName as Category, s.Correct, s.Incorrect
+            FROM CategoryStats s JOIN Categories c
+            ON c.CategoryID = s.CategoryID
+            WHERE s.Correct + s.Incorrect > 0 AND c.Removing = 0
         """,
         'difficulty': """
-            SELECT q.Difficulty, SUM(r.Correct) as Correct, SUM(1 - r.Correct) as Incorrect
-            FROM Questions q JOIN Records r
-            ON r.QuestionID = q.QuestionID
-            GROUP BY q.Difficulty
+            SELECT s.Difficulty, s.Correct, s.Incorrect
+            FROM DifficultyStats s
+            WHERE s.Correct + s.Incorrect > 0
         """,
         'user': """
-            SELECT u.UserName, SUM(r.Correct) as Correct, SUM(1 - r.Correct) as Incorrect
-            FROM Users u JOIN Records r
-            ON r.UserID = u.UserID 
-            GROUP BY u.UserName
+            SELECT u.UserName, s.Correct, s.Incorrect
+            FROM UserStats s JOIN Users u
+            ON u.UserID = s.UserID
+            WHERE s.Correct + s.Incorrect > 0
         """
     }
 
-    def __init__(self):
+    # sql for get_answered and get_questions with exclude_answered. a seek of the primary key of the bitmaps.
+    _sql_get_answered = """
+        SELECT a.Word, a.Bits
+        FROM AnsweredBits a JOIN Categories c
+        ON a.CategoryID = c.CategoryID
+        WHERE a.UserID = ? AND c.CategoryName = ? AND a.Difficulty = ?
+    """
+
+    # sql for the get_leaderboard method. reads the users in the order of the IX_UserStats_Correct index.
+    # the ranks are computed from the number of users per number of correct answers in ScoreCounts,
+    # maintained by update_correct.
+    _sql_leaderboard = """
+        SELECT TOP (?) s.Correct, s.UserID, u.UserName, s.Incorrect
+        FROM UserStats s JOIN Users u
+        ON u.UserID = s.UserID
+        WHERE s.Correct + s.Incorrect > 0 {where}
+        ORDER BY s.Correct DESC, s.UserID DESC
+    """
+    # the page after a cursor: the rest of the users with the number of correct answers of the cursor, then the
+    # users with fewer, as two seeks of the index
+    _sql_leaderboard_after = f"""
+        SELECT TOP (?) *
+        FROM (
+            SELECT * FROM ({_sql_leaderboard.format(where="AND s.Correct = ? AND s.UserID < ?")}) AS same
+            UNION ALL
+            SELECT * FROM ({_sql_leaderboard.format(where="AND s.Correct < ?")}) AS fewer
+        ) AS p
+        ORDER BY Correct DESC, UserID DESC
+    """
+    _sql_user_rank = """
+        SELECT 1 + (SELECT ISNULL(SUM(c.Users), 0) FROM ScoreCounts c WHERE c.Correct > s.Correct),
+               s.Correct, s.Incorrect
+        FROM Users u JOIN UserStats s
+        ON s.UserID = u.UserID
+        WHERE u.UserName = ? AND s.Correct + s.Incorrect > 0
+    """
+    # moves the users whose counters were updated (the former and new number of correct answers, output into
+    # @moved) between the counts of the leaderboard
+    _sql_move_scores = """
+        MERGE ScoreCounts WITH (HOLDLOCK) AS t
+        USING (
+            SELECT Correct, SUM(Users)
+            FROM (
+                SELECT OldCorrect, -1 FROM @moved WHERE OldCorrect IS NOT NULL
+                UNION ALL
+                SELECT NewCorrect, 1 FROM @moved
+            ) AS m (Correct, Users)
+            GROUP BY Correct
+            HAVING SUM(Users) <> 0
+        ) AS d (Correct, Users)
+        ON t.Correct = d.Correct
+        WHEN MATCHED THEN UPDATE SET Users = t.Users + d.Users
+        WHEN NOT MATCHED THEN INSERT (Correct, Users) VALUES (d.Correct, d.Users);
+    """
+
+    # sql for adding questions. {values} is replaced by a _QUESTION_ROW per question.
+    # the questions whose hash is already in the database are skipped by the same statement: the lookups are
+    # probes of the unique hash index, and the key-range locks keep concurrent inserts of the same question out.
+    # the new questions of a bucket are numbered after its last question (see get_questions). the last number
+    # is read with a seek to the end of the bucket index and locked until the end of the transaction,
+    # so concurrent inserts to the same bucket get consecutive numbers.
+    # the hashes are cast to the type of the column, since a string parameter (nvarchar) would be compared
+    # by converting the column, which scans the index instead of seeking it.
+    _QUESTION_ROW = "(?, ?, ?, ?, ?, CAST(? AS CHAR(40)))"
+    _sql_insert_questions = """
+        WITH New AS (
+            SELECT v.*, ROW_NUMBER() OVER (PARTITION BY v.CategoryID, v.Difficulty ORDER BY (SELECT NULL)) AS N
+            FROM (VALUES {values}) AS v (CategoryID, QuestionType, Difficulty, Question, CorrectAnswer, QuestionHash)
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM Questions q WITH (UPDLOCK, HOLDLOCK)
+                WHERE q.QuestionHash = v.QuestionHash
+            )
+        )
+        INSERT INTO Questions (CategoryID, QuestionType, Difficulty, Question, CorrectAnswer, QuestionHash, BucketSeq)
+        OUTPUT INSERTED.QuestionID, INSERTED.QuestionHash
+        SELECT n.CategoryID, n.QuestionType, n.Difficulty, n.Question, n.CorrectAnswer, n.QuestionHash,
+               n.N + ISNULL((
+                   SELECT MAX(q.BucketSeq)
+                   FROM Questions q WITH (UPDLOCK, HOLDLOCK)
+                   WHERE q.CategoryID = n.CategoryID AND q.Difficulty = n.Difficulty
+               ), 0)
+        FROM New n
+    """
+
+    # sql for the backfill_question_hashes method. {values} is replaced by a (?, CAST(? AS CHAR(40))) row
+    # per question.
+    # a hash that belongs to another question is not stored, returns the ids of the hashed questions.
+    _sql_backfill_hashes = """
+        UPDATE q SET QuestionHash = v.QuestionHash
+        OUTPUT INSERTED.QuestionID
+        FROM Questions q JOIN (VALUES {values}) AS v (QuestionID, QuestionHash)
+        ON q.QuestionID = v.QuestionID
+        WHERE q.QuestionHash IS NULL AND NOT EXISTS (
+            SELECT 1
+            FROM Questions d WITH (UPDLOCK, HOLDLOCK)
+            WHERE d.QuestionHash = v.QuestionHash
+        )
+    """
+
+    # sql for the update_correct methods. {values} is replaced by a (?, ?, ?) row per record.
+    # the records are upserted and the changes (with the former result of re-answered questions)
+    # are used to update the statistics counters (moving the users between the counts of the leaderboard)
+    # and the answered questions bitmaps (see AnsweredSeqs) in the same transaction.
+    _sql_merge_records = """
+        SET NOCOUNT ON;
+        SET XACT_ABORT ON;
+        DECLARE @changes TABLE (QuestionID INT, UserID INT, OldCorrect SMALLINT NULL, NewCorrect SMALLINT);
+        DECLARE @moved TABLE (OldCorrect INT NULL, NewCorrect INT);
+
+        MERGE Records WITH (HOLDLOCK) AS r
+        USING (VALUES {values}) AS s (QuestionID, UserID, Correct)
+        ON r.QuestionID = s.QuestionID AND r.UserID = s.UserID
+        WHEN MATCHED AND r.Correct <> s.Correct THEN
+            UPDATE SET Correct = s.Correct
+        WHEN NOT MATCHED THEN
+            INSERT (QuestionID, UserID, Correct) VALUES (s.QuestionID, s.UserID, s.Correct)
+        OUTPUT inserted.QuestionID, inserted.UserID, deleted.Correct, inserted.Correct INTO @changes;
+
+        DECLARE @deltas TABLE (CategoryID INT, Difficulty SMALLINT, UserID INT, DC INT, DI INT);
+        INSERT INTO @deltas
+        SELECT q.CategoryID, q.Difficulty, ch.UserID,
+               ch.NewCorrect - ISNULL(ch.OldCorrect, 0), (1 - ch.NewCorrect) - ISNULL(1 - ch.OldCorrect, 0)
+        FROM @changes ch JOIN Questions q
+        ON q.QuestionID = ch.QuestionID;
+
+        MERGE CategoryStats WITH (HOLDLOCK) AS t
+        USING (SELECT CategoryID, SUM(DC), SUM(DI) FROM @deltas GROUP BY CategoryID) AS d (ID, DC, DI)
+        ON t.CategoryID = d.ID
+        WHEN MATCHED THEN UPDATE SET Correct = t.Correct + d.DC, Incorrect = t.Incorrect + d.DI
+        WHEN NOT MATCHED THEN INSERT (CategoryID, Correct, Incorrect) VALUES (d.ID, d.DC, d.DI);
+
+        MERGE DifficultyStats WITH (HOLDLOCK) AS t
+        USING (SELECT Difficulty, SUM(DC), SUM(DI) FROM @deltas GROUP BY Difficulty) AS d (ID, DC, DI)
+        ON t.Difficulty = d.ID
+        WHEN MATCHED THEN UPDATE SET Correct = t.Correct + d.DC, Incorrect = t.Incorrect + d.DI
+        WHEN NOT MATCHED THEN INSERT (Difficulty, Correct, Incorrect) VALUES (d.ID, d.DC, d.DI);
+
+        MERGE UserStats WITH (HOLDLOCK) AS t
+        USING (SELECT UserID, SUM(DC), SUM(DI) FROM @deltas GROUP BY UserID) AS d (ID, DC, DI)
+        ON t.UserID = d.ID
+        WHEN MATCHED THEN UPDATE SET Correct = t.Correct + d.DC, Incorrect = t.Incorrect + d.DI
+        WHEN NOT MATCHED THEN INSERT (UserID, Correct, Incorrect) VALUES (d.ID, d.DC, d.DI)
+        OUTPUT deleted.Correct, inserted.Correct INTO @moved;
+    """ + _sql_move_scores + """
+        -- the changes are unique per (question, user), so the sum of the bits of a word is their bitwise OR
+        MERGE AnsweredBits WITH (HOLDLOCK) AS t
+        USING (
+            SELECT ch.UserID, q.CategoryID, q.Difficulty, (q.BucketSeq - 1) / 32,
+                   SUM(POWER(CAST(2 AS BIGINT), (q.BucketSeq - 1) % 32))
+            FROM @changes ch JOIN Questions q
+            ON q.QuestionID = ch.QuestionID
+            GROUP BY ch.UserID, q.CategoryID, q.Difficulty, (q.BucketSeq - 1) / 32
+        ) AS b (UserID, CategoryID, Difficulty, Word, Bits)
+        ON t.UserID = b.UserID AND t.CategoryID = b.CategoryID AND t.Difficulty = b.Difficulty AND t.Word = b.Word
+        WHEN MATCHED THEN UPDATE SET Bits = t.Bits | b.Bits
+        WHEN NOT MATCHED THEN INSERT (UserID, CategoryID, Difficulty, Word, Bits)
+            VALUES (b.UserID, b.CategoryID, b.Difficulty, b.Word, b.Bits);
+    """
+
+    # sql for the rebuild_stats method. recomputes all the counters and bitmaps from the records.
+    _sql_rebuild_stats = """
+        SET NOCOUNT ON;
+        SET XACT_ABORT ON;
+        DELETE FROM CategoryStats;
+        DELETE FROM DifficultyStats;
+        DELETE FROM UserStats;
+        DELETE FROM ScoreCounts;
+
+        INSERT INTO CategoryStats (CategoryID, Correct, Incorrect)
+        SELECT q.CategoryID, SUM(r.Correct), SUM(1 - r.Correct)
+        FROM Questions q JOIN Records r
+        ON r.QuestionID = q.QuestionID
+        GROUP BY q.CategoryID;
+
+        INSERT INTO DifficultyStats (Difficulty, Correct, Incorrect)
+        SELECT q.Difficulty, SUM(r.Correct), SUM(1 - r.Correct)
+        FROM Questions q JOIN Records r
+        ON r.QuestionID = q.QuestionID
+        GROUP BY q.Difficulty;
+
+        INSERT INTO UserStats (UserID, Correct, Incorrect)
+        SELECT r.UserID, SUM(r.Correct), SUM(1 - r.Correct)
+        FROM Records r
+        GROUP BY r.UserID;
+
+        INSERT INTO ScoreCounts (Correct, Users)
+        SELECT Correct, COUNT(*)
+        FROM UserStats
+        GROUP BY Correct;
+
+        DELETE FROM AnsweredBits;
+        INSERT INTO AnsweredBits (UserID, CategoryID, Difficulty, Word, Bits)
+        SELECT r.UserID, q.CategoryID, q.Difficulty, (q.BucketSeq - 1) / 32,
+               SUM(POWER(CAST(2 AS BIGINT), (q.BucketSeq - 1) % 32))
+        FROM Records r JOIN Questions q
+        ON q.QuestionID = r.QuestionID
+        GROUP BY r.UserID, q.CategoryID, q.Difficulty, (q.BucketSeq - 1) / 32;
+    """
+
+    # sql for the purge_categories method. deletes a batch of a hidden category: the first ? questions of the
+    # category, whose records are removed from the difficulty and user counters (moving the users between the
+    # counts of the leaderboard), and whose answers and records are removed by the cascading delete.
+    # the records are read with UPDLOCK and the key ranges of HOLDLOCK, held until the questions are deleted, so
+    # an answer to one of the questions (see _sql_merge_records) waits for the batch and then fails on the deleted
+    # question, instead of changing a record after it was subtracted. once the questions are deleted, the first
+    # ? rows of the bitmaps of the category, and then the category itself (the category counters are removed by
+    # the cascading delete).
+    # returns the name of the category (NULL if no category is hidden), the number of deleted questions
+    # and whether the category was deleted.
+    _sql_purge_batch = """
+        SET NOCOUNT ON;
+        SET XACT_ABORT ON;
+        DECLARE @cat INT, @name NVARCHAR(40), @done BIT = 0;
+        DECLARE @batch TABLE (QuestionID INT PRIMARY KEY);
+        DECLARE @records TABLE (UserID INT, Difficulty SMALLINT, Correct SMALLINT);
+        DECLARE @moved TABLE (OldCorrect INT NULL, NewCorrect INT);
+        SELECT TOP (1) @cat = CategoryID, @name = CategoryName
+        FROM Categories
+        WHERE Removing = 1;
+
+        IF @cat IS NOT NULL
+            BEGIN
+                INSERT INTO @batch
+                SELECT TOP (?) QuestionID
+                FROM Questions
+                WHERE CategoryID = @cat;
+
+                IF @@ROWCOUNT > 0
+                    BEGIN
+                        INSERT INTO @records
+                        SELECT r.UserID, q.Difficulty, r.Correct
+                        FROM @batch b JOIN Questions q
+                        ON q.QuestionID = b.QuestionID
+                        JOIN Records r WITH (UPDLOCK, HOLDLOCK)
+                        ON r.QuestionID = b.QuestionID;
+
+                        WITH d AS (
+                            SELECT Difficulty, SUM(Correct) AS C, SUM(1 - Correct) AS I
+                            FROM @records
+                            GROUP BY Difficulty
+                        )
+                        UPDATE s SET Correct = s.Correct - d.C, Incorrect = s.Incorrect - d.I
+                        FROM DifficultyStats s JOIN d
+                        ON s.Difficulty = d.Difficulty;
+
+                        WITH d AS (
+                            SELECT UserID, SUM(Correct) AS C, SUM(1 - Correct) AS I
+                            FROM @records
+                            GROUP BY UserID
+                        )
+                        UPDATE s SET Correct = s.Correct - d.C, Incorrect = s.Incorrect - d.I
+                        OUTPUT deleted.Correct, inserted.Correct INTO @moved
+                        FROM UserStats s JOIN d
+                        ON s.UserID = d.UserID;
+    """ + _sql_move_scores + """
+
+                        DELETE FROM Questions
+                        WHERE QuestionID IN (SELECT QuestionID FROM @batch);
+                    END
+                ELSE
+                    BEGIN
+                        DELETE TOP (?) FROM AnsweredBits
+                        WHERE CategoryID = @cat;
+
+                        IF @@ROWCOUNT = 0
+                            BEGIN
+                                DELETE FROM Categories
+                                WHERE CategoryID = @cat;
+                                SET @done = 1;
+                            END
+                    END
+            END
+
+        SELECT @name, (SELECT COUNT(*) FROM @batch), @done;
+    """
+
+    # sql for the export_rows method by table. the versions are the rowversion columns.
+    _sql_export = {
+        'questions': """
+            SELECT q.QuestionID, c.CategoryName, q.QuestionType, q.Difficulty, q.Question, q.CorrectAnswer,
+                   CAST(q.RowVer AS BIGINT)
+            FROM Questions q JOIN Categories c
+            ON c.CategoryID = q.CategoryID
+            WHERE q.RowVer >= CAST(CAST(? AS BIGINT) AS BINARY(8))
+        """,
+        'answers': """
+            SELECT a.QuestionID, a.Answer, CAST(q.RowVer AS BIGINT)
+            FROM Answers a JOIN Questions q
+            ON q.QuestionID = a.QuestionID
+            WHERE q.RowVer >= CAST(CAST(? AS BIGINT) AS BINARY(8))
+        """,
+        'users': """
+            SELECT UserID, UserName, CAST(RowVer AS BIGINT)
+            FROM Users
+            WHERE RowVer >= CAST(CAST(? AS BIGINT) AS BINARY(8))
+        """,
+        'records': """
+            SELECT QuestionID, UserID, Correct, CAST(RowVer AS BIGINT)
+            FROM Records
+            WHERE RowVer >= CAST(CAST(? AS BIGINT) AS BINARY(8))
+        """
+    }
+
+    def __init__(self, pool_size=10, max_idle=5, max_idle_time=300, pool_timeout=30, slow_query_log=SLOW_QUERIES):
+        """
+        Args:
+            pool_size (int): The maximum number of open connections to the server. Defaults to 10.
+            max_idle (int): The maximum number of idle connections kept open. Defaults to 5.
+            max_idle_time (float): Idle connections older than this (in seconds) are reopened. Defaults to 300.
+            pool_timeout (float): How long (in seconds) to wait for a free connection. Defaults to 30.
+            slow_query_log (SlowQueryLog, optional): Where statements slower than its threshold are recorded
+                with their estimated plan. Defaults to the log of the process (see slow_query_log.SLOW_QUERIES).
+        """
         super().__init__()
+        self._slow_queries = slow_query_log
+        # the plans of slow statements are fetched on a separate connection, so fetching them never
+        # interferes with the results or the transaction of the statement.
+        self._plan_conn = None
+        self._plan_lock = threading.Lock()
+        # a failed statement (e.g. a duplicate key) leaves the connection usable, its transaction is rolled back
+        # and it is reused. broken connections raise OperationalError or InterfaceError, or fail the health check.
+        self._pool = ConnectionPool(self._connect, max_size=pool_size, max_idle=max_idle,
+                                    max_idle_time=max_idle_time, timeout=pool_timeout,
+                                    health_check=self._ping,
+                                    discard_on=(pyodbc.OperationalError, pyodbc.InterfaceError),
+                                    reset=lambda conn: conn.rollback())
+
+    def pool_stats(self):
+        """
+        Gets the statistics of the connection pool. Useful for tuning the pool parameters.
+
+        Returns:
+            dict: See ConnectionPool.stats
+
+        """
+        return self._pool.stats()
+
+    def close(self):
+        """ Closes all the connections to the server."""
+        self._pool.close()
+        with self._plan_lock:
+            if self._plan_conn is not None:
+                self._plan_conn.close()
+                self._plan_conn = None
 
     def add_question(self, category, q_type, difficulty, question, correct_answer, wrong_answers=None):
-        if self._is_duplicate(question):
-            raise ValueError("Question already in the database.")
-        conn = pyodbc.connect(self._conn_str())
-        with conn.cursor() as cursor:
-            sql = """
-                INSERT INTO Questions
-                OUTPUT INSERTED.QuestionID
-                VALUES (?, ?, ?, ?, ?)
-            """
+        with self._pool.connection() as conn:
             try:
-                cat_id = self.add_category(category)  # add the category if it doesn't exist and get its id
-                q_id = cursor.execute(sql, cat_id, Types[q_type].value, Difficulties[difficulty].value,
-                                      question, correct_answer).fetchval()
+                cat_id = self.add_category(category, conn)  # add the category if it doesn't exist and get its id
+                params = [cat_id, Types[q_type].value, Difficulties[difficulty].value, question, correct_answer,
+                          self.question_hash(question)]
             except KeyError:
                 raise ValueError(f"Invalid question type {q_type} or difficulty {difficulty}.")
-            except pyodbc.DataError:
-                raise ValueError("Too many characters for the question (max: {}) or the correct answer (max: {})."
-                                 .format(self.MAX_QUESTION_LENGTH, self.MAX_ANSWER_LENGTH))
-            except pyodbc.IntegrityError:
-                raise ValueError(f"Category {category} does not exist.")
-            if q_type == Types.multiple:
-                self._add_answers(q_id, wrong_answers, conn)
+            # the question and its wrong answers are inserted in one transaction, committed when the cursor
+            # block ends. a failure rolls back both (see the reset of the connection pool).
+            with conn.cursor() as cursor:
+                sql = self._sql_insert_questions.format(values=self._QUESTION_ROW)
+                try:
+                    row = cursor.execute(sql, params).fetchone()
+                except pyodbc.DataError:
+                    raise ValueError("Too many characters for the question (max: {}) or the correct answer (max: {})."
+                                     .format(self.MAX_QUESTION_LENGTH, self.MAX_ANSWER_LENGTH))
+                except pyodbc.IntegrityError:
+                    self._category_ids.pop(category)  # removed by another process
+                    raise ValueError(f"Category {category} does not exist.")
+                if row is None:
+                    raise ValueError(self.DUPLICATE_QUESTION)
+                if q_type == Types.multiple.name:
+                    self._add_answers(row[0], wrong_answers, cursor)
 
     def add_category(self, name, conn=None):
+        cat_id = self._category_ids.get(name)
+        if cat_id is not None:
+            return cat_id
         if not conn:
-            conn = pyodbc.connect(self._conn_str())
+            with self._pool.connection() as conn:
+                return self.add_category(name, conn)
         with conn.cursor() as cursor:
             sql = """
                 IF EXISTS (SELECT 1 FROM Categories WHERE CategoryName = ?)
                     BEGIN
-                        SELECT CategoryID
+                        SELECT CategoryID, Removing
                         FROM Categories
                         WHERE CategoryName = ?
                     END
                 ELSE
                     BEGIN
-                        INSERT INTO Categories
-                        OUTPUT INSERTED.CategoryID
+                        INSERT INTO Categories (CategoryName)
+                        OUTPUT INSERTED.CategoryID, INSERTED.Removing
                         VALUES (?)
                     END
             """
             try:
-                return cursor.execute(sql, name, name, name).fetchval()
+                cat_id, removing = cursor.execute(sql, name, name, name).fetchone()
             except pyodbc.IntegrityError:  # empty name
                 raise ValueError("Category name cannot be empty.")
+        if removing:
+            raise ValueError(f"Category {name} is being removed.")
+        self._category_ids.put(name, cat_id)
+        self._category_list.clear()
+        return cat_id
 
-    def remove_category(self, category):
-        conn = pyodbc.connect(self._conn_str())
-        with conn.cursor() as cursor:
-            sql = """
-                DELETE FROM Categories
-                WHERE CategoryName = ?
-            """
-            cursor.execute(sql, category)
+    def hide_category(self, name):
+        self._category_ids.pop(name)
+        self._category_list.clear()
+        with self._pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("UPDATE Categories SET Removing = 1 WHERE CategoryName = ? AND Removing = 0", name)
+            return cursor.rowcount > 0
 
     def get_categories(self):
-        conn = pyodbc.connect(self._conn_str())
-        with conn.cursor() as cursor:
-            sql = """
-                SELECT CategoryName
-                FROM Categories
-            """
-            return [cat[0] for cat in cursor.execute(sql).fetchall()]
+        categories = self._category_list.get('all')
+        if categories is None:
+            with self._pool.connection() as conn, conn.cursor() as cursor:
+                sql = """
+                    SELECT CategoryName
+                    FROM Categories
+                    WHERE Removing = 0
+                """
+                categories = [cat[0] for cat in cursor.execute(sql).fetchall()]
+            self._category_list.put('all', categories)
+        return list(categories)
+
+    def add_questions(self, questions):
+        result = BatchResult()
+
+        # validate the batch and drop the questions that appear more than once in it
+        valid = []
+        seen = set()
+        for i, q in enumerate(questions):
+            try:
+                q = self._validate_question(q)
+            except ValueError as e:
+                result.fail(i, e)
+                continue
+            q_hash = self.question_hash(q[3])
+            if q_hash in seen:
+                result.fail(i, self.DUPLICATE_QUESTION)
+                continue
+            seen.add(q_hash)
+            valid.append((i, q, q_hash))
+        if not valid:
+            return result
+
+        with self._pool.connection() as conn:
+            # resolve every category of the batch once. the questions of a category that can't be added
+            # (e.g. it is being removed) fail.
+            cat_ids = {}
+            for _, q, _ in valid:
+                if q[0] not in cat_ids:
+                    try:
+                        cat_ids[q[0]] = self.add_category(q[0], conn)
+                    except ValueError as e:
+                        cat_ids[q[0]] = e
+            for i, q, _ in valid:
+                if isinstance(cat_ids[q[0]], ValueError):
+                    result.fail(i, cat_ids[q[0]])
+            valid = [(i, q, q_hash) for i, q, q_hash in valid if not isinstance(cat_ids[q[0]], ValueError)]
+
+            # the questions that are already in the database are skipped by the insert itself
+            for start in range(0, len(valid), self._INSERT_CHUNK_SIZE):
+                chunk = valid[start:start + self._INSERT_CHUNK_SIZE]
+                inserted = self._insert_questions([(q, q_hash) for _, q, q_hash in chunk], cat_ids, conn)
+                result.added += len(inserted)
+                for i, _, q_hash in chunk:
+                    if q_hash not in inserted:
+                        result.fail(i, self.DUPLICATE_QUESTION)
+        return result
 
     def import_questions(self, amount=1, difficulty=None, category=None):
         # import questions from the opentdb website
         questions = super()._import_questions_from_opentdb(amount, difficulty, category)
 
-        # add the questions to the database
-        count = 0  # some questions can be duplicates so count how many were added
-        for q in questions:
-            try:
-                self.add_question(q['category'], Types[q['type']].name,
-                                  Difficulties[q['difficulty']].name,
-                                  q['question'], q['correct_answer'], q['incorrect_answers'])
-                count += 1
-            except ValueError:  # duplicate or too long question/answer
-                pass
-        return count
-
-    def get_questions(self, amount, category, difficulty):
-        conn = pyodbc.connect(self._conn_str())
+        # add the questions to the database.
+        # some questions can be duplicates so return how many were added
+        return self.add_questions(questions).added
+
+    def get_questions(self, amount, category, difficulty, exclude_answered=False, user=None):
+        # the questions of a bucket are numbered 1..n without gaps (see SQL_DB_creation.sql), so a uniform sample
+        # is drawn by picking amount random numbers. the size of the bucket and the picked questions
+        # (with their wrong answers) are read with seeks of the bucket index, instead of sorting the bucket.
+        # each question appears once per wrong answer (or once with a NULL answer for boolean questions).
+        # a hidden category has no questions to pick.
+        self._check_answered_user(exclude_answered, user)
+        difficulty = Difficulties[difficulty].value
+        with self._pool.connection() as conn, conn.cursor() as cursor:
+            sql = """
+                SELECT MAX(q.BucketSeq)
+                FROM Questions q JOIN Categories c
+                ON q.CategoryID = c.CategoryID
+                WHERE c.CategoryName = ? AND c.Removing = 0 AND q.Difficulty = ?
+            """
+            params = [category, difficulty]
+            if exclude_answered:
+                # the bitmap of the user is read in the same round trip, as a second result set
+                sql += ";" + self._sql_get_answered
+                params += [user, category, difficulty]
+            size = cursor.execute(sql, *params).fetchval() or 0
+            if exclude_answered:
+                cursor.nextset()
+                seqs = self._sample_unanswered(size, amount, AnsweredSeqs(dict(cursor.fetchall())))
+            else:
+                seqs = self._sample_seqs(size, amount)
+            rows = []
+            for start in range(0, len(seqs), self._MAX_PARAMS):
+                chunk = seqs[start:start + self._MAX_PARAMS]
+                sql = f"""
+                    SELECT q.QuestionID, q.QuestionType, q.Question, q.CorrectAnswer, a.Answer
+                    FROM Questions q JOIN Categories c
+                    ON q.CategoryID = c.CategoryID
+                    LEFT JOIN Answers a
+                    ON a.QuestionID = q.QuestionID
+                    WHERE c.CategoryName = ? AND q.Difficulty = ? AND q.BucketSeq IN ({", ".join("?" * len(chunk))})
+                """
+                rows += cursor.execute(sql, category, difficulty, *chunk).fetchall()
+        # the join does not keep the random order of the picked questions
+        out = self._rows_to_questions(rows)
+        random.shuffle(out)
+        return out
+
+    def get_all_questions(self, category, difficulty):
         sql = """
-            SELECT TOP (?) q.QuestionID, q.QuestionType, q.Question, q.CorrectAnswer
+            SELECT q.QuestionID, q.QuestionType, q.Question, q.CorrectAnswer, a.Answer, q.BucketSeq
             FROM Questions q JOIN Categories c
             ON q.CategoryID = c.CategoryID
-            WHERE c.CategoryName = ? AND q.Difficulty = ?
-            ORDER BY NEWID()
+            LEFT JOIN Answers a
+            ON a.QuestionID = q.QuestionID
+            WHERE c.CategoryName = ? AND c.Removing = 0 AND q.Difficulty = ?
         """
-        out = []
-        print(difficulty)
-        with conn.cursor() as cursor:
-            questions = cursor.execute(sql, amount, category, Difficulties[difficulty].value).fetchall()
+        with self._pool.connection() as conn, conn.cursor() as cursor:
+            rows = cursor.execute(sql, category, Difficulties[difficulty].value).fetchall()
+        seqs = {row.QuestionID: row.BucketSeq for row in rows}
+        questions = self._rows_to_questions(rows)
         for q in questions:
-            question = {
-                'id': q.QuestionID,
-                'type': Types(q.QuestionType).name,
-                'question': q.Question,
-                'correct_answer': q.CorrectAnswer
-            }
-            if question['type'] == 'multiple':
-                question['wrong_answers'] = self._get_answers(q.QuestionID, conn)
-            out.append(question)
-        return out
+            q['seq'] = seqs[q['id']]
+        return questions
+
+    def get_answered(self, user, category, difficulty):
+        with self._pool.connection() as conn, conn.cursor() as cursor:
+            words = cursor.execute(self._sql_get_answered, user, category, Difficulties[difficulty].value).fetchall()
+        return AnsweredSeqs(dict(words))
 
     def get_difficulties(self, category):
-        conn = pyodbc.connect(self._conn_str())
-        with conn.cursor() as cursor:
+        with self._pool.connection() as conn, conn.cursor() as cursor:
             sql = """
                 SELECT DISTINCT q.Difficulty
                 FROM Questions q JOIN Categories c
                 ON q.CategoryID = c.CategoryID
-                WHERE c.CategoryName = ?
+                WHERE c.CategoryName = ? AND c.Removing = 0
             """
-            difficulties =  cursor.execute(sql, category).fetchall()
+            difficulties = cursor.execute(sql, category).fetchall()
             return [Difficulties(d[0]).name for d in difficulties]
 
     def add_user(self, name):
-        conn = pyodbc.connect(self._conn_str())
-        with conn.cursor() as cursor:
+        user_id = self._user_ids.get(name)
+        if user_id is not None:
+            return user_id
+        with self._pool.connection() as conn, conn.cursor() as cursor:
             sql = """
                 IF EXISTS (SELECT 1 FROM Users WHERE UserName = ?)
                     BEGIN
@@ -182,32 +677,47 @@ class DbSqlServer(DAL):
                     END
             """
             try:
-                return cursor.execute(sql, name, name, name).fetchval()
+                user_id = cursor.execute(sql, name, name, name).fetchval()
             except pyodbc.IntegrityError:  # empty name
                 raise ValueError("Username cannot be empty.")
+        self._user_ids.put(name, user_id)
+        return user_id
 
     def update_correct(self, question, user, correct):
-        conn = pyodbc.connect(self._conn_str())
-        with conn.cursor() as cursor:
-            sql = """
-                IF EXISTS (SELECT 1 FROM Records WHERE QuestionID = ? AND UserID = ?)
-                    BEGIN
-                        UPDATE Records
-                        SET Correct = ?
-                        WHERE QuestionID = ? AND UserID = ?
-                    END
-                ELSE
-                    BEGIN
-                        INSERT INTO Records
-                        VALUES (?, ?, ?)
-                    END
-            """
+        with self._pool.connection() as conn, conn.cursor() as cursor:
             try:
-                cursor.execute(sql, question, user, correct, question, user, question, user, correct)
+                cursor.execute(self._sql_merge_records.format(values="(?, ?, ?)"), question, user, int(correct))
             except pyodbc.IntegrityError:
                 # user or question does not exist
                 raise ValueError(f"Invalid question or user id.")
 
+    def update_correct_many(self, records):
+        result = BatchResult()
+        # keep only the last answer of each (question, user) pair, MERGE does not allow duplicate sources
+        latest = {}
+        for i, (question, user, correct) in enumerate(records):
+            latest[(question, user)] = (i, int(correct))
+        if not latest:
+            return result
+        items = list(latest.items())
+        try:
+            with self._pool.connection() as conn, conn.cursor() as cursor:
+                for start in range(0, len(items), self._MERGE_CHUNK_SIZE):
+                    chunk = items[start:start + self._MERGE_CHUNK_SIZE]
+                    sql = self._sql_merge_records.format(values=", ".join(["(?, ?, ?)"] * len(chunk)))
+                    params = [p for (question, user), (_, correct) in chunk for p in (question, user, correct)]
+                    cursor.execute(sql, params)
+        except pyodbc.IntegrityError:
+            # some question or user does not exist. the whole batch was rolled back,
+            # so write the records one by one to find the invalid ones.
+            fallback = super().update_correct_many([(q, u, c) for (q, u), (_, c) in items])
+            result.added = fallback.added
+            for index, reason in fallback.failures:
+                result.fail(items[index][1][0], reason)
+            return result
+        result.added = len(items)
+        return result
+
     def get_results_by(self, by, order_by=None, ascending=True, limit=None):
         # validate params
         if order_by and order_by not in {'Correct', 'Incorrect'}:
@@ -230,49 +740,203 @@ class DbSqlServer(DAL):
             if not ascending:
                 sql += " DESC"
 
-        conn = pyodbc.connect(self._conn_str())
-        result = pd.read_sql(sql, conn, params=params)
+        with self._pool.connection() as conn:
+            result = pd.read_sql(sql, conn, params=params)
         if by == 'difficulty':
             result['Difficulty'] = result['Difficulty'].map(lambda x: Difficulties(x).name)
         return result
 
-    def _add_answers(self, q_id, wrong_answers, conn):
-        # helper method to add answers to the database for multiple type questions
+    def get_leaderboard(self, limit=10, after=None):
+        if after:
+            sql, params = self._sql_leaderboard_after, [limit, limit, after[0], after[1], limit, after[0]]
+        else:
+            sql, params = self._sql_leaderboard.format(where=""), [limit]
+        above, counts = 0, {}
+        with self._pool.connection() as conn, conn.cursor() as cursor:
+            rows = [tuple(row) for row in cursor.execute(sql, params).fetchall()]
+            if rows:
+                above = cursor.execute("SELECT ISNULL(SUM(Users), 0) FROM ScoreCounts WHERE Correct > ?",
+                                       rows[0][0]).fetchval()
+                counts = dict(tuple(row) for row in cursor.execute(
+                    "SELECT Correct, Users FROM ScoreCounts WHERE Correct > ? AND Correct <= ?",
+                    rows[-1][0], rows[0][0]).fetchall())
+        return self._leaderboard_page(rows, above, counts, limit)
+
+    def get_user_rank(self, name):
+        with self._pool.connection() as conn, conn.cursor() as cursor:
+            row = cursor.execute(self._sql_user_rank, name).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['rank', 'correct', 'incorrect'], row))
+
+    def _purge_batch(self, batch_size):
+        with self._pool.connection() as conn, conn.cursor() as cursor:
+            name, deleted, done = cursor.execute(self._sql_purge_batch, batch_size, batch_size).fetchone()
+        if name is None:
+            return None
+        return name, deleted, bool(done)
+
+    def rebuild_stats(self):
+        with self._pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(self._sql_rebuild_stats)
+
+    def export_watermark(self):
+        # the lowest rowversion of the running transactions. all the rows with a lower version are committed.
+        with self._pool.connection() as conn, conn.cursor() as cursor:
+            return cursor.execute("SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT)").fetchval()
+
+    def export_rows(self, table, since=None, batch_size=10000):
+        self._check_export_table(table)
+        # the rows are streamed by the default (forward only) result set of the server.
+        # the connection is taken from the pool until the export of the table ends.
+        with self._pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(self._sql_export[table], since or 0)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                if table == 'questions':
+                    rows = [(q_id, category, Types(q_type).name, Difficulties(difficulty).name, *rest)
+                            for q_id, category, q_type, difficulty, *rest in rows]
+                else:
+                    rows = [tuple(row) for row in rows]
+                yield rows
+
+    @staticmethod
+    def _rows_to_questions(rows):
+        # helper method for the get questions methods. groups rows of questions joined with
+        # their wrong answers to a list of questions.
+        questions = {}
+        for row in rows:
+            question = questions.get(row.QuestionID)
+            if question is None:
+                question = {
+                    'id': row.QuestionID,
+                    'type': Types(row.QuestionType).name,
+                    'question': row.Question,
+                    'correct_answer': row.CorrectAnswer
+                }
+                if question['type'] == 'multiple':
+                    question['wrong_answers'] = []
+                questions[row.QuestionID] = question
+            if row.Answer is not None and question['type'] == 'multiple':
+                question['wrong_answers'].append(row.Answer)
+        return list(questions.values())
+
+    def _connect(self):
+        # factory for the connection pool
+        conn = pyodbc.connect(self._conn_str)
+        return conn if self._slow_queries is None else _LoggedConnection(conn, self)
+
+    def _check_slow(self, sql, params, seconds, rows=None):
+        # records the statement in the slow query log if it took too long.
+        # params are the positional parameters of the statement, or a single sequence of them.
+        if not self._slow_queries.is_slow(seconds):
+            return
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        params = list(params)
+        logged_params = params if rows is None else {'rows': rows, 'first': params}  # executemany
+        self._slow_queries.record(type(self).__name__, sql, logged_params, seconds, self._showplan(sql, params))
+
+    def _showplan(self, sql, params):
+        # returns the estimated plan of a statement as xml. with SHOWPLAN_XML the statement is compiled
+        # but not executed. returns a description of the error if the plan can't be produced.
+        with self._plan_lock:
+            try:
+                if self._plan_conn is None:
+                    self._plan_conn = pyodbc.connect(self._conn_str, autocommit=True)
+                with self._plan_conn.cursor() as cursor:
+                    cursor.execute("SET SHOWPLAN_XML ON")
+                    try:
+                        if params:
+                            cursor.execute(sql, params)
+                        else:
+                            cursor.execute(sql)
+                        plans = []
+                        while True:
+                            if cursor.description:
+                                plans += [row[0] for row in cursor.fetchall()]
+                            if not cursor.nextset():
+                                break
+                        return "\n".join(plans)
+                    finally:
+                        cursor.execute("SET SHOWPLAN_XML OFF")
+            except pyodbc.Error as e:
+                return f"no plan: {e}"
+
+    @staticmethod
+    def _ping(conn):
+        # health check for the connection pool. raises pyodbc.Error if the connection is broken.
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1").fetchval()
+
+    def _add_answers(self, q_id, wrong_answers, cursor):
+        # helper method to add answers to the database for multiple type questions,
+        # in the transaction of the cursor that inserted the question
         sql = """
             INSERT INTO Answers
             VALUES (?, ?)
         """
         params = [(q_id, a) for a in wrong_answers]
-        with conn.cursor() as cursor:
-            try:
-                cursor.executemany(sql, params)
-            except pyodbc.IntegrityError:
-                raise ValueError("Invalid question id.")
-            except pyodbc.DataError:
-                raise ValueError("Too many characters for one of the wrong answers. (max: {})."
-                                 .format(self.MAX_ANSWER_LENGTH))
+        try:
+            cursor.executemany(sql, params)
+        except pyodbc.IntegrityError:
+            raise ValueError("Invalid question id.")
+        except pyodbc.DataError:
+            raise ValueError("Too many characters for one of the wrong answers. (max: {})."
+                             .format(self.MAX_ANSWER_LENGTH))
 
-    def _get_answers(self, q_id, conn):
-        # helper method for get_questions. gets the incorrect answers for the given question
-        with conn.cursor() as cursor:
-            sql = """
-                SELECT Answer
-                FROM Answers
-                WHERE QuestionID = ?
-            """
-            return [a[0] for a in cursor.execute(sql, q_id).fetchall()]
-
-    def _is_duplicate(self, question):
-        # helper method for add_question. checks if a given question is already in the database.
-        conn = pyodbc.connect(self._conn_str())
+    def _insert_questions(self, questions, cat_ids, conn):
+        # helper method for add_questions. inserts validated questions, given as (question, hash) tuples,
+        # with a single multi-row insert that skips the duplicates, and the wrong answers of the inserted
+        # questions with a single executemany, in one transaction. returns the hashes of the inserted questions.
+        sql = self._sql_insert_questions.format(values=", ".join([self._QUESTION_ROW] * len(questions)))
+        params = []
+        for (category, q_type, difficulty, question, correct_answer, _), q_hash in questions:
+            params += [cat_ids[category], Types[q_type].value, Difficulties[difficulty].value,
+                       question, correct_answer, q_hash]
         with conn.cursor() as cursor:
-            sql = """
-                SELECT QuestionID
-                FROM Questions
-                WHERE Question = ?
-            """
-            return cursor.execute(sql, question).fetchval() is not None
+            ids = {q_hash: q_id for q_id, q_hash in cursor.execute(sql, params).fetchall()}
+            answers = [(ids[q_hash], a) for q, q_hash in questions if q_hash in ids and q[5] for a in q[5]]
+            if answers:
+                cursor.fast_executemany = True
+                cursor.executemany("INSERT INTO Answers VALUES (?, ?)", answers)
+        return ids.keys()
 
+    def backfill_question_hashes(self, batch_size=1000):
+        batch_size = min(batch_size, self._MAX_PARAMS // 2)
+        hashed, duplicates = 0, []
+        last_id = 0
+        with self._pool.connection() as conn:
+            while True:
+                with conn.cursor() as cursor:
+                    sql = """
+                        SELECT TOP (?) QuestionID, Question
+                        FROM Questions
+                        WHERE QuestionHash IS NULL AND QuestionID > ?
+                        ORDER BY QuestionID
+                    """
+                    rows = cursor.execute(sql, batch_size, last_id).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                # the first question with a hash in the batch gets it, like the first one added
+                batch = {}
+                for q_id, question in rows:
+                    q_hash = self.question_hash(question)
+                    if q_hash in batch:
+                        duplicates.append(q_id)
+                    else:
+                        batch[q_hash] = q_id
+                params = [p for q_hash, q_id in batch.items() for p in (q_id, q_hash)]
+                values = ", ".join(["(?, CAST(? AS CHAR(40)))"] * len(batch))
+                with conn.cursor() as cursor:
+                    sql = self._sql_backfill_hashes.format(values=values)
+                    updated = {row[0] for row in cursor.execute(sql, params).fetchall()}
+                hashed += len(updated)
+                duplicates += [q_id for q_id in batch.values() if q_id not in updated]
+        return hashed, sorted(duplicates)
 
 if __name__ == "__main__":
     pass
@@ -0,0 +1,803 @@
+from dal import *
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+import pandas as pd
+
+
+class DbSqlite(DAL):
+    """
+    Implementation of the DAL using an embedded sqlite database file.
+    The schema mirrors SQL_DB_creation.sql and is created on first use, so no server is needed.
+
+    Every thread gets its own long-lived connection (sqlite connections can't be shared between threads).
+    The connections run in WAL mode, so readers don't block the writer and vice versa.
+    The statements are constant strings and are compiled once per connection by the statement cache
+        of the sqlite3 module, batches are written with executemany.
+    """
+
+    DB_PATH = 'trivia.db'
+    MAX_QUESTION_LENGTH = 300
+    MAX_ANSWER_LENGTH = 150
+    # the number of compiled statements kept by each connection
+    _STATEMENT_CACHE_SIZE = 256
+    # how long (in milliseconds) a writer waits for another writer to finish
+    _BUSY_TIMEOUT = 5000
+    # picked questions read per statement, within the parameters limit of sqlite versions before 3.32 (999)
+    _PICK_CHUNK_SIZE = 900
+
+    _sql_schema = """
+        CREATE TABLE IF NOT EXISTS Categories (
+            CategoryID INTEGER PRIMARY KEY,
+            CategoryName TEXT NOT NULL UNIQUE CHECK (length(CategoryName) > 0),
+            -- a removed category is hidden (Removing = 1) and then deleted in batches (see purge_categories)
+            Removing INTEGER NOT NULL DEFAULT 0
+        );
+
+        -- random sampling (see get_questions). the questions of every (category, difficulty) bucket are numbered
+        -- 1..n without gaps by BucketSeq. questions are only removed with their category, which is hidden first
+        -- (see hide_category), so the numbers of the buckets that are sampled stay dense.
+        -- duplicate detection by the normalized content hash of the question (see DAL.question_hash).
+        -- near-duplicates found by backfill_question_hashes have no hash (NULLs are not unique).
+        CREATE TABLE IF NOT EXISTS Questions (
+            QuestionID INTEGER PRIMARY KEY,
+            CategoryID INTEGER REFERENCES Categories(CategoryID) ON DELETE CASCADE,
+            QuestionType INTEGER NOT NULL CHECK (QuestionType IN (1, 2)),
+            Difficulty INTEGER NOT NULL CHECK (Difficulty IN (1, 2, 3)),
+            Question TEXT NOT NULL UNIQUE CHECK (length(Question) <= 300),
+            CorrectAnswer TEXT NOT NULL CHECK (length(CorrectAnswer) <= 150),
+            Version INTEGER NOT NULL DEFAULT 0,
+            QuestionHash TEXT,
+            BucketSeq INTEGER NOT NULL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS UX_Questions_QuestionHash ON Questions(QuestionHash);
+        -- serves get_questions, get_all_questions and get_difficulties
+        CREATE UNIQUE INDEX IF NOT EXISTS UX_Questions_Bucket ON Questions(CategoryID, Difficulty, BucketSeq);
+
+        CREATE TABLE IF NOT EXISTS Answers (
+            AnswerID INTEGER PRIMARY KEY,
+            QuestionID INTEGER REFERENCES Questions(QuestionID) ON DELETE CASCADE,
+            Answer TEXT NOT NULL CHECK (length(Answer) <= 150)
+        );
+        CREATE INDEX IF NOT EXISTS IX_Answers_QuestionID ON Answers(QuestionID, Answer);
+
+        CREATE TABLE IF NOT EXISTS Users (
+            UserID INTEGER PRIMARY KEY,
+            UserName TEXT NOT NULL UNIQUE CHECK (length(UserName) > 0),
+            Version INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS Records (
+            QuestionID INTEGER REFERENCES Questions(QuestionID) ON DELETE CASCADE,
+            UserID INTEGER REFERENCES Users(UserID) ON DELETE CASCADE,
+            Correct INTEGER CHECK (Correct IN (0, 1)),
+            Version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (UserID, QuestionID)
+        ) WITHOUT ROWID;
+        -- serves the cascading delete of questions
+        CREATE INDEX IF NOT EXISTS IX_Records_QuestionID ON Records(QuestionID);
+
+        -- change tracking for the incremental exports. the written rows get the current version of ExportVersion,
+        -- which export_watermark increments.
+        CREATE TABLE IF NOT EXISTS ExportVersion (Version INTEGER NOT NULL);
+        INSERT INTO ExportVersion SELECT 1 WHERE NOT EXISTS (SELECT * FROM ExportVersion);
+        CREATE INDEX IF NOT EXISTS IX_Questions_Version ON Questions(Version);
+        CREATE INDEX IF NOT EXISTS IX_Users_Version ON Users(Version);
+        CREATE INDEX IF NOT EXISTS IX_Records_Version ON Records(Version);
+
+        -- statistics counters, maintained by update_correct
+
+        CREATE TABLE IF NOT EXISTS CategoryStats (
+            CategoryID INTEGER PRIMARY KEY REFERENCES Categories(CategoryID) ON DELETE CASCADE,
+            Correct INTEGER NOT NULL DEFAULT 0,
+            Incorrect INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS DifficultyStats (
+            Difficulty INTEGER PRIMARY KEY CHECK (Difficulty IN (1, 2, 3)),
+            Correct INTEGER NOT NULL DEFAULT 0,
+            Incorrect INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS UserStats (
+            UserID INTEGER PRIMARY KEY REFERENCES Users(UserID) ON DELETE CASCADE,
+            Correct INTEGER NOT NULL DEFAULT 0,
+            Incorrect INTEGER NOT NULL DEFAULT 0
+        );
+
+        -- the leaderboard (see get_leaderboard): the users by number of correct answers in the index of UserStats,
+        -- and the number of users per number of correct answers in ScoreCounts, maintained by update_correct.
+        CREATE INDEX IF NOT EXISTS IX_UserStats_Correct ON UserStats(Correct, UserID);
+        CREATE TABLE IF NOT EXISTS ScoreCounts (
+            Correct INTEGER PRIMARY KEY,
+            Users INTEGER NOT NULL
+        );
+
+        -- the answered questions of every user by bucket (see AnsweredSeqs), a row per word of the bitmap.
+        -- maintained by update_correct, serves get_questions with exclude_answered.
+        CREATE TABLE IF NOT EXISTS AnsweredBits (
+            UserID INTEGER REFERENCES Users(UserID) ON DELETE CASCADE,
+            CategoryID INTEGER REFERENCES Categories(CategoryID) ON DELETE CASCADE,
+            Difficulty INTEGER NOT NULL,
+            Word INTEGER NOT NULL,
+            Bits INTEGER NOT NULL,
+            PRIMARY KEY (UserID, CategoryID, Difficulty, Word)
+        ) WITHOUT ROWID;
+        -- serves the deletion of the bitmaps of a removed category (see purge_categories)
+        CREATE INDEX IF NOT EXISTS IX_AnsweredBits_CategoryID ON AnsweredBits(CategoryID);
+    """
+
+    # builds the bitmaps from the records, for rebuild_stats.
+    # the records of a user are unique per question, so the sum of their bits is their bitwise OR.
+    _sql_build_answered = """
+        INSERT INTO AnsweredBits (UserID, CategoryID, Difficulty, Word, Bits)
+        SELECT r.UserID, q.CategoryID, q.Difficulty, (q.BucketSeq - 1) / 32, SUM(1 << ((q.BucketSeq - 1) % 32))
+        FROM Records r JOIN Questions q
+        ON q.QuestionID = r.QuestionID
+        GROUP BY r.UserID, q.CategoryID, q.Difficulty, (q.BucketSeq - 1) / 32
+    """
+    # builds the counts from the user counters, for rebuild_stats
+    _sql_build_scores = """
+        INSERT INTO ScoreCounts (Correct, Users)
+        SELECT Correct, COUNT(*) FROM UserStats GROUP BY Correct
+    """
+    # moves the users selected by a subquery out of the counts (sign -1) before their counters are updated,
+    # and back in (sign 1) after
+    _sql_move_scores = """
+        INSERT INTO ScoreCounts (Correct, Users)
+        SELECT s.Correct, {sign} * COUNT(*)
+        FROM UserStats s
+        WHERE s.UserID IN ({users})
+        GROUP BY s.Correct
+        ON CONFLICT (Correct) DO UPDATE SET Users = Users + excluded.Users
+    """
+
+    # sql for the export_rows method by table
+    _sql_export = {
+        'questions': """
+            SELECT q.QuestionID, c.CategoryName, q.QuestionType, q.Difficulty, q.Question, q.CorrectAnswer, q.Version
+            FROM Questions q JOIN Categories c
+            ON c.CategoryID = q.CategoryID
+            WHERE q.Version >= ?
+        """,
+        'answers': """
+            SELECT a.QuestionID, a.Answer, q.Version
+            FROM Answers a JOIN Questions q
+            ON q.QuestionID = a.QuestionID
+            WHERE q.Version >= ?
+        """,
+        'users': "SELECT UserID, UserName, Version FROM Users WHERE Version >= ?",
+        'records': "SELECT QuestionID, UserID, Correct, Version FROM Records WHERE Version >= ?"
+    }
+
+    # per connection staging tables for update_correct_many
+    _sql_temp_schema = """
+        CREATE TEMP TABLE IF NOT EXISTS Batch (QuestionID INTEGER, UserID INTEGER, Correct INTEGER);
+        CREATE TEMP TABLE IF NOT EXISTS Changes (
+            CategoryID INTEGER, Difficulty INTEGER, UserID INTEGER, DC INTEGER, DI INTEGER
+        );
+        CREATE TEMP TABLE IF NOT EXISTS Purge (QuestionID INTEGER PRIMARY KEY);
+    """
+
+    # sql for the get_results_by method. reads the statistics counters maintained by update_correct.
+    _sql_get_results_by = {
+        'category': """
+            SELECT c.CategoryName as Category, s.Correct, s.Incorrect
+            FROM CategoryStats s JOIN Categories c
+            ON c.CategoryID = s.CategoryID
+            WHERE s.Correct + s.Incorrect > 0 AND c.Removing = 0
+        """,
+        'difficulty': """
+            SELECT s.Difficulty, s.Correct, s.Incorrect
+            FROM DifficultyStats s
+            WHERE s.Correct + s.Incorrect > 0
+        """,
+        'user': """
+            SELECT u.UserName, s.Correct, s.Incorrect
+            FROM UserStats s JOIN Users u
+            ON u.UserID = s.UserID
+            WHERE s.Correct + s.Incorrect > 0
+        """
+    }
+
+    # sql for get_answered and get_questions with exclude_answered. a seek of the primary key of the bitmaps.
+    _sql_get_answered = """
+        SELECT Word, Bits
+        FROM AnsweredBits
+        WHERE UserID = ? AND CategoryID = (SELECT CategoryID FROM Categories WHERE CategoryName = ?)
+        AND Difficulty = ?
+    """
+
+    # sql for the get_leaderboard method. reads the users in the order of the index.
+    _sql_leaderboard = """
+        SELECT s.Correct, s.UserID, u.UserName, s.Incorrect
+        FROM UserStats s JOIN Users u
+        ON u.UserID = s.UserID
+        WHERE s.Correct + s.Incorrect > 0 {where}
+        ORDER BY s.Correct DESC, s.UserID DESC
+        LIMIT ?
+    """
+    # the page after a cursor: the rest of the users with the number of correct answers of the cursor, then the
+    # users with fewer. two seeks, since (Correct, UserID) < (?, ?) seeks the index by Correct only and scans
+    # all the users with that number before the cursor.
+    _sql_leaderboard_after = f"""
+        SELECT * FROM ({_sql_leaderboard.format(where="AND s.Correct = ? AND s.UserID < ?")})
+        UNION ALL
+        SELECT * FROM ({_sql_leaderboard.format(where="AND s.Correct < ?")})
+        ORDER BY 1 DESC, 2 DESC
+        LIMIT ?
+    """
+    _sql_user_rank = """
+        SELECT 1 + (SELECT IFNULL(SUM(c.Users), 0) FROM ScoreCounts c WHERE c.Correct > s.Correct),
+               s.Correct, s.Incorrect
+        FROM Users u JOIN UserStats s
+        ON s.UserID = u.UserID
+        WHERE u.UserName = ? AND s.Correct + s.Incorrect > 0
+    """
+
+    # sql for the update_correct methods, run in order in one transaction over the staged Batch table.
+    # the changes (with the former result of re-answered questions) are computed before the records are
+    # upserted and are then added to the statistics counters (moving the users between the counts of the
+    # leaderboard). the bits of the answered questions are set in
+    # the bitmaps of the users (see AnsweredSeqs).
+    _sql_merge_records = [
+        "DELETE FROM temp.Changes",
+        """
+        INSERT INTO temp.Changes
+        SELECT q.CategoryID, q.Difficulty, b.UserID,
+               b.Correct - IFNULL(r.Correct, 0), (1 - b.Correct) - IFNULL(1 - r.Correct, 0)
+        FROM temp.Batch b JOIN Questions q
+        ON q.QuestionID = b.QuestionID
+        LEFT JOIN Records r
+        ON r.UserID = b.UserID AND r.QuestionID = b.QuestionID
+        WHERE r.Correct IS NULL OR r.Correct <> b.Correct
+        """,
+        """
+        INSERT INTO Records (QuestionID, UserID, Correct, Version)
+        SELECT QuestionID, UserID, Correct, (SELECT Version FROM ExportVersion) FROM temp.Batch WHERE true
+        ON CONFLICT (UserID, QuestionID) DO UPDATE SET Correct = excluded.Correct, Version = excluded.Version
+        WHERE Correct <> excluded.Correct
+        """,
+        """
+        INSERT INTO AnsweredBits (UserID, CategoryID, Difficulty, Word, Bits)
+        SELECT b.UserID, q.CategoryID, q.Difficulty, (q.BucketSeq - 1) / 32, 1 << ((q.BucketSeq - 1) % 32)
+        FROM temp.Batch b JOIN Questions q
+        ON q.QuestionID = b.QuestionID
+        WHERE true
+        ON CONFLICT (UserID, CategoryID, Difficulty, Word) DO UPDATE SET Bits = Bits | excluded.Bits
+        """,
+        """
+        INSERT INTO CategoryStats (CategoryID, Correct, Incorrect)
+        SELECT CategoryID, SUM(DC), SUM(DI) FROM temp.Changes GROUP BY CategoryID
+        ON CONFLICT (CategoryID) DO UPDATE
+        SET Correct = Correct + excluded.Correct, Incorrect = Incorrect + excluded.Incorrect
+        """,
+        """
+        INSERT INTO DifficultyStats (Difficulty, Correct, Incorrect)
+        SELECT Difficulty, SUM(DC), SUM(DI) FROM temp.Changes GROUP BY Difficulty
+        ON CONFLICT (Difficulty) DO UPDATE
+        SET Correct = Correct + excluded.Correct, Incorrect = Incorrect + excluded.Incorrect
+        """,
+        _sql_move_scores.format(sign=-1, users="SELECT UserID FROM temp.Changes"),
+        """
+        INSERT INTO UserStats (UserID, Correct, Incorrect)
+        SELECT UserID, SUM(DC), SUM(DI) FROM temp.Changes GROUP BY UserID
+        ON CONFLICT (UserID) DO UPDATE
+        SET Correct = Correct + excluded.Correct, Incorrect = Incorrect + excluded.Incorrect
+        """,
+        _sql_move_scores.format(sign=1, users="SELECT UserID FROM temp.Changes")
+    ]
+
+    # sql for the rebuild_stats method. recomputes all the counters and bitmaps from the records.
+    _sql_rebuild_stats = [
+        "DELETE FROM CategoryStats",
+        "DELETE FROM DifficultyStats",
+        "DELETE FROM UserStats",
+        "DELETE FROM ScoreCounts",
+        "DELETE FROM AnsweredBits",
+        _sql_build_answered,
+        """
+        INSERT INTO CategoryStats (CategoryID, Correct, Incorrect)
+        SELECT q.CategoryID, SUM(r.Correct), SUM(1 - r.Correct)
+        FROM Questions q JOIN Records r
+        ON r.QuestionID = q.QuestionID
+        GROUP BY q.CategoryID
+        """,
+        """
+        INSERT INTO DifficultyStats (Difficulty, Correct, Incorrect)
+        SELECT q.Difficulty, SUM(r.Correct), SUM(1 - r.Correct)
+        FROM Questions q JOIN Records r
+        ON r.QuestionID = q.QuestionID
+        GROUP BY q.Difficulty
+        """,
+        """
+        INSERT INTO UserStats (UserID, Correct, Incorrect)
+        SELECT r.UserID, SUM(r.Correct), SUM(1 - r.Correct)
+        FROM Records r
+        GROUP BY r.UserID
+        """,
+        _sql_build_scores
+    ]
+
+    # sql for the purge_categories method, run in order in one transaction over a batch of questions of a hidden
+    # category staged in the Purge table. the records of the questions are removed from the difficulty and
+    # user counters (moving the users between the counts of the leaderboard), and the questions are deleted
+    # with their answers and records by the cascading delete. the category counters are removed with the category.
+    # CROSS JOIN keeps the batch as the outer loop (the planner has no statistics of the temp table, and would
+    # scan the records instead).
+    _sql_purged_users = "SELECT r.UserID FROM temp.Purge p CROSS JOIN Records r ON r.QuestionID = p.QuestionID"
+    _sql_purge_questions = [
+        """
+        UPDATE DifficultyStats AS s SET Correct = s.Correct - d.C, Incorrect = s.Incorrect - d.I
+        FROM (
+            SELECT q.Difficulty, SUM(r.Correct) AS C, SUM(1 - r.Correct) AS I
+            FROM temp.Purge p CROSS JOIN Questions q
+            ON q.QuestionID = p.QuestionID
+            CROSS JOIN Records r
+            ON r.QuestionID = p.QuestionID
+            GROUP BY q.Difficulty
+        ) AS d
+        WHERE s.Difficulty = d.Difficulty
+        """,
+        _sql_move_scores.format(sign=-1, users=_sql_purged_users),
+        """
+        UPDATE UserStats AS s SET Correct = s.Correct - d.C, Incorrect = s.Incorrect - d.I
+        FROM (
+            SELECT r.UserID, SUM(r.Correct) AS C, SUM(1 - r.Correct) AS I
+            FROM temp.Purge p CROSS JOIN Records r
+            ON r.QuestionID = p.QuestionID
+            GROUP BY r.UserID
+        ) AS d
+        WHERE s.UserID = d.UserID
+        """,
+        _sql_move_scores.format(sign=1, users=_sql_purged_users),
+        "DELETE FROM Questions WHERE QuestionID IN (SELECT QuestionID FROM temp.Purge)"
+    ]
+
+    def __init__(self, path=DB_PATH):
+        """
+        Args:
+            path (str): The path of the database file. It is created if it doesn't exist.
+                Defaults to trivia.db in the working directory.
+        """
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._schema_lock = threading.Lock()
+        self._schema_created = False
+
+    def close(self):
+        """ Closes the connections of all the threads. New connections are opened if the instance is used again."""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._local = threading.local()
+
+    def add_question(self, category, q_type, difficulty, question, correct_answer, wrong_answers=None):
+        if len(question) > self.MAX_QUESTION_LENGTH or len(correct_answer) > self.MAX_ANSWER_LENGTH:
+            raise ValueError("Too many characters for the question (max: {}) or the correct answer (max: {})."
+                             .format(self.MAX_QUESTION_LENGTH, self.MAX_ANSWER_LENGTH))
+        if wrong_answers and any(len(a) > self.MAX_ANSWER_LENGTH for a in wrong_answers):
+            raise ValueError("Too many characters for one of the wrong answers. (max: {})."
+                             .format(self.MAX_ANSWER_LENGTH))
+        try:
+            q_type_value, difficulty_value = Types[q_type].value, Difficulties[difficulty].value
+        except KeyError:
+            raise ValueError(f"Invalid question type {q_type} or difficulty {difficulty}.")
+        cat_id = self.add_category(category)
+        try:
+            with self._transaction() as cursor:
+                if not self._insert_question(cursor, cat_id, q_type_value, difficulty_value, question,
+                                             correct_answer, wrong_answers if q_type == Types.multiple.name else None):
+                    raise ValueError(self.DUPLICATE_QUESTION)
+        except sqlite3.IntegrityError:
+            self._category_ids.pop(category)  # removed by another process
+            raise ValueError(f"Category {category} does not exist.")
+
+    def add_questions(self, questions):
+        result = BatchResult()
+        valid = []
+        for i, q in enumerate(questions):
+            try:
+                valid.append((i, self._validate_question(q)))
+            except ValueError as e:
+                result.fail(i, e)
+        if not valid:
+            return result
+
+        # resolve every category of the batch once. the questions of a category that can't be added
+        # (e.g. it is being removed) fail.
+        cat_ids = {}
+        for _, q in valid:
+            if q[0] not in cat_ids:
+                try:
+                    cat_ids[q[0]] = self.add_category(q[0])
+                except ValueError as e:
+                    cat_ids[q[0]] = e
+        # a single transaction for the whole batch. the duplicates (in the database or in the batch)
+        # are skipped by the unique index on the question hash.
+        with self._transaction() as cursor:
+            for i, (category, q_type, difficulty, question, correct_answer, wrong_answers) in valid:
+                if isinstance(cat_ids[category], ValueError):
+                    result.fail(i, cat_ids[category])
+                elif self._insert_question(cursor, cat_ids[category], Types[q_type].value,
+                                           Difficulties[difficulty].value, question, correct_answer, wrong_answers):
+                    result.added += 1
+                else:
+                    result.fail(i, self.DUPLICATE_QUESTION)
+        return result
+
+    def import_questions(self, amount=1, difficulty=None, category=None):
+        # import questions from the opentdb website
+        questions = super()._import_questions_from_opentdb(amount, difficulty, category)
+
+        # add the questions to the database.
+        # some questions can be duplicates so return how many were added
+        return self.add_questions(questions).added
+
+    def add_category(self, name):
+        cat_id = self._category_ids.get(name)
+        if cat_id is not None:
+            return cat_id
+        with self._transaction() as cursor:
+            try:
+                cursor.execute("INSERT INTO Categories (CategoryName) VALUES (?) "
+                               "ON CONFLICT (CategoryName) DO NOTHING", (name,))
+            except sqlite3.IntegrityError:  # empty name
+                raise ValueError("Category name cannot be empty.")
+            cat_id, removing = cursor.execute("SELECT CategoryID, Removing FROM Categories WHERE CategoryName = ?",
+                                              (name,)).fetchone()
+        if removing:
+            raise ValueError(f"Category {name} is being removed.")
+        self._category_ids.put(name, cat_id)
+        self._category_list.clear()
+        return cat_id
+
+    def hide_category(self, name):
+        self._category_ids.pop(name)
+        self._category_list.clear()
+        with self._transaction() as cursor:
+            cursor.execute("UPDATE Categories SET Removing = 1 WHERE CategoryName = ? AND Removing = 0", (name,))
+            return cursor.rowcount > 0
+
+    def get_categories(self):
+        categories = self._category_list.get('all')
+        if categories is None:
+            rows = self._connection().execute("SELECT CategoryName FROM Categories WHERE Removing = 0").fetchall()
+            categories = [row[0] for row in rows]
+            self._category_list.put('all', categories)
+        return list(categories)
+
+    def get_difficulties(self, category):
+        sql = """
+            SELECT DISTINCT q.Difficulty
+            FROM Questions q JOIN Categories c
+            ON q.CategoryID = c.CategoryID
+            WHERE c.CategoryName = ? AND c.Removing = 0
+        """
+        rows = self._connection().execute(sql, (category,)).fetchall()
+        return [Difficulties(d).name for d, in sorted(rows)]
+
+    def get_questions(self, amount, category, difficulty, exclude_answered=False, user=None):
+        # the questions of a bucket are numbered 1..n without gaps, so a uniform sample is drawn by picking
+        # amount random numbers. the size of the bucket and the picked questions (with their wrong answers)
+        # are read with seeks of the bucket index, instead of sorting the bucket.
+        # each question appears once per wrong answer (or once with a NULL answer for boolean questions).
+        # a hidden category has no questions to pick.
+        self._check_answered_user(exclude_answered, user)
+        conn = self._connection()
+        difficulty = Difficulties[difficulty].value
+        last = conn.execute("""
+            SELECT BucketSeq
+            FROM Questions
+            WHERE CategoryID = (SELECT CategoryID FROM Categories WHERE CategoryName = ? AND Removing = 0)
+            AND Difficulty = ?
+            ORDER BY BucketSeq DESC
+            LIMIT 1
+        """, (category, difficulty)).fetchone()
+        size = last[0] if last else 0
+        if exclude_answered:
+            words = conn.execute(self._sql_get_answered, (user, category, difficulty)).fetchall()
+            seqs = self._sample_unanswered(size, amount, AnsweredSeqs(dict(words)))
+        else:
+            seqs = self._sample_seqs(size, amount)
+        rows = []
+        for start in range(0, len(seqs), self._PICK_CHUNK_SIZE):
+            chunk = seqs[start:start + self._PICK_CHUNK_SIZE]
+            sql = f"""
+                SELECT q.QuestionID, q.QuestionType, q.Question, q.CorrectAnswer, a.Answer
+                FROM Questions q LEFT JOIN Answers a
+                ON a.QuestionID = q.QuestionID
+                WHERE q.CategoryID = (SELECT CategoryID FROM Categories WHERE CategoryName = ?) AND q.Difficulty = ?
+                AND q.BucketSeq IN ({", ".join("?" * len(chunk))})
+            """
+            rows += conn.execute(sql, (category, difficulty, *chunk)).fetchall()
+        # the join does not keep the random order of the picked questions
+        out = self._rows_to_questions(rows)
+        random.shuffle(out)
+        return out
+
+    def get_all_questions(self, category, difficulty):
+        sql = """
+            SELECT q.QuestionID, q.QuestionType, q.Question, q.CorrectAnswer, a.Answer, q.BucketSeq
+            FROM Questions q JOIN Categories c
+            ON q.CategoryID = c.CategoryID
+            LEFT JOIN Answers a
+            ON a.QuestionID = q.QuestionID
+            WHERE c.CategoryName = ? AND c.Removing = 0 AND q.Difficulty = ?
+        """
+        rows = self._connection().execute(sql, (category, Difficulties[difficulty].value)).fetchall()
+        seqs = {row[0]: row[5] for row in rows}
+        questions = self._rows_to_questions([row[:5] for row in rows])
+        for q in questions:
+            q['seq'] = seqs[q['id']]
+        return questions
+
+    def get_answered(self, user, category, difficulty):
+        words = self._connection().execute(self._sql_get_answered,
+                                           (user, category, Difficulties[difficulty].value)).fetchall()
+        return AnsweredSeqs(dict(words))
+
+    def add_user(self, name):
+        user_id = self._user_ids.get(name)
+        if user_id is not None:
+            return user_id
+        with self._transaction() as cursor:
+            try:
+                cursor.execute("INSERT INTO Users (UserName, Version) VALUES (?, (SELECT Version FROM ExportVersion)) "
+                               "ON CONFLICT (UserName) DO NOTHING", (name,))
+            except sqlite3.IntegrityError:  # empty name
+                raise ValueError("Username cannot be empty.")
+            user_id = cursor.execute("SELECT UserID FROM Users WHERE UserName = ?", (name,)).fetchone()[0]
+        self._user_ids.put(name, user_id)
+        return user_id
+
+    def update_correct(self, question, user, correct):
+        try:
+            self._merge_records([(question, user, int(correct))])
+        except sqlite3.IntegrityError:
+            # user or question does not exist
+            raise ValueError(f"Invalid question or user id.")
+
+    def update_correct_many(self, records):
+        result = BatchResult()
+        # keep only the last answer of each (question, user) pair
+        latest = {}
+        for i, (question, user, correct) in enumerate(records):
+            latest[(question, user)] = (i, int(correct))
+        if not latest:
+            return result
+        items = list(latest.items())
+        try:
+            self._merge_records([(q, u, c) for (q, u), (_, c) in items])
+        except sqlite3.IntegrityError:
+            # some question or user does not exist. the whole batch was rolled back,
+            # so write the records one by one to find the invalid ones.
+            fallback = super().update_correct_many([(q, u, c) for (q, u), (_, c) in items])
+            result.added = fallback.added
+            for index, reason in fallback.failures:
+                result.fail(items[index][1][0], reason)
+            return result
+        result.added = len(items)
+        return result
+
+    def get_results_by(self, by, order_by=None, ascending=True, limit=None):
+        # validate params
+        if order_by and order_by not in {'Correct', 'Incorrect'}:
+            raise ValueError("order_by must be either 'Correct' or 'Incorrect' (case-sensitive)")
+        if by not in {'category', 'difficulty', 'user'}:
+            raise ValueError(f"Invalid value {by} for parameter by."
+                             f"Can only return results by category, difficulty or user.")
+
+        sql = self._sql_get_results_by[by].strip()
+        sql += f"\nORDER BY {order_by or 1}{'' if ascending else ' DESC'}"
+        params = []
+        if limit:
+            sql += "\nLIMIT ?"
+            params.append(limit)
+        result = pd.read_sql(sql, self._connection(), params=params)
+        if by == 'difficulty':
+            result['Difficulty'] = result['Difficulty'].map(lambda x: Difficulties(x).name)
+        return result
+
+    def get_leaderboard(self, limit=10, after=None):
+        if after:
+            sql, params = self._sql_leaderboard_after, [after[0], after[1], limit, after[0], limit, limit]
+        else:
+            sql, params = self._sql_leaderboard.format(where=""), [limit]
+        conn = self._connection()
+        # a read transaction, so the ranks are computed from the same snapshot as the page
+        conn.execute("BEGIN")
+        try:
+            rows = conn.execute(sql, params).fetchall()
+            above, counts = 0, {}
+            if rows:
+                above = conn.execute("SELECT IFNULL(SUM(Users), 0) FROM ScoreCounts WHERE Correct > ?",
+                                     (rows[0][0],)).fetchone()[0]
+                counts = dict(conn.execute("SELECT Correct, Users FROM ScoreCounts WHERE Correct > ? AND Correct <= ?",
+                                           (rows[-1][0], rows[0][0])))
+        finally:
+            conn.execute("COMMIT")
+        return self._leaderboard_page(rows, above, counts, limit)
+
+    def get_user_rank(self, name):
+        row = self._connection().execute(self._sql_user_rank, (name,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['rank', 'correct', 'incorrect'], row))
+
+    def rebuild_stats(self):
+        with self._transaction() as cursor:
+            for sql in self._sql_rebuild_stats:
+                cursor.execute(sql)
+
+    def export_watermark(self):
+        # the write transaction waits for the running writers, so when it commits all the rows with a lower
+        # version are committed, and the rows written from now on get the new version.
+        with self._transaction() as cursor:
+            cursor.execute("UPDATE ExportVersion SET Version = Version + 1")
+            return cursor.execute("SELECT Version FROM ExportVersion").fetchone()[0]
+
+    def export_rows(self, table, since=None, batch_size=10000):
+        self._check_export_table(table)
+        # a connection of its own, so the open statement doesn't hold a read transaction
+        # on the connection of the thread. the rows are read from a single snapshot.
+        self._connection()  # creates the schema
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                               timeout=self._BUSY_TIMEOUT / 1000)
+        try:
+            cursor = conn.execute(self._sql_export[table], (since or 0,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                if table == 'questions':
+                    rows = [(q_id, category, Types(q_type).name, Difficulties(difficulty).name, *rest)
+                            for q_id, category, q_type, difficulty, *rest in rows]
+                yield rows
+        finally:
+            conn.close()
+
+    def backfill_question_hashes(self, batch_size=1000):
+        hashed, duplicates = 0, []
+        last_id = 0
+        while True:
+            rows = self._connection().execute(
+                "SELECT QuestionID, Question FROM Questions WHERE QuestionHash IS NULL AND QuestionID > ? "
+                "ORDER BY QuestionID LIMIT ?", (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            with self._transaction() as cursor:
+                for q_id, question in rows:
+                    # a hash that belongs to another question is not stored
+                    cursor.execute("UPDATE OR IGNORE Questions SET QuestionHash = ? WHERE QuestionID = ?",
+                                   (self.question_hash(question), q_id))
+                    if cursor.rowcount:
+                        hashed += 1
+                    else:
+                        duplicates.append(q_id)
+        return hashed, duplicates
+
+    def _purge_batch(self, batch_size):
+        with self._transaction() as cursor:
+            row = cursor.execute(
+                "SELECT CategoryID, CategoryName FROM Categories WHERE Removing = 1 LIMIT 1").fetchone()
+            if row is None:
+                return None
+            cat_id, name = row
+            cursor.execute("DELETE FROM temp.Purge")
+            cursor.execute("INSERT INTO temp.Purge SELECT QuestionID FROM Questions WHERE CategoryID = ? LIMIT ?",
+                           (cat_id, batch_size))
+            deleted = cursor.rowcount
+            if deleted:
+                for sql in self._sql_purge_questions:
+                    cursor.execute(sql)
+                return name, deleted, False
+            cursor.execute("""
+                DELETE FROM AnsweredBits
+                WHERE CategoryID = ?1 AND (UserID, Difficulty, Word) IN (
+                    SELECT UserID, Difficulty, Word FROM AnsweredBits WHERE CategoryID = ?1 LIMIT ?2
+                )
+            """, (cat_id, batch_size))
+            if cursor.rowcount:
+                return name, 0, False
+            cursor.execute("DELETE FROM Categories WHERE CategoryID = ?", (cat_id,))
+            return name, 0, True
+
+    def _merge_records(self, records):
+        # helper method for the update_correct methods. writes (question, user, correct) records that are
+        # unique per (question, user) and updates the counters in a single transaction.
+        with self._transaction() as cursor:
+            cursor.execute("DELETE FROM temp.Batch")
+            cursor.executemany("INSERT INTO temp.Batch VALUES (?, ?, ?)", records)
+            for sql in self._sql_merge_records:
+                cursor.execute(sql)
+
+    @staticmethod
+    def _insert_question(cursor, cat_id, q_type, difficulty, question, correct_answer, wrong_answers):
+        # inserts a question with its wrong answers. returns False if the question (or its hash) already exists.
+        # the question is numbered after the last question of its bucket (see get_questions).
+        # the writers are serialized, so the numbers are unique.
+        cursor.execute("""
+            INSERT INTO Questions
+                (CategoryID, QuestionType, Difficulty, Question, CorrectAnswer, Version, QuestionHash, BucketSeq)
+            VALUES (?1, ?2, ?3, ?4, ?5, (SELECT Version FROM ExportVersion), ?6, (
+                SELECT IFNULL(MAX(BucketSeq), 0) + 1
+                FROM Questions
+                WHERE CategoryID = ?1 AND Difficulty = ?3
+            ))
+            ON CONFLICT DO NOTHING
+        """, (cat_id, q_type, difficulty, question, correct_answer, DAL.question_hash(question)))
+        if cursor.rowcount == 0:
+            return False
+        if wrong_answers:
+            q_id = cursor.lastrowid
+            cursor.executemany("INSERT INTO Answers (QuestionID, Answer) VALUES (?, ?)",
+                               [(q_id, a) for a in wrong_answers])
+        return True
+
+    @staticmethod
+    def _rows_to_questions(rows):
+        # helper method for the get questions methods. groups rows of questions joined with
+        # their wrong answers to a list of questions.
+        questions = {}
+        for q_id, q_type, question_text, correct_answer, answer in rows:
+            question = questions.get(q_id)
+            if question is None:
+                question = {
+                    'id': q_id,
+                    'type': Types(q_type).name,
+                    'question': question_text,
+                    'correct_answer': correct_answer
+                }
+                if question['type'] == 'multiple':
+                    question['wrong_answers'] = []
+                questions[q_id] = question
+            if answer is not None and question['type'] == 'multiple':
+                question['wrong_answers'].append(answer)
+        return list(questions.values())
+
+    @contextmanager
+    def _transaction(self):
+        # yields a cursor in a write transaction which is committed on exit and rolled back on an exception.
+        # BEGIN IMMEDIATE takes the write lock upfront, so concurrent writers wait (see _BUSY_TIMEOUT)
+        # instead of failing when upgrading a read transaction.
+        conn = self._connection()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield cursor
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            cursor.close()
+
+    def _connection(self):
+        # returns the connection of the current thread, opening it on first use
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # autocommit mode (isolation_level=None), transactions are explicit (see _transaction)
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                                   cached_statements=self._STATEMENT_CACHE_SIZE,
+                                   timeout=self._BUSY_TIMEOUT / 1000)
+            conn.execute("PRAGMA journal_mode = WAL")
+            # in WAL mode, a commit is durable on a checkpoint rather than on every transaction
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA foreign_keys = ON")
+            with self._schema_lock:
+                if not self._schema_created:
+                    conn.executescript(self._sql_schema)
+                    self._schema_created = True
+            conn.executescript(self._sql_temp_schema)
+            with self._connections_lock:
+                self._connections.append(conn)
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,150 @@
+"""
+Exports the raw questions, answers, users and answer records to Parquet or Arrow files, for analytics
+    that shouldn't query the live database.
+
+Every table is streamed from the database in batches (see DAL.export_rows) and every batch is written
+    as a record batch, so the memory use depends on the batch size and not on the size of the data.
+An incremental export writes only the rows added or changed since the former export of the same directory,
+    by the version saved in export_state.json. Rows can appear in more than one export,
+    the row with the highest version is the current one. Deleted rows are only left out by full exports.
+
+The files of an export are <out>/<table>/<export number>-<full|incremental>.<parquet|arrow>.
+
+Usage: python export_data.py OUT_DIR [--db sqlite] [--incremental] [--tables questions records]
+                                     [--format parquet|arrow] [--batch-size 50000]
+"""
+import argparse
+import json
+import os
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dal import DAL
+
+FORMATS = ('parquet', 'arrow')
+STATE_FILE = "export_state.json"
+
+
+class _ArrowWriter:
+    # writes record batches to an Arrow IPC file, with the interface of pyarrow.parquet.ParquetWriter
+
+    def __init__(self, path, schema):
+        self._sink = pa.OSFile(path, 'wb')
+        self._writer = pa.ipc.new_file(self._sink, schema)
+
+    def write_batch(self, batch):
+        self._writer.write_batch(batch)
+
+    def close(self):
+        self._writer.close()
+        self._sink.close()
+
+
+def _write_table(db, table, path, file_format, since, batch_size):
+    # streams a table into a file. returns the number of rows. no file is written for a table without rows.
+    columns = DAL.EXPORT_TABLES[table]
+    writer = schema = None
+    n_rows = 0
+    tmp_path = path + ".tmp"
+    try:
+        for rows in db.export_rows(table, since, batch_size):
+            arrays = [list(column) for column in zip(*rows)]
+            if schema is None:
+                # the types of the columns (e.g. integer or string ids) are inferred from the first batch
+                batch = pa.RecordBatch.from_arrays([pa.array(a) for a in arrays], names=list(columns))
+                schema = batch.schema
+                if file_format == 'parquet':
+                    writer = pq.ParquetWriter(tmp_path, schema, compression='zstd')
+                else:
+                    writer = _ArrowWriter(tmp_path, schema)
+            else:
+                batch = pa.RecordBatch.from_arrays([pa.array(a, type=f.type) for a, f in zip(arrays, schema)],
+                                                   schema=schema)
+            writer.write_batch(batch)
+            n_rows += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(tmp_path, path)  # a file is complete or missing, never partial
+    return n_rows
+
+
+def export(db, out_dir, tables=None, incremental=False, file_format='parquet', batch_size=50000, progress=None):
+    """
+    Exports the tables of the database to files.
+
+    Args:
+        db (DAL): The database to export.
+        out_dir (str): The directory of the files and of the export state. It is created if it doesn't exist.
+        tables (list, optional): Names from DAL.EXPORT_TABLES. Defaults to None (all the tables).
+        incremental (bool): If True, only the rows added or changed since the former export to out_dir are
+            exported. If there was no former export, all the rows are exported. Defaults to False.
+        file_format (str): One of FORMATS. Defaults to parquet.
+        batch_size (int): The number of rows read and written together. Defaults to 50000.
+        progress (callable, optional): Called after every table with (table, rows).
+
+    Returns:
+        dict: The export statistics with the keys [export, incremental, since, watermark, rows, seconds]
+            where rows is the number of exported rows by table.
+
+    Raises:
+        ValueError: If a table or the format is invalid.
+
+    """
+    tables = list(tables or DAL.EXPORT_TABLES)
+    for table in tables:
+        if table not in DAL.EXPORT_TABLES:
+            raise ValueError(f"Invalid table {table}. The tables are {list(DAL.EXPORT_TABLES)}.")
+    if file_format not in FORMATS:
+        raise ValueError(f"Invalid format {file_format}. The formats are {list(FORMATS)}.")
+    os.makedirs(out_dir, exist_ok=True)
+    state_path = os.path.join(out_dir, STATE_FILE)
+    state = {'exports': 0, 'watermarks': {}}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+
+    start = time.perf_counter()
+    number = state['exports'] + 1
+    kind = 'incremental' if incremental else 'full'
+    # taken before any row is read, so rows that change during the export are exported again next time
+    watermark = db.export_watermark()
+    report = {'export': number, 'incremental': incremental, 'since': {}, 'watermark': watermark, 'rows': {}}
+    for table in tables:
+        since = state['watermarks'].get(table) if incremental else None
+        table_dir = os.path.join(out_dir, table)
+        os.makedirs(table_dir, exist_ok=True)
+        path = os.path.join(table_dir, f"{number:05d}-{kind}.{file_format}")
+        report['since'][table] = since
+        report['rows'][table] = _write_table(db, table, path, file_format, since, batch_size)
+        if progress:
+            progress(table, report['rows'][table])
+
+    # the state is saved after all the files were written, so a failed export is repeated in full
+    state['exports'] = number
+    state['watermarks'].update({table: watermark for table in tables})
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+    report['seconds'] = time.perf_counter() - start
+    return report
+
+
+if __name__ == "__main__":
+    from mode import Mode
+
+    parser = argparse.ArgumentParser(description="Export the trivia data to Parquet or Arrow files.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--db", default='mongodb', choices=list(Mode.possible_dbs))
+    parser.add_argument("--incremental", action="store_true", help="only the rows changed since the last export")
+    parser.add_argument("--tables", nargs="+", choices=list(DAL.EXPORT_TABLES), help="default: all the tables")
+    parser.add_argument("--format", default='parquet', choices=FORMATS)
+    parser.add_argument("--batch-size", type=int, default=50000, help="rows per batch (default: 50000)")
+    args = parser.parse_args()
+
+    with Mode.possible_dbs[args.db]() as trivia_db:
+        stats = export(trivia_db, args.out_dir, args.tables, args.incremental, args.format, args.batch_size,
+                       lambda table, rows: print(f"{table}: {rows} rows"))
+    print(json.dumps(stats))
@@ -1,6 +1,125 @@
 from mode import Mode
 from dal import Types, Difficulties
+from answer_recorder import AnswerRecorder
 import numpy as np
+import html
+
+
+class GameRound:
+    """
+    The questions of one session of the game and the player's progress through them.
+    The rules of the game are kept here: the answers presented for a question, checking an answer, recording it
+        and the score. Used by the console game (Game) and by the game server (server.GameServer).
+
+    Attributes:
+        user: The id of the player.
+        questions (list): The questions of the session, as returned by DAL.get_questions.
+        position (int): The index of the current question.
+        correct (int): The number of correct answers so far.
+
+    """
+
+    def __init__(self, user, questions, recorder):
+        """
+        Args:
+            user: See class attributes.
+            questions (list): See class attributes.
+            recorder (AnswerRecorder): A started recorder the answers are recorded with.
+        """
+        self.user = user
+        self.questions = questions
+        self.position = 0
+        self.correct = 0
+        self._recorder = recorder
+        self._options = None
+
+    @property
+    def finished(self):
+        """ Whether all the questions were answered."""
+        return self.position >= len(self.questions)
+
+    @property
+    def question(self):
+        """ The current question, or None if the session is finished."""
+        return None if self.finished else self.questions[self.position]
+
+    @property
+    def presented(self):
+        """ Whether the answers of the current question were presented (see options)."""
+        return self._options is not None
+
+    def options(self):
+        """
+        Gets the answers of the current question as presented to the player: the correct answer and
+            the wrong answers in a random order, which stays the same until the question is answered.
+
+        Returns:
+            list: The answers.
+
+        """
+        if self._options is None:
+            self._options = self.answer_options(self.question)
+        return self._options
+
+    def answer(self, answer):
+        """
+        Answers the current question, records the answer and moves to the next question.
+
+        Args:
+            answer (str): One of the presented answers (see options).
+
+        Returns:
+            bool: True if the answer is the correct one.
+
+        Raises:
+            ValueError: If the session is finished or the answers of the question were not presented.
+
+        """
+        if self.finished:
+            raise ValueError("The game is finished.")
+        if not self.presented:
+            raise ValueError("Get the question before answering it.")
+        q = self.question
+        correct = self.is_correct(q, answer)
+        self._recorder.record(q['id'], self.user, int(correct))
+        self.correct += correct
+        self.position += 1
+        self._options = None
+        return correct
+
+    def score(self):
+        """
+        Returns:
+            dict: The number of correct answers, of answered questions and of questions in the session.
+                Keys: [correct, answered, total]
+
+        """
+        return {'correct': self.correct, 'answered': self.position, 'total': len(self.questions)}
+
+    @staticmethod
+    def answer_options(question):
+        """
+        Gets the possible answers of a question in a random order.
+
+        Args:
+            question (dict): A question as returned by DAL.get_questions.
+
+        Returns:
+            list: The correct answer and the wrong answers, shuffled.
+
+        """
+        answers = [question['correct_answer']]
+        if question['type'] == Types.boolean.name:
+            answers.append("False" if answers[0] == "True" else "True")
+        else:
+            for a in question['wrong_answers']:
+                answers.append(a)
+        return list(np.random.permutation(answers))
+
+    @staticmethod
+    def is_correct(question, answer):
+        """ Checks whether the answer (as displayed, possibly html unescaped) is the correct one."""
+        return html.unescape(str(answer)) == html.unescape(question['correct_answer'])
 
 
 class Game(Mode):
@@ -10,11 +129,30 @@ class Game(Mode):
     Restarting a session will ask the same player for a new setup for another set of questions.
     """
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, db='mongodb', ui=None, recorder=None):
+        """
+        Args:
+            db: See Mode. Defaults to mongodb.
+            ui (optional): See Mode. Defaults to a ConsoleUI.
+            recorder (AnswerRecorder, optional): A started recorder to share between games.
+                Defaults to None (the game starts its own recorder and closes it on close).
+        """
+        # the question bank rarely changes during a game so the questions are cached
+        super().__init__(db, cache_questions=True, ui=ui)
         self._questions = []
         self._user = None
         self._restart = True
+        # the answers are written to the database in the background so the player doesn't wait for it
+        self._owns_recorder = recorder is None
+        if recorder is None:
+            recorder = AnswerRecorder(self.db)
+            recorder.start()
+        self.recorder = recorder
+
+    @property
+    def questions(self):
+        """ The questions of the current session."""
+        return self._questions
 
     def start(self):
         if not self.db.get_categories():
@@ -40,7 +178,8 @@ class Game(Mode):
 
     def setup_game(self):
         """ Asks the user to choose amount of questions, category and difficulty.
-        Sets the _questions attribute to the questions matching the options.
+        Sets the _questions attribute to the questions matching the options, preferring questions the player
+            didn't answer before (see DAL.get_questions).
         If the amount of questions available for the given options is less than the amount
             given by the player, alerts the player with the actual number of questions matched.
         """
@@ -48,7 +187,9 @@ class Game(Mode):
                                             self._validate_pos_num))
         category = self._choose_category("Choose category:")
         difficulty = self.ui.get_user_choice(self.db.get_difficulties(category), "Choose difficulty:")
-        self._questions = self.db.get_questions(amount, category, difficulty)
+        # the answers of the former session are written in the background within the flush interval
+        # of the recorder, usually long before the player finishes choosing the options
+        self._questions = self.db.get_questions(amount, category, difficulty, exclude_answered=True, user=self._user)
         if len(self._questions) < amount:
             self.ui.alert(f"There are {len(self._questions)} questions in category {category} "
                           f"with difficulty {difficulty}.")
@@ -56,24 +197,17 @@ class Game(Mode):
     def ask_questions(self):
         """ Iterates over the list of questions and presents the question with its possible answers
                 to the player.
-            For each question, updates the database whether the player answered correctly.
+            For each question, records whether the player answered correctly (see GameRound).
+            The database is updated in the background by the recorder.
         """
-        for i, q in enumerate(self._questions):
-            answers = [q['correct_answer']]
-            if q['type'] == Types.boolean.name:
-                answers.append("False" if answers[0] == "True" else "True")
-            else:
-                for a in q['wrong_answers']:
-                    answers.append(a)
-            user_answer = self.ui.get_user_choice(np.random.permutation(answers),
-                                                  f"Question {i + 1}: {q['question']}")
-
-            # update the database whether the user answered correctly or not
-            if user_answer == q['correct_answer']:
-                self.db.update_correct(q['id'], self._user, 1)
+        game_round = GameRound(self._user, self._questions, self.recorder)
+        while not game_round.finished:
+            user_answer = self.ui.get_user_choice(game_round.options(),
+                                                  f"Question {game_round.position + 1}: "
+                                                  f"{game_round.question['question']}")
+            if game_round.answer(user_answer):
                 self.ui.alert("Correct! Well done.")
             else:
-                self.db.update_correct(q['id'], self._user, 0)
                 self.ui.alert("Incorrect! Maybe next time.")
 
     def restart(self):
@@ -84,3 +218,9 @@ class Game(Mode):
              bool: True if the player chose yes, False if he chose no.
         """
         return self._restart and self.ui.yes_no("Would you like to play again?")
+
+    def close(self):
+        """ Writes the remaining answers to the database before releasing it."""
+        if self._owns_recorder:
+            self.recorder.close()
+        super().close()
@@ -0,0 +1,251 @@
+"""
+Loads questions from JSONL or CSV dump files in the opentdb result format into the database.
+
+The file is streamed in chunks of rows. The chunks are parsed, normalized and validated on a process pool
+    (against the limits of the target database) and the valid questions are written in order with
+    DAL.add_questions, which inserts a chunk with a few batched statements.
+Only a bounded number of chunks is in flight, so the memory use depends on the chunk size and not
+    on the size of the file.
+
+After every written chunk the position in the file is saved to a checkpoint file (<file>.checkpoint),
+    so an interrupted load continues from the last written chunk when it is run again.
+    A chunk that was written but not checkpointed is written again, and its questions are skipped as duplicates.
+
+JSONL files have a question object per line. CSV files have a header with the columns
+    [category, type, difficulty, question, correct_answer, incorrect_answers]
+    where incorrect_answers is a JSON list or a "|" separated list.
+
+Usage: python load_questions.py FILE [--db sqlite] [--format jsonl|csv] [--chunk-size 5000] [--workers N]
+                                     [--rejects FILE] [--restart]
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dal import Types
+
+# alternative spellings of the question types found in dumps
+_TYPE_ALIASES = {
+    'multiple choice': Types.multiple.name,
+    'multiple_choice': Types.multiple.name,
+    'true/false': Types.boolean.name,
+    'true_false': Types.boolean.name,
+    'bool': Types.boolean.name
+}
+
+
+def _normalize(record):
+    # normalizes a question in the opentdb format: strips the texts, lower-cases the type and difficulty
+    # and parses the incorrect answers of csv rows.
+    q = dict(record)
+    for key in ['category', 'question', 'correct_answer', 'type', 'difficulty']:
+        if isinstance(q.get(key), str):
+            q[key] = q[key].strip()
+    for key in ['type', 'difficulty']:
+        if isinstance(q.get(key), str):
+            q[key] = q[key].lower()
+    q['type'] = _TYPE_ALIASES.get(q.get('type'), q.get('type'))
+    wrong = q.get('incorrect_answers')
+    if isinstance(wrong, str):
+        wrong = wrong.strip()
+        if wrong.startswith('['):
+            wrong = json.loads(wrong)
+        else:
+            wrong = wrong.split('|') if wrong else []
+    q['incorrect_answers'] = [a.strip() for a in wrong or [] if isinstance(a, str) and a.strip()]
+    if q['type'] == Types.boolean.name and isinstance(q.get('correct_answer'), str):
+        q['correct_answer'] = q['correct_answer'].capitalize()  # "true" -> "True"
+    return q
+
+
+def _process_chunk(db_class, first_row, rows, is_jsonl):
+    # runs on a worker process. parses (jsonl) and validates the rows of a chunk.
+    # returns the valid questions, their row numbers and a list of (row number, reason, row) for the others,
+    # where row is the line as read for jsonl files (whatever it parses to) and the dictionary for csv files.
+    valid, valid_rows, rejected = [], [], []
+    for i, raw in enumerate(rows, first_row):
+        try:
+            row = json.loads(raw) if is_jsonl else raw
+            if not isinstance(row, dict):
+                raise ValueError("Not a JSON object.")
+            category, q_type, difficulty, question, correct_answer, wrong_answers = \
+                db_class._validate_question(_normalize(row))
+        except (ValueError, TypeError) as e:  # json.JSONDecodeError is a ValueError
+            rejected.append((i, str(e), raw.decode('utf-8', 'replace').rstrip('\r\n') if is_jsonl else raw))
+            continue
+        valid.append({
+            'category': category,
+            'type': q_type,
+            'difficulty': difficulty,
+            'question': question,
+            'correct_answer': correct_answer,
+            'incorrect_answers': wrong_answers or []
+        })
+        valid_rows.append(i)
+    return valid, valid_rows, rejected
+
+
+def _read_chunks(path, is_jsonl, chunk_size, offset):
+    # streams the rows of the file from the given byte offset (0 is the start of the file).
+    # yields (rows, end offset) where end offset is the position right after the last row of the chunk.
+    # jsonl rows are the raw lines, csv rows are dictionaries by the header.
+    with open(path, 'rb') as f:
+        header = None
+        if not is_jsonl:
+            header_line = f.readline()
+            header = next(csv.reader([header_line.decode('utf-8-sig')]))
+            offset = max(offset, len(header_line))
+        f.seek(offset)
+
+        def lines():
+            # the lines of the file, keeping track of the position after the last one read
+            nonlocal offset
+            for line in f:
+                offset += len(line)
+                yield line
+
+        if is_jsonl:
+            rows = (line for line in lines() if line.strip())
+        else:
+            # the reader pulls lines as needed, so the offset after a row is known
+            # even when quoted fields span many lines.
+            rows = (dict(zip(header, values)) for values in csv.reader(line.decode('utf-8') for line in lines())
+                    if values)
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk, offset
+                chunk = []
+        if chunk:
+            yield chunk, offset
+
+
+def _save_checkpoint(path, state):
+    # writes the checkpoint atomically, so an interruption never leaves a partial file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def load(db, path, file_format=None, chunk_size=5000, workers=None, rejects_path=None, restart=False,
+         progress=None):
+    """
+    Loads the questions of a dump file into the database, continuing from the checkpoint of a former load.
+
+    Args:
+        db (DAL): The database to add the questions to.
+        path (str): The dump file.
+        file_format (str, optional): 'jsonl' or 'csv'. Defaults to None (by the file extension).
+        chunk_size (int): The number of rows that are validated and written together. Defaults to 5000.
+        workers (int, optional): The number of validating processes. Defaults to None (the number of cpus).
+        rejects_path (str, optional): A JSONL file to append the invalid rows to, with their row number
+            and the reason. Questions that are already in the database are not written to it.
+            Defaults to None (the rows are only counted).
+        restart (bool): If True, the checkpoint is ignored and the file is loaded from the start. Defaults to False.
+        progress (callable, optional): Called after every written chunk with the statistics so far
+            (the keys of the returned statistics without top_reject_reasons).
+
+    Returns:
+        dict: The load statistics with the keys
+            [rows, added, duplicates, rejected, failed, seconds, rows_per_second, top_reject_reasons]
+            where rows, added, duplicates, rejected and failed include former runs, and the others are of this run.
+            rejected counts the invalid rows and failed counts the valid questions the database refused.
+
+    Raises:
+        ValueError: If the format is unknown, or the file is shorter than the checkpoint (it was replaced).
+
+    """
+    file_format = file_format or os.path.splitext(path)[1].lstrip('.').lower()
+    if file_format not in {'jsonl', 'csv'}:
+        raise ValueError(f"Unknown format {file_format}. Must be jsonl or csv.")
+    is_jsonl = file_format == 'jsonl'
+    checkpoint_path = path + ".checkpoint"
+    state = {'offset': 0, 'rows': 0, 'added': 0, 'duplicates': 0, 'rejected': 0, 'failed': 0}
+    if not restart and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            state.update(json.load(f))
+        if os.path.getsize(path) < state['offset']:
+            raise ValueError(f"{path} is shorter than its checkpoint. Load it with restart=True.")
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+    first_rows = state['rows']
+    reasons = Counter()
+    rejects = open(rejects_path, 'a', encoding='utf-8') if rejects_path else None
+
+    def write(future, n_rows, end_offset):
+        valid, valid_rows, rejected = future.result()
+        result = db.add_questions(valid)
+        state['rows'] += n_rows
+        state['added'] += result.added
+        state['duplicates'] += result.duplicates
+        state['rejected'] += len(rejected)
+        state['failed'] += len(result.failures) - result.duplicates
+        # questions the database refused (other than duplicates) are rejects as well
+        rejected += [(valid_rows[i], reason, valid[i]) for i, reason in result.failures
+                     if reason != db.DUPLICATE_QUESTION]
+        if rejects:
+            for row_number, reason, row in rejected:
+                rejects.write(json.dumps({'row': row_number, 'reason': reason, 'data': row}) + "\n")
+            rejects.flush()
+        reasons.update(reason for _, reason, _ in rejected)
+        state['offset'] = end_offset
+        _save_checkpoint(checkpoint_path, state)
+        if progress:
+            seconds = time.perf_counter() - start
+            progress(dict(state, seconds=seconds, rows_per_second=(state['rows'] - first_rows) / seconds))
+
+    try:
+        # the chunks are written in the order of the file, so the checkpoint offset only moves forward.
+        # at most two chunks per worker are in flight to bound the memory use.
+        with ProcessPoolExecutor(workers) as executor:
+            pending = []
+            next_row = state['rows'] + 1
+            for rows, end_offset in _read_chunks(path, is_jsonl, chunk_size, state['offset']):
+                future = executor.submit(_process_chunk, type(db), next_row, rows, is_jsonl)
+                pending.append((future, len(rows), end_offset))
+                next_row += len(rows)
+                if len(pending) >= 2 * workers:
+                    write(*pending.pop(0))
+            while pending:
+                write(*pending.pop(0))
+    finally:
+        if rejects:
+            rejects.close()
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)  # the file was loaded completely
+    seconds = time.perf_counter() - start
+    del state['offset']
+    state['seconds'] = seconds
+    state['rows_per_second'] = (state['rows'] - first_rows) / seconds if seconds else 0.0
+    state['top_reject_reasons'] = reasons.most_common(5)
+    return state
+
+
+if __name__ == "__main__":
+    from mode import Mode
+
+    parser = argparse.ArgumentParser(description="Load questions from a JSONL or CSV dump file.")
+    parser.add_argument("file")
+    parser.add_argument("--db", default='mongodb', choices=list(Mode.possible_dbs))
+    parser.add_argument("--format", choices=['jsonl', 'csv'], help="default: by the file extension")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows per chunk (default: 5000)")
+    parser.add_argument("--workers", type=int, help="validating processes (default: the number of cpus)")
+    parser.add_argument("--rejects", help="a JSONL file to append the invalid rows to")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and load from the start")
+    args = parser.parse_args()
+
+    def show(stats):
+        print(f"\r{stats['rows']} rows, {stats['added']} added, {stats['duplicates']} duplicates, "
+              f"{stats['rejected'] + stats['failed']} rejected, {stats['rows_per_second']:,.0f} rows/s", end="")
+
+    if os.path.exists(args.file + ".checkpoint") and not args.restart:
+        print("Continuing from the checkpoint.")
+    with Mode.possible_dbs[args.db]() as trivia_db:
+        report = load(trivia_db, args.file, args.format, args.chunk_size, args.workers, args.rejects,
+                      args.restart, show)
+    print(f"\n{json.dumps(report)}")
@@ -0,0 +1,152 @@
+"""
+Runs simulated players (see SimulatedUI) through the real Game flow concurrently, to load-test a backend
+    with a production-like traffic shape.
+
+Every player plays a number of games one after another. The players run on threads that share one database
+    (with the question cache and answer recorder of the game), or on processes that each run a share of the
+    players on threads with their own database.
+The report has the end-to-end session latencies (including the players' think time), the answers per second,
+    the observed accuracy and the number of calls of every DAL method (cached questions are not database calls).
+
+Usage: python load_test.py [--db sqlite] [--players 20] [--games 5] [--processes N] [--amount 10]
+                           [--accuracy 0.6] [--think-time 0] [--categories JSON] [--difficulties JSON] [--seed 0]
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from answer_recorder import AnswerRecorder
+from dal_metrics import DalMetrics
+from game import Game
+from mode import Mode
+from question_cache import QuestionCache
+from simulated_ui import SimulatedUI
+
+
+def _play(game, ui, games):
+    # plays the games of a single player and returns the duration and the number of answers of each game
+    sessions = []
+    game.get_username()
+    for _ in range(games):
+        start = time.perf_counter()
+        game.setup_game()
+        ui.expect(game.questions)
+        game.ask_questions()
+        sessions.append((time.perf_counter() - start, len(game.questions)))
+    return sessions
+
+
+def _run_players(db, first_player, n_players, games, profile, seed):
+    # runs the given players on threads over a shared database. returns the raw results of the players.
+    metrics = DalMetrics(enabled=True)
+    database = metrics.instrument(Mode.possible_dbs[db]())
+    journal_path = f"answers_load_test_{first_player}.journal"
+    recorder = AnswerRecorder(database, journal_path=journal_path)
+    recorder.start()
+    shared_db = QuestionCache(database, ttl=Mode.QUESTION_CACHE_TTL)
+    uis = [SimulatedUI(f"sim{first_player + i}", seed=seed + first_player + i, **profile) for i in range(n_players)]
+    try:
+        if not shared_db.get_categories():
+            raise RuntimeError("There are no questions in the database.")
+        with ThreadPoolExecutor(n_players) as executor:
+            futures = [executor.submit(_play, Game(shared_db, ui, recorder), ui, games) for ui in uis]
+            sessions = [s for f in futures for s in f.result()]
+        recorder.flush()
+        return {
+            'sessions': sessions,
+            'thinking': sum(ui.thinking for ui in uis),
+            'answers': sum(n for _, n in sessions),
+            'correct': sum(ui.correct for ui in uis),
+            'recorder': recorder.stats(),
+            'db_calls': {m['method']: m['calls'] for m in metrics.snapshot() if m['calls']}
+        }
+    finally:
+        recorder.close()
+        shared_db.close()
+        if os.path.exists(journal_path) and os.path.getsize(journal_path) == 0:
+            os.remove(journal_path)
+
+
+def run(db='sqlite', players=20, games=5, processes=None, amount=10, accuracy=0.6, think_time=0.0,
+        category_weights=None, difficulty_weights=None, seed=0):
+    """
+    Runs the simulated players and reports the results.
+
+    Args:
+        db (str): One of Mode.possible_dbs. Defaults to sqlite.
+        players (int): The number of concurrent players. Defaults to 20.
+        games (int): The number of games every player plays. Defaults to 5.
+        processes (int, optional): If given, the players are split between this many processes.
+            Defaults to None (all the players are threads of this process).
+        amount (int or tuple): See SimulatedUI. Defaults to 10.
+        accuracy (float): See SimulatedUI. Defaults to 0.6.
+        think_time (float): See SimulatedUI. Defaults to 0.
+        category_weights (dict, optional): See SimulatedUI.
+        difficulty_weights (dict, optional): See SimulatedUI.
+        seed (int): The seed of the players' choices. Defaults to 0.
+
+    Returns:
+        dict: The report with the keys [players, sessions, seconds, session_ms (p50, p95, p99, mean),
+            think_seconds, answers, answers_per_second, accuracy, recorded, written, db_calls, db_calls_per_session]
+
+    """
+    profile = {
+        'amount': amount,
+        'accuracy': accuracy,
+        'think_time': think_time,
+        'category_weights': category_weights,
+        'difficulty_weights': difficulty_weights
+    }
+    start = time.perf_counter()
+    if processes:
+        shares = [(p * players // processes, (p + 1) * players // processes) for p in range(processes)]
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(_run_players, db, first, last - first, games, profile, seed)
+                       for first, last in shares if last > first]
+            results = [f.result() for f in futures]
+    else:
+        results = [_run_players(db, 0, players, games, profile, seed)]
+    seconds = time.perf_counter() - start
+
+    durations = np.array([d for r in results for d, _ in r['sessions']]) * 1000
+    answers = sum(r['answers'] for r in results)
+    db_calls = Counter()
+    for r in results:
+        db_calls.update(r['db_calls'])
+    p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+    return {
+        'players': players,
+        'sessions': len(durations),
+        'seconds': seconds,
+        'session_ms': {'p50': p50, 'p95': p95, 'p99': p99, 'mean': durations.mean()},
+        'think_seconds': sum(r['thinking'] for r in results),
+        'answers': answers,
+        'answers_per_second': answers / seconds,
+        'accuracy': sum(r['correct'] for r in results) / answers if answers else None,
+        'recorded': sum(r['recorder']['recorded'] for r in results),
+        'written': sum(r['recorder']['written'] for r in results),
+        'db_calls': dict(db_calls),
+        'db_calls_per_session': sum(db_calls.values()) / len(durations)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the trivia game with simulated players.")
+    parser.add_argument("--db", default='sqlite', choices=list(Mode.possible_dbs))
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--games", type=int, default=5, help="games per player")
+    parser.add_argument("--processes", type=int, help="split the players between processes")
+    parser.add_argument("--amount", type=int, default=10, help="questions per game")
+    parser.add_argument("--accuracy", type=float, default=0.6)
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds per prompt")
+    parser.add_argument("--categories", type=json.loads, help='category weights, e.g. {"Sports": 3, "History": 1}')
+    parser.add_argument("--difficulties", type=json.loads, help='difficulty weights, e.g. {"easy": 2, "hard": 1}')
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(args.db, args.players, args.games, args.processes, args.amount, args.accuracy, args.think_time,
+                 args.categories, args.difficulties, args.seed)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LookupCache:
+    """
+    A bounded, thread-safe LRU cache for small lookups (e.g. category or user name to id).
+
+    Attributes:
+        max_size (int): The maximum number of entries. The least recently used entries are evicted first.
+        ttl (float): How long (in seconds) an entry is valid. None means entries never expire.
+
+    """
+
+    def __init__(self, max_size=1024, ttl=None):
+        """
+        Args:
+            max_size (int): See class attributes. Defaults to 1024.
+            ttl (float, optional): See class attributes. Defaults to None.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key: (value, time added)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Gets the cached value of the key.
+
+        Returns:
+            The cached value, or None if the key is not in the cache (or expired).
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[1] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """ Adds or replaces the value of the key."""
+        if value is None:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        """ Removes the key from the cache if it is there."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """ Removes all the entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
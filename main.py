@@ -1,12 +1,19 @@
 from admin_menu import AdminMenu
 from game import Game
 from console_ui import ConsoleUI as UI
+from dal_metrics import METRICS
+import logging
 import sys
 
+# the log is kept in a file so it doesn't mix with the console ui
+logging.basicConfig(filename="trivia.log", level=logging.INFO,
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
 
 # choose the game mode according to the command-line parameter or use default mode
-modes = {'normal', 'admin'}
-mode = 'normal'
+modes = {'normal', 'admin', 'server'}
+default_mode = 'normal'
+mode = default_mode
 if len(sys.argv) > 1:
     mode = sys.argv[1]
     if mode not in modes:
@@ -16,6 +23,11 @@ if len(sys.argv) > 1:
 
 if mode and mode == 'admin':
     session = AdminMenu()
+elif mode == 'server':
+    # aiohttp is only needed by the server
+    from server import GameServer
+    # an optional port can follow the mode, e.g. python main.py server 8000
+    session = GameServer(port=int(sys.argv[2])) if len(sys.argv) > 2 else GameServer()
 else:
     session = Game()
 
@@ -24,10 +36,15 @@ else:
 
 UI.welcome("!! WELCOME TO THE AMAZING TRIVIA GAME !!")
 finished = False
-while not finished:
-    session.start()
-    if not session.restart():
-        finished = True
-    else:
-        UI.restart()
+try:
+    while not finished:
+        session.start()
+        if not session.restart():
+            finished = True
+        else:
+            UI.restart()
+finally:
+    session.close()
+    if METRICS.enabled:
+        logging.getLogger(__name__).info("DAL metrics: %s", METRICS.to_json())
 UI.alert("See you next time :)")
@@ -0,0 +1,75 @@
+"""
+Moves the answer records embedded in the users documents (users.questions) to the records collection,
+    as used by DbMongodb with records_storage=DbMongodb.RECORDS_COLLECTION.
+
+The users are streamed with a cursor and the records are written with unordered bulk upserts,
+    so the memory use is bounded by the batch size and not by the size of the data.
+    A record that already exists in the collection is kept as is, since it is newer than the embedded one.
+    The embedded array of a user is removed only after all its records were written, so the migration
+    can be stopped and run again at any time.
+
+Usage: python migrate_mongodb_records.py [--batch-size N] [--keep-embedded]
+"""
+import argparse
+import time
+from pymongo import UpdateOne
+from db_mongodb import DbMongodb
+
+
+def migrate(db, batch_size=1000, keep_embedded=False, progress=None):
+    """
+    Copies the embedded records of all the users to the records collection.
+
+    Args:
+        db (DbMongodb): The database to migrate.
+        batch_size (int): The number of records written in a single bulk write. Defaults to 1000.
+        keep_embedded (bool): If True, the users.questions arrays are left in place. Defaults to False.
+        progress (callable, optional): Called after every bulk write with (users, records) migrated so far.
+
+    Returns:
+        tuple: The number of migrated users and records.
+
+    """
+    database = db.database
+    n_users = n_records = 0
+    ops = []
+    done_users = []  # users whose records are all in ops
+
+    def write():
+        nonlocal ops, done_users, n_records
+        if ops:
+            database.records.bulk_write(ops, ordered=False)
+            n_records += len(ops)
+        if done_users and not keep_embedded:
+            database.users.update_many({"_id": {"$in": done_users}}, {"$unset": {"questions": ""}})
+        ops, done_users = [], []
+        if progress:
+            progress(n_users, n_records)
+
+    users = database.users.find({"questions.0": {"$exists": True}}, {"questions": 1}, batch_size=100)
+    for user in users:
+        for record in user["questions"]:
+            ops.append(UpdateOne(
+                {"user_id": user["_id"], "question_id": record["question_id"]},
+                {"$setOnInsert": {"correct": int(record["correct"])}},
+                upsert=True
+            ))
+        done_users.append(user["_id"])
+        n_users += 1
+        if len(ops) >= batch_size:
+            write()
+    write()
+    return n_users, n_records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move the embedded mongodb answer records to the records collection.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="records per bulk write (default: 1000)")
+    parser.add_argument("--keep-embedded", action="store_true", help="don't remove the users.questions arrays")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with DbMongodb() as trivia_db:
+        users, records = migrate(trivia_db, args.batch_size, args.keep_embedded,
+                                 lambda u, r: print(f"\r{u} users, {r} records", end=""))
+    print(f"\nMigrated {records} records of {users} users in {time.perf_counter() - start:.1f} seconds.")
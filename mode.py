@@ -1,7 +1,29 @@
 from abc import ABC, abstractmethod
-from db_sql_server import DbSqlServer
-from db_mongodb import DbMongodb
 from console_ui import ConsoleUI
+from question_cache import QuestionCache
+from dal_metrics import METRICS
+
+
+# the backends are imported when they are created, so a mode only needs the driver of the database it uses
+# (e.g. the sqlite backend runs without pyodbc and the odbc driver manager)
+def _mongodb():
+    from db_mongodb import DbMongodb
+    return DbMongodb()
+
+
+def _sql_server():
+    from db_sql_server import DbSqlServer
+    return DbSqlServer()
+
+
+def _sqlite():
+    from db_sqlite import DbSqlite
+    return DbSqlite()
+
+
+def _columnar():
+    from db_columnar import DbColumnar
+    return DbColumnar()
 
 
 class Mode(ABC):
@@ -10,20 +32,34 @@ class Mode(ABC):
     Some mode examples are administrative menu, predefined game setups and more.
     """
 
+    # name: a function creating the database
     possible_dbs = {
-        'mongodb': DbMongodb,
-        'sql_server': DbSqlServer
+        'mongodb': _mongodb,
+        'sql_server': _sql_server,
+        'sqlite': _sqlite,
+        'columnar': _columnar
     }
 
-    def __init__(self, db='mongodb'):
+    # how long (in seconds) cached questions are kept, to pick up changes made by other processes
+    QUESTION_CACHE_TTL = 600
+
+    def __init__(self, db='mongodb', cache_questions=False, ui=None):
         """
         Initiates the current game mode.
 
         Args:
-            db: The database to run the game with. One of Mode.possible_dbs
+            db: The database to run the game with. One of Mode.possible_dbs, or a DAL instance
+                (e.g. to share one database between many modes).
+            cache_questions (bool): If True, the questions are sampled from an in-memory cache
+                (see QuestionCache) instead of being queried for every game. Defaults to False.
+            ui (optional): The user interface. Defaults to a ConsoleUI.
+                Any object with the methods of ConsoleUI can be used (e.g. SimulatedUI).
         """
-        self.ui = ConsoleUI()
-        self.db = self.possible_dbs[db]()
+        self.ui = ui or ConsoleUI()
+        # a database created by the mode is measured by the process metrics (see dal_metrics.METRICS)
+        self.db = METRICS.instrument(self.possible_dbs[db]()) if isinstance(db, str) else db
+        if cache_questions and not isinstance(self.db, QuestionCache):
+            self.db = QuestionCache(self.db, ttl=self.QUESTION_CACHE_TTL)
 
     @abstractmethod
     def start(self):
@@ -44,6 +80,10 @@ class Mode(ABC):
         """
         pass
 
+    def close(self):
+        """ Ends the mode and releases the resources of the database."""
+        self.db.close()
+
     @staticmethod
     def _validate_pos_num(val):
         # a validation method to use with the ui.get_user_input method
@@ -10,6 +10,10 @@ db.createCollection("categories", {
 					bsonType: "string",
 					minLength: 1,
 					description: "must be a string and is required"
+				},
+				removing: {
+					bsonType: "bool",
+					description: "set while the category is being removed, is not required"
 				}
 			}
 		}
@@ -65,8 +69,49 @@ db.createCollection("questions", {
 				wrong_answers: {
 					bsonType: "array",
 					description: "must be a list of unique values and is not required"
+				},
+				hash: {
+					bsonType: "string",
+					description: "the normalized content hash of the question, must be a string and is not required"
+				},
+				seq: {
+					bsonType: "int",
+					description: "the number of the question in its category and difficulty, is not required"
 				}
 			}
 		}
 	}
-});
\ No newline at end of file
+});
+db.createCollection("records", {
+	validator: {
+		$jsonSchema: {
+			bsonType: "object",
+			required: [ "user_id", "question_id", "correct" ],
+			properties: {
+				user_id: {
+					bsonType: "objectId",
+					description: "must be a user id and is required"
+				},
+				question_id: {
+					bsonType: "objectId",
+					description: "must be a question id and is required"
+				},
+				correct: {
+					enum: [ 0, 1 ],
+					description: "can only be 0 or 1 and is required"
+				}
+			}
+		}
+	}
+});
+
+db.questions.createIndex({ hash: 1 }, { unique: true, partialFilterExpression: { hash: { $type: "string" } } });
+db.questions.createIndex({ category: 1, difficulty: 1, seq: 1 }, { unique: true, partialFilterExpression: { seq: { $exists: true } } });
+db.buckets.createIndex({ category: 1, difficulty: 1 }, { unique: true });
+db.answered.createIndex({ user_id: 1, category: 1, difficulty: 1 }, { unique: true });
+db.answered.createIndex({ category: 1 });
+db.records.createIndex({ user_id: 1, question_id: 1 }, { unique: true });
+db.records.createIndex({ question_id: 1 });
+db.stats.createIndex({ by: 1, key: 1 }, { unique: true });
+db.stats.createIndex({ by: 1, correct: -1, key: -1 });
+db.scores.createIndex({ correct: 1 }, { unique: true });
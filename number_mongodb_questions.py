@@ -0,0 +1,23 @@
+"""
+Numbers the mongodb questions that were added before the seq field (see DbMongodb.get_questions),
+    so they are picked by the sampling of their bucket.
+
+The questions are read in batches by _id and every batch reserves the numbers of its buckets from
+    the bucket counters, so the migration can run while questions are added, and can be stopped
+    and run again at any time.
+
+Usage: python number_mongodb_questions.py [--batch-size N]
+"""
+import argparse
+import time
+from db_mongodb import DbMongodb
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Number the mongodb questions added before the seq field.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="questions per bulk write (default: 1000)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with DbMongodb() as trivia_db:
+        numbered = trivia_db.number_questions(args.batch_size)
+    print(f"Numbered {numbered} questions in {time.perf_counter() - start:.1f} seconds.")
@@ -0,0 +1,316 @@
+"""
+A client of the Open Trivia Database api (https://opentdb.com) and a bulk importer built on it.
+
+The client keeps a persistent http session (so the connections are kept alive between requests),
+    spaces the requests by a rate limit that is shared by all the threads using it,
+    and retries with an exponential backoff when the api answers that the rate limit was exceeded.
+
+The bulk importer fetches many pages concurrently with an opentdb session token, so the api itself
+    doesn't repeat questions, and adds every page to the database as soon as it arrives with DAL.add_questions.
+
+Usage: python opentdb.py --amount 1000 [--db sqlite] [--category NAME] [--difficulty easy]
+                         [--workers 4] [--rate 0.2] [--api https://opentdb.com]
+"""
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class OpenTdbError(ConnectionError):
+    """
+    Raised when the api returned an error.
+
+    Attributes:
+        response_code (int): The response code of the api (see OpenTdbClient), or None for http errors.
+
+    """
+
+    def __init__(self, message, response_code=None):
+        super().__init__(message)
+        self.response_code = response_code
+
+
+class _RateLimiter:
+    # spaces calls of wait() by at least 1 / rate seconds, across all the threads
+
+    def __init__(self, rate):
+        self._interval = 1 / rate if rate else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self._interval
+        if start > now:
+            time.sleep(start - now)
+
+    def delay(self, seconds):
+        # no call proceeds in the next given seconds (e.g. after the server asked to slow down)
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+class OpenTdbClient:
+    """
+    A thread-safe client of the opentdb api.
+
+    Attributes:
+        url (str): The base url of the api. Can point to a local stub server for testing.
+        rate (float): The maximum number of questions requests per second. None means unlimited.
+            opentdb allows a single questions request per 5 seconds from every ip address.
+        max_retries (int): How many times a rate-limited request is retried before giving up.
+        backoff (float): The delay (in seconds) before the first retry. It doubles on every retry.
+        timeout (float): The timeout (in seconds) of a single http request.
+
+    """
+
+    URL = "https://opentdb.com"
+    MAX_AMOUNT = 50  # the maximum number of questions per request
+    # the response codes of the api
+    SUCCESS = 0
+    NO_RESULTS = 1  # there are not enough questions for the query
+    INVALID_PARAMETER = 2
+    TOKEN_NOT_FOUND = 3
+    TOKEN_EMPTY = 4  # the token already returned all the questions for the query
+    RATE_LIMIT = 5
+
+    def __init__(self, url=URL, rate=0.2, max_retries=5, backoff=5.0, timeout=30, pool_size=10):
+        """
+        Args:
+            url (str): See class attributes. Defaults to https://opentdb.com.
+            rate (float): See class attributes. Defaults to 0.2 (one request per 5 seconds).
+            max_retries (int): See class attributes. Defaults to 5.
+            backoff (float): See class attributes. Defaults to 5 seconds.
+            timeout (float): See class attributes. Defaults to 30 seconds.
+            pool_size (int): The maximum number of kept-alive connections. Defaults to 10.
+        """
+        self.url = url.rstrip('/')
+        self.rate = rate
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._limiter = _RateLimiter(rate)
+        self._session = requests.Session()
+        self._session.mount(self.url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self._categories = None
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'retries': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """ Closes the kept-alive connections."""
+        self._session.close()
+
+    def stats(self):
+        """
+        Gets the statistics of the client.
+
+        Returns:
+            dict: The number of http requests and of retries after a rate limit response.
+
+        """
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def categories(self):
+        """
+        Gets the categories of the api. They are fetched once and kept for the lifetime of the client.
+
+        Returns:
+            dict: The ids of the categories by their names.
+
+        """
+        if self._categories is None:
+            result = self._get("/api_category.php")
+            self._categories = {cat['name']: cat['id'] for cat in result['trivia_categories']}
+        return self._categories
+
+    def category_id(self, name):
+        """
+        Gets the api id of a category.
+
+        Raises:
+            ValueError: If there is no such category.
+
+        """
+        try:
+            return self.categories()[name]
+        except KeyError:
+            raise ValueError(f"Invalid category {name}.")
+
+    def request_token(self):
+        """ Gets a new session token. The api doesn't return the same question twice for a token."""
+        return self._request("/api_token.php", {'command': 'request'})['token']
+
+    def reset_token(self, token):
+        """ Resets a session token, so it can return all the questions again."""
+        self._request("/api_token.php", {'command': 'reset', 'token': token})
+
+    def questions(self, amount=1, category=None, difficulty=None, q_type=None, token=None):
+        """
+        Gets random questions.
+
+        Args:
+            amount (int): The number of questions, at most MAX_AMOUNT. Defaults to 1.
+            category (str, optional): The category name. Defaults to None (random categories).
+            difficulty (str, optional): The difficulty. Defaults to None (random difficulties).
+            q_type (str, optional): The question type. Defaults to None (random types).
+            token (str, optional): A session token. Defaults to None (questions may repeat).
+
+        Returns:
+            list: The questions in the opentdb result format (as accepted by DAL.add_questions).
+
+        Raises:
+            ValueError: If the category is invalid.
+            OpenTdbError: If the api returned an error, e.g. NO_RESULTS or TOKEN_EMPTY when there are
+                not enough (unseen) questions for the query.
+
+        """
+        params = {'amount': amount}
+        if category:
+            params['category'] = self.category_id(category)
+        if difficulty:
+            params['difficulty'] = difficulty
+        if q_type:
+            params['type'] = q_type
+        if token:
+            params['token'] = token
+        return self._request("/api.php", params, limited=True)['results']
+
+    def _request(self, path, params, limited=False):
+        # a request that returns a response code. retries when the rate limit is exceeded.
+        for attempt in range(self.max_retries + 1):
+            result = self._get(path, params, limited)
+            code = result.get('response_code', self.SUCCESS)
+            if code == self.SUCCESS:
+                return result
+            if code != self.RATE_LIMIT or attempt == self.max_retries:
+                raise OpenTdbError(f"The api returned response code {code} for {path}.", code)
+            with self._stats_lock:
+                self._stats['retries'] += 1
+            # every thread waits, with a jitter so the retries don't arrive together
+            self._limiter.delay(self.backoff * 2 ** attempt * random.uniform(1, 1.25))
+
+    def _get(self, path, params=None, limited=False):
+        # only the questions are rate limited by the api
+        if limited:
+            self._limiter.wait()
+        with self._stats_lock:
+            self._stats['requests'] += 1
+        try:
+            with self._session.get(self.url + path, params=params, timeout=self.timeout) as response:
+                if response.status_code == 429:
+                    return {'response_code': self.RATE_LIMIT}
+                response.raise_for_status()
+                return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise OpenTdbError(f"The request to {path} failed: {e}")
+
+
+def bulk_import(db, amount, category=None, difficulty=None, client=None, workers=4, progress=None):
+    """
+    Imports many questions from opentdb into the database.
+        The pages are fetched concurrently with a session token (so the api doesn't repeat questions)
+        and each page is added to the database as soon as it arrives. The import stops early if the api
+        has no more questions for the query.
+
+    Args:
+        db (DAL): The database to add the questions to.
+        amount (int): The number of questions to fetch.
+        category (str, optional): The opentdb category name. Defaults to None (random categories).
+        difficulty (str, optional): The difficulty. Defaults to None (random difficulties).
+        client (OpenTdbClient, optional): The client to use. Defaults to a new client with the default rate.
+        workers (int): The number of concurrent requests. Defaults to 4.
+        progress (callable, optional): Called after every page with (fetched, added) so far.
+
+    Returns:
+        dict: The import statistics with the keys
+            [requested, fetched, added, duplicates, failed, exhausted, requests, retries, seconds]
+
+    Raises:
+        ValueError: If the category or the difficulty are invalid.
+        OpenTdbError: If the api failed for a reason other than running out of questions.
+
+    """
+    if difficulty and difficulty not in db.difficulties:
+        raise ValueError(f"Invalid difficulty {difficulty}. The possible difficulties are {db.difficulties}")
+    own_client = client is None
+    client = client or OpenTdbClient()
+    start = time.perf_counter()
+    report = {'requested': amount, 'fetched': 0, 'added': 0, 'duplicates': 0, 'failed': 0, 'exhausted': False}
+    try:
+        if category:
+            client.category_id(category)  # validates the category before fetching anything
+        token = client.request_token()
+        exhausted = threading.Event()
+
+        def fetch(size):
+            # fetches a page. when the api has fewer (unseen) questions than requested it returns none of them,
+            # so the request is halved until the remaining questions are fetched.
+            page, request_size = [], size
+            while len(page) < size and not exhausted.is_set():
+                try:
+                    page += client.questions(min(request_size, size - len(page)), category, difficulty, token=token)
+                except OpenTdbError as e:
+                    if e.response_code not in {client.NO_RESULTS, client.TOKEN_EMPTY}:
+                        raise
+                    if request_size == 1:
+                        exhausted.set()
+                    request_size //= 2
+            return page
+
+        pages = [min(client.MAX_AMOUNT, amount - start_index) for start_index in range(0, amount, client.MAX_AMOUNT)]
+        seen = set()
+        with ThreadPoolExecutor(workers) as executor:
+            futures = [executor.submit(fetch, size) for size in pages]
+            try:
+                for future in as_completed(futures):
+                    page = [q for q in future.result() if q['question'] not in seen]
+                    seen.update(q['question'] for q in page)
+                    result = db.add_questions(page)
+                    report['fetched'] += len(page)
+                    report['added'] += result.added
+                    report['duplicates'] += result.duplicates
+                    report['failed'] += len(result.failures) - result.duplicates
+                    if progress:
+                        progress(report['fetched'], report['added'])
+            except BaseException:
+                exhausted.set()  # the queued pages return without a request
+                raise
+        report['exhausted'] = exhausted.is_set()
+    finally:
+        if own_client:
+            client.close()
+    report.update(client.stats())
+    report['seconds'] = time.perf_counter() - start
+    return report
+
+
+if __name__ == "__main__":
+    from mode import Mode
+
+    parser = argparse.ArgumentParser(description="Import many questions from the Open Trivia Database.")
+    parser.add_argument("--amount", type=int, required=True, help="the number of questions to fetch")
+    parser.add_argument("--db", default='mongodb', choices=list(Mode.possible_dbs))
+    parser.add_argument("--category", help="an opentdb category name (default: random)")
+    parser.add_argument("--difficulty", choices=['easy', 'medium', 'hard'], help="default: random")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent requests (default: 4)")
+    parser.add_argument("--rate", type=float, default=0.2, help="requests per second (default: 0.2)")
+    parser.add_argument("--api", default=OpenTdbClient.URL, help="the base url of the api")
+    args = parser.parse_args()
+
+    with Mode.possible_dbs[args.db]() as trivia_db, OpenTdbClient(args.api, rate=args.rate) as api:
+        stats = bulk_import(trivia_db, args.amount, args.category, args.difficulty, api, args.workers,
+                            lambda f, a: print(f"\r{f} fetched, {a} added", end=""))
+    print(f"\n{stats}")
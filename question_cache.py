@@ -0,0 +1,208 @@
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class QuestionCache:
+    """
+    A caching layer around any DAL that keeps the questions of each (category, difficulty) bucket in memory
+        and samples get_questions from them instead of querying the database.
+
+    The question bank rarely changes, so a bucket is loaded once (with DAL.get_all_questions) and reused
+        by all the users. get_questions with exclude_answered reads only the answered questions of the user
+        (see DAL.get_answered) and filters the cached bucket with them. The bucket is reused
+        until it is invalidated by add_question, add_questions, import_questions, remove_category or
+        hide_category called through the cache, or until it expires (see ttl) to pick up changes made by other processes.
+    The buckets are kept within a memory budget, evicting the least recently used buckets first. A bucket that
+        doesn't fit in the budget is remembered as uncacheable (until it is invalidated or expires), so it is
+        sampled by the wrapped database without being loaded again.
+    All other attributes and methods are delegated to the wrapped DAL.
+
+    Attributes:
+        db (DAL): The wrapped database.
+        max_bytes (int): The memory budget of the cached questions (estimated).
+        ttl (float): How long (in seconds) a bucket is kept before it is reloaded. None means forever.
+
+    """
+
+    def __init__(self, db, max_bytes=64 * 2 ** 20, ttl=None):
+        """
+        Args:
+            db (DAL): The database to cache.
+            max_bytes (int): See class attributes. Defaults to 64MB.
+            ttl (float, optional): See class attributes. Defaults to None.
+        """
+        self.db = db
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # (category, difficulty): (questions, size in bytes, load time, the numbers of the questions in the bucket)
+        self._buckets = OrderedDict()
+        self._size = 0
+        self._uncacheable = {}  # (category, difficulty): the time it was found too large
+        self._generation = 0  # incremented on every invalidation
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'uncacheable': 0
+        }
+
+    def __getattr__(self, name):
+        # delegate everything that is not cached to the wrapped database
+        return getattr(self.db, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.db.close()
+
+    def get_questions(self, amount, category, difficulty, exclude_answered=False, user=None):
+        """ See DAL.get_questions. The questions are sampled from the cached bucket. With exclude_answered,
+            only the bitmap of the user is read from the database, and the answered questions are drawn last."""
+        self.db._check_answered_user(exclude_answered, user)
+        bucket = self._get_bucket(category, difficulty)
+        if bucket is None:  # known to be too large to cache
+            return self.db.get_questions(amount, category, difficulty, exclude_answered, user)
+        questions, seqs = bucket
+        if not exclude_answered:
+            return [dict(q) for q in random.sample(questions, min(amount, len(questions)))]
+        answered = self.db.get_answered(user, category, difficulty)
+        fresh, seen = [], []
+        for q, seq in zip(questions, seqs):
+            (seen if seq is not None and seq in answered else fresh).append(q)
+        picked = random.sample(fresh, min(amount, len(fresh)))
+        if len(picked) < amount:
+            picked += random.sample(seen, min(amount - len(picked), len(seen)))
+            random.shuffle(picked)
+        return [dict(q) for q in picked]
+
+    def add_question(self, category, q_type, difficulty, question, correct_answer, wrong_answers=None):
+        try:
+            return self.db.add_question(category, q_type, difficulty, question, correct_answer, wrong_answers)
+        finally:
+            self.invalidate(category, difficulty)
+
+    def add_questions(self, questions):
+        try:
+            return self.db.add_questions(questions)
+        finally:
+            for category, difficulty in {(q.get('category'), q.get('difficulty')) for q in questions}:
+                self.invalidate(category, difficulty)
+
+    def import_questions(self, amount=1, difficulty=None, category=None):
+        # the categories of the imported questions are known only to the wrapped database
+        try:
+            return self.db.import_questions(amount, difficulty, category)
+        finally:
+            self.invalidate()
+
+    def remove_category(self, name):
+        try:
+            return self.db.remove_category(name)
+        finally:
+            self.invalidate(name)
+
+    def hide_category(self, name):
+        try:
+            return self.db.hide_category(name)
+        finally:
+            self.invalidate(name)
+
+    def invalidate(self, category=None, difficulty=None):
+        """
+        Removes buckets from the cache.
+
+        Args:
+            category (str, optional): If given, only buckets of this category are removed.
+            difficulty (str, optional): If given with category, only this bucket is removed.
+
+        """
+        with self._lock:
+            keys = [k for k in self._buckets
+                    if (category is None or k[0] == category) and (difficulty is None or k[1] == difficulty)]
+            for key in keys:
+                self._remove(key)
+            for key in [k for k in self._uncacheable
+                        if (category is None or k[0] == category) and (difficulty is None or k[1] == difficulty)]:
+                del self._uncacheable[key]
+            self._stats['invalidations'] += len(keys)
+            self._generation += 1
+
+    def cache_stats(self):
+        """
+        Gets the cache statistics.
+
+        Returns:
+            dict: Counters since the cache was created along with the current cache state.
+                Keys: [hits, misses, hit_rate, evictions, invalidations, uncacheable, buckets, bytes, max_bytes]
+
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['misses']
+            stats.update({
+                'hit_rate': stats['hits'] / lookups if lookups else 0.0,
+                'buckets': len(self._buckets),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes
+            })
+            return stats
+
+    def _get_bucket(self, category, difficulty):
+        # returns the cached questions of the bucket and their numbers (see DAL.get_answered), loading it on a miss.
+        # returns None if the bucket is known not to fit in the memory budget, without loading it.
+        key = (category, difficulty)
+        with self._lock:
+            found = self._uncacheable.get(key)
+            if found is not None:
+                if self.ttl is None or time.monotonic() - found < self.ttl:
+                    return None
+                del self._uncacheable[key]  # checked again, it may have shrunk
+            entry = self._buckets.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[2] < self.ttl):
+                self._buckets.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[0], entry[3]
+            self._stats['misses'] += 1
+            generation = self._generation
+
+        # loading is done outside of the lock so other buckets can still be served
+        questions = self.db.get_all_questions(category, difficulty)
+        # the numbers are kept apart, so the questions are returned in the format of get_questions
+        seqs = [q.pop('seq', None) for q in questions]
+        size = sum(self._sizeof(q) for q in questions)
+        with self._lock:
+            if key in self._buckets:
+                self._remove(key)
+            if generation != self._generation:
+                return questions, seqs  # invalidated while loading, the questions may already be stale
+            if size > self.max_bytes:
+                # the loaded questions still serve this request
+                self._uncacheable[key] = time.monotonic()
+                self._stats['uncacheable'] += 1
+                return questions, seqs
+            while self._size + size > self.max_bytes:
+                self._remove(next(iter(self._buckets)))
+                self._stats['evictions'] += 1
+            self._buckets[key] = (questions, size, time.monotonic(), seqs)
+            self._size += size
+        return questions, seqs
+
+    def _remove(self, key):
+        # must be called while holding the lock
+        self._size -= self._buckets.pop(key)[1]
+
+    @staticmethod
+    def _sizeof(question):
+        # an estimate of the memory used by a question dictionary
+        size = sys.getsizeof(question)
+        for value in question.values():
+            size += sys.getsizeof(value)
+            if isinstance(value, list):
+                size += sum(sys.getsizeof(v) for v in value)
+        return size
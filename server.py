@@ -0,0 +1,239 @@
+import asyncio
+import json
+import secrets
+import time
+from aiohttp import web
+from mode import Mode
+from game import GameRound
+from async_dal import ExecutorAsyncDAL
+from answer_recorder import AnswerRecorder
+from dal_metrics import METRICS
+
+
+class GameSession:
+    """
+    A game played through the server: the round of the game (see GameRound) and when it was last used.
+
+    Attributes:
+        round (GameRound): The questions of the game and the player's progress.
+        last_access (float): The time (time.monotonic) the session was last used.
+
+    """
+
+    __slots__ = ('round', 'last_access')
+
+    def __init__(self, game_round):
+        self.round = game_round
+        self.last_access = time.monotonic()
+
+
+class GameServer(Mode):
+    """
+    A game mode that serves the game flow to many players at once over an HTTP/JSON API.
+    The requests are handled on a single asyncio event loop. The database is accessed through an
+        ExecutorAsyncDAL and the answers are recorded in the background (see AnswerRecorder),
+        the same as in the console game. The sessions are kept in memory and expire when unused.
+
+    The API (all bodies are compact JSON):
+        GET    /categories                        -> ["Sports", ...]
+        GET    /categories/{category}/difficulties -> ["easy", ...]
+        POST   /sessions  {"user", "category", "difficulty", "amount"} -> {"session", "total"}
+                   (questions the user didn't answer before are preferred)
+        GET    /sessions/{id}/question            -> {"n", "question", "answers"} or {"done": true}
+        POST   /sessions/{id}/answer  {"answer": index in answers} -> {"correct", "answer"}
+        GET    /sessions/{id}/score               -> {"correct", "answered", "total"}
+        DELETE /sessions/{id}                     -> the final score
+        GET    /metrics                           -> the DAL metrics in the Prometheus format, if enabled
+    Errors are answered with {"error": message} and the matching status, e.g. 400 for invalid parameters.
+
+    Use make_app with aiohttp's TestClient to run the server in-process (e.g. in tests or benchmarks).
+
+    Attributes:
+        host (str): The interface to listen on.
+        port (int): The port to listen on.
+        session_ttl (float): How long (in seconds) an unused session is kept.
+        max_sessions (int): The maximum number of live sessions. New sessions are refused beyond it.
+
+    """
+
+    SESSION_TTL = 1800
+    MAX_SESSIONS = 100000
+    # the maximum number of concurrent database calls
+    DB_WORKERS = 20
+    # how often (in seconds) expired sessions are removed
+    _SWEEP_INTERVAL = 60
+
+    def __init__(self, db='mongodb', host='0.0.0.0', port=8080, session_ttl=SESSION_TTL, max_sessions=MAX_SESSIONS,
+                 recorder=None):
+        """
+        Args:
+            db: See Mode. Defaults to mongodb.
+            host (str): See class attributes. Defaults to all interfaces.
+            port (int): See class attributes. Defaults to 8080.
+            session_ttl (float): See class attributes. Defaults to GameServer.SESSION_TTL.
+            max_sessions (int): See class attributes. Defaults to GameServer.MAX_SESSIONS.
+            recorder (AnswerRecorder, optional): A started recorder of the database.
+                Defaults to None (the server starts its own recorder and closes it on close).
+        """
+        super().__init__(db, cache_questions=True)
+        self.host = host
+        self.port = port
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.adb = ExecutorAsyncDAL(self.db, self.DB_WORKERS)
+        self._owns_recorder = recorder is None
+        if recorder is None:
+            recorder = AnswerRecorder(self.db, journal_path="answers_server.journal")
+            recorder.start()
+        self.recorder = recorder
+        self._sessions = {}
+
+    def start(self):
+        self.ui.alert(f"Serving the game on http://{self.host}:{self.port} (press Ctrl+C to stop)")
+        web.run_app(self.make_app(), host=self.host, port=self.port, print=None)
+
+    def restart(self):
+        # the server runs until it is stopped
+        return False
+
+    def close(self):
+        """ Writes the remaining answers to the database before releasing it."""
+        if self._owns_recorder:
+            self.recorder.close()
+        # closes the wrapped database along with the executor threads
+        asyncio.run(self.adb.close())
+
+    def make_app(self):
+        """
+        Creates the web application of the server.
+
+        Returns:
+            aiohttp.web.Application: The application, with a background task removing expired sessions.
+
+        """
+        app = web.Application()
+        app.add_routes([
+            web.get('/categories', self.get_categories),
+            web.get('/categories/{category}/difficulties', self.get_difficulties),
+            web.post('/sessions', self.create_session),
+            web.get('/sessions/{session}/question', self.get_question),
+            web.post('/sessions/{session}/answer', self.answer),
+            web.get('/sessions/{session}/score', self.get_score),
+            web.delete('/sessions/{session}', self.end_session)
+        ])
+        if METRICS.enabled:
+            app.add_routes([web.get('/metrics', self.get_metrics)])
+        app.cleanup_ctx.append(self._sweeper)
+        return app
+
+    async def get_metrics(self, request):
+        return web.Response(text=METRICS.to_prometheus(), content_type='text/plain')
+
+    async def get_categories(self, request):
+        return self._json(await self.adb.get_categories())
+
+    async def get_difficulties(self, request):
+        return self._json(await self.adb.get_difficulties(request.match_info['category']))
+
+    async def create_session(self, request):
+        body = await self._read_body(request)
+        try:
+            amount = int(body.get('amount', 10))
+            if amount <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise self._error(web.HTTPBadRequest, "amount must be a positive number.")
+        category, difficulty = body.get('category'), body.get('difficulty')
+        if not isinstance(category, str) or not category:
+            raise self._error(web.HTTPBadRequest, "category must be the name of a category.")
+        if difficulty not in self.adb.difficulties:
+            raise self._error(web.HTTPBadRequest, f"difficulty must be one of {self.adb.difficulties}.")
+        if len(self._sessions) >= self.max_sessions:
+            raise self._error(web.HTTPServiceUnavailable, "Too many sessions, try again later.")
+        user = body.get('user')
+        if not isinstance(user, str):
+            raise self._error(web.HTTPBadRequest, "user must be a username.")
+        try:
+            user = await self.adb.add_user(user)
+        except ValueError:
+            raise self._error(web.HTTPBadRequest, "Username cannot be empty.")
+        questions = await self.adb.get_questions(amount, category, difficulty, exclude_answered=True, user=user)
+        if not questions:
+            raise self._error(web.HTTPNotFound, "There are no questions for the chosen category and difficulty.")
+        session_id = secrets.token_urlsafe(16)
+        self._sessions[session_id] = GameSession(GameRound(user, questions, self.recorder))
+        return self._json({'session': session_id, 'total': len(questions)}, status=201)
+
+    async def get_question(self, request):
+        game_round = self._get_session(request).round
+        if game_round.finished:
+            return self._json({'done': True})
+        return self._json({'n': game_round.position + 1, 'question': game_round.question['question'],
+                           'answers': game_round.options()})
+
+    async def answer(self, request):
+        game_round = self._get_session(request).round
+        if game_round.finished:
+            raise self._error(web.HTTPConflict, "The game is finished.")
+        if not game_round.presented:
+            raise self._error(web.HTTPConflict, "Get the question before answering it.")
+        body = await self._read_body(request)
+        try:
+            answer = game_round.options()[int(body['answer'])]
+        except (KeyError, TypeError, ValueError, IndexError):
+            raise self._error(web.HTTPBadRequest, "answer must be the index of one of the answers.")
+        correct_answer = game_round.question['correct_answer']
+        return self._json({'correct': game_round.answer(answer), 'answer': correct_answer})
+
+    async def get_score(self, request):
+        return self._json(self._get_session(request).round.score())
+
+    async def end_session(self, request):
+        score = self._get_session(request).round.score()
+        del self._sessions[request.match_info['session']]
+        return self._json(score)
+
+    def _get_session(self, request):
+        # returns the session of the request and marks it as used
+        session = self._sessions.get(request.match_info['session'])
+        if session is None or time.monotonic() - session.last_access > self.session_ttl:
+            raise self._error(web.HTTPNotFound, "Unknown or expired session.")
+        session.last_access = time.monotonic()
+        return session
+
+    async def _sweeper(self, app):
+        # a cleanup context that removes the expired sessions in the background while the app runs
+        async def sweep():
+            while True:
+                await asyncio.sleep(self._SWEEP_INTERVAL)
+                now = time.monotonic()
+                expired = [k for k, s in self._sessions.items() if now - s.last_access > self.session_ttl]
+                for key in expired:
+                    del self._sessions[key]
+
+        task = asyncio.create_task(sweep())
+        yield
+        task.cancel()
+
+    @classmethod
+    async def _read_body(cls, request):
+        try:
+            body = await request.json()
+        except ValueError:
+            raise cls._error(web.HTTPBadRequest, "The body must be a JSON object.")
+        if not isinstance(body, dict):
+            raise cls._error(web.HTTPBadRequest, "The body must be a JSON object.")
+        return body
+
+    @classmethod
+    def _error(cls, error_class, message):
+        return error_class(text=cls._dumps({'error': message}), content_type='application/json')
+
+    @classmethod
+    def _json(cls, data, status=200):
+        return web.json_response(data, status=status, dumps=cls._dumps)
+
+    @staticmethod
+    def _dumps(data):
+        # compact separators, the payloads are small and frequent
+        return json.dumps(data, separators=(',', ':'))
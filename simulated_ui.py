@@ -0,0 +1,122 @@
+import html
+import random
+import time
+
+
+class SimulatedUI:
+    """
+    A non-interactive UI that plays the game as a simulated player, for load tests.
+    It has the same methods as ConsoleUI and answers the prompts of the game modes:
+        the username and the amount of questions, the category and difficulty (drawn from weights)
+        and the questions (answered correctly with the given accuracy).
+    To know the correct answers, the questions of the session must be given with expect before they are asked.
+
+    Attributes:
+        username (str): The name the player enters.
+        amount (int or tuple): The number of questions per game, or a (min, max) range to draw it from.
+        category_weights (dict): The relative chance to choose each category by name.
+            Categories that are not in the dictionary are never chosen, unless none of the offered categories is.
+            None means all the categories are equally likely.
+        difficulty_weights (dict): The same as category_weights for the difficulties.
+        accuracy (float): The chance to answer a question correctly.
+        think_time (float): The mean time (in seconds) the player takes for every prompt.
+            The times are drawn from an exponential distribution. 0 means no waiting.
+        thinking (float): The total time spent thinking so far.
+        correct (int): The number of questions answered correctly so far.
+
+    """
+
+    def __init__(self, username, amount=10, category_weights=None, difficulty_weights=None, accuracy=0.5,
+                 think_time=0.0, seed=None):
+        """
+        Args:
+            username (str): See class attributes.
+            amount (int or tuple): See class attributes. Defaults to 10.
+            category_weights (dict, optional): See class attributes.
+            difficulty_weights (dict, optional): See class attributes.
+            accuracy (float): See class attributes. Defaults to 0.5.
+            think_time (float): See class attributes. Defaults to 0.
+            seed (optional): The seed of the player's random choices. Defaults to None (random).
+        """
+        self.username = username
+        self.amount = amount
+        self.category_weights = category_weights
+        self.difficulty_weights = difficulty_weights
+        self.accuracy = accuracy
+        self.think_time = think_time
+        self.thinking = 0.0
+        self.correct = 0
+        self._rng = random.Random(seed)
+        self._expected = []  # the correct answers of the questions that were not asked yet
+
+    def expect(self, questions):
+        """
+        Sets the questions that will be asked next, so they can be answered with the player's accuracy.
+
+        Args:
+            questions (list): The questions as returned by DAL.get_questions, in the order they are asked.
+
+        """
+        self._expected = [html.unescape(q['correct_answer']) for q in questions]
+
+    def get_user_choice(self, options, message=None):
+        options = [html.unescape(o) for o in options]
+        self._think()
+        if self._expected and self._expected[0] in options:
+            correct = self._expected.pop(0)
+            wrong = [o for o in options if o != correct]
+            if not wrong or self._rng.random() < self.accuracy:
+                self.correct += 1
+                return correct
+            return self._rng.choice(wrong)
+        message = (message or "").lower()
+        if "categor" in message:
+            return self._weighted_choice(options, self.category_weights)
+        if "difficult" in message:
+            return self._weighted_choice(options, self.difficulty_weights)
+        if options == ["Yes", "No"]:
+            return "No"
+        return self._rng.choice(options)
+
+    def get_user_input(self, query, validate=None):
+        self._think()
+        if "username" in query.lower():
+            return self.username
+        if isinstance(self.amount, tuple):
+            return str(self._rng.randint(*self.amount))
+        return str(self.amount)
+
+    def yes_no(self, query):
+        # a simulated player never retries or plays again, the driver decides how many games are played
+        return False
+
+    def retry(self):
+        return False
+
+    def welcome(self, message):
+        pass
+
+    def alert(self, message):
+        pass
+
+    def confirm(self, message):
+        pass
+
+    def restart(self):
+        pass
+
+    def show_data(self, data, bar=False):
+        pass
+
+    def _think(self):
+        if self.think_time > 0:
+            seconds = self._rng.expovariate(1 / self.think_time)
+            self.thinking += seconds
+            time.sleep(seconds)
+
+    def _weighted_choice(self, options, weights):
+        if weights:
+            option_weights = [weights.get(o, 0) for o in options]
+            if any(option_weights):
+                return self._rng.choices(options, option_weights)[0]
+        return self._rng.choice(options)
@@ -0,0 +1,186 @@
+"""
+An opt-in log of the database statements that are slower than a threshold, with their parameters, duration
+    and execution plan, written as JSON lines to a rotating local file.
+
+DbSqlServer records every sql statement (with the SHOWPLAN_XML plan) and DbMongodb records every aggregation
+    pipeline (with the explain output) that exceeds the threshold.
+The log of the process is enabled by setting the TRIVIA_SLOW_QUERY_MS environment variable to the threshold
+    in milliseconds. TRIVIA_SLOW_QUERY_LOG sets the file (default: slow_queries.log).
+
+The report ranks the statements by their total time in the log (including the rotated files):
+Usage: python slow_query_log.py [--log slow_queries.log] [--top 10] [--plans]
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+import pandas as pd
+
+
+class SlowQueryLog:
+    """
+    Records slow statements to a rotating file. Safe to use from many threads.
+    Each line is a JSON object with the keys [time, backend, statement, params, ms, plan].
+
+    Attributes:
+        path (str): The log file. Rotated files get the suffixes .1, .2 and so on.
+        threshold_ms (float): Statements that take longer than this (in milliseconds) are recorded.
+        max_bytes (int): The size of the log file at which it is rotated.
+        backup_count (int): The number of rotated files that are kept.
+
+    """
+
+    def __init__(self, path='slow_queries.log', threshold_ms=100, max_bytes=10 * 1024 * 1024, backup_count=5):
+        """
+        Args:
+            path (str): See class attributes. Defaults to slow_queries.log.
+            threshold_ms (float): See class attributes. Defaults to 100.
+            max_bytes (int): See class attributes. Defaults to 10MB.
+            backup_count (int): See class attributes. Defaults to 5.
+        """
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._threshold = threshold_ms / 1000
+        # a logger per file, so logs of the same file share a handler (and its lock)
+        self._logger = logging.getLogger(f"{__name__}.{os.path.abspath(path)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        if not self._logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                          encoding='utf-8', delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger.addHandler(handler)
+
+    def is_slow(self, seconds):
+        """ Returns True if a statement that took the given number of seconds should be recorded."""
+        return seconds > self._threshold
+
+    def record(self, backend, statement, params, seconds, plan=None):
+        """
+        Writes a slow statement to the log.
+
+        Args:
+            backend (str): The name of the database (e.g. the DAL class name).
+            statement (str): The statement. Statements with the same text are grouped by the report,
+                so the values should be in the params and not in the statement.
+            params: The parameters of the statement. Anything that is not JSON serializable is written as a string.
+            seconds (float): The duration of the statement.
+            plan (str, optional): The execution plan of the statement.
+
+        """
+        entry = {
+            'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'backend': backend,
+            'statement': statement,
+            'params': params,
+            'ms': round(seconds * 1000, 3),
+            'plan': plan
+        }
+        self._logger.info(json.dumps(entry, default=str))
+
+    def close(self):
+        """ Closes the log file. It is reopened if more statements are recorded."""
+        for handler in self._logger.handlers:
+            handler.close()
+
+    @staticmethod
+    def shape(value):
+        """
+        Replaces the literal values in a mongodb query or pipeline with "?", so pipelines that only
+            differ in their values have the same shape. Field paths and operators ("$...") are kept.
+
+        Args:
+            value: A pipeline, stage or value.
+
+        Returns:
+            The same structure with "?" instead of every literal value.
+
+        """
+        if isinstance(value, dict):
+            return {k: SlowQueryLog.shape(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [SlowQueryLog.shape(v) for v in value]
+        if isinstance(value, str) and value.startswith('$'):
+            return value
+        return "?"
+
+
+def _read_entries(path):
+    # reads the entries of the log file and its rotated files, oldest first
+    rotated = [f for f in glob.glob(glob.escape(path) + ".*") if f.rsplit('.', 1)[1].isdigit()]
+    rotated.sort(key=lambda f: int(f.rsplit('.', 1)[1]), reverse=True)
+    for file in rotated + [path]:
+        if not os.path.exists(file):
+            continue
+        with open(file, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def report(path='slow_queries.log', top=10):
+    """
+    Ranks the statements in the log by the total time they took.
+
+    Args:
+        path (str): The log file. Defaults to slow_queries.log.
+        top (int): The number of statements to return. Defaults to 10.
+
+    Returns:
+        pandas.DataFrame: A row per statement with the columns
+            [backend, statement, count, total_ms, mean_ms, max_ms, last_seen, plan]
+            where plan is the plan of the slowest execution.
+
+    """
+    columns = ['backend', 'statement', 'count', 'total_ms', 'mean_ms', 'max_ms', 'last_seen', 'plan']
+    groups = {}
+    for entry in _read_entries(path):
+        statement = entry['statement']
+        if not isinstance(statement, str):
+            statement = json.dumps(statement)
+        key = (entry['backend'], re.sub(r"\s+", " ", statement).strip())
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {'count': 0, 'total_ms': 0.0, 'max_ms': -1.0, 'last_seen': None, 'plan': None}
+        group['count'] += 1
+        group['total_ms'] += entry['ms']
+        group['last_seen'] = entry['time']
+        if entry['ms'] > group['max_ms']:
+            group['max_ms'] = entry['ms']
+            group['plan'] = entry.get('plan')
+    rows = [[backend, statement, g['count'], g['total_ms'], g['total_ms'] / g['count'], g['max_ms'],
+             g['last_seen'], g['plan']] for (backend, statement), g in groups.items()]
+    result = pd.DataFrame(rows, columns=columns)
+    return result.sort_values('total_ms', ascending=False, ignore_index=True).head(top)
+
+
+# the slow query log of the process, None if it is disabled
+SLOW_QUERIES = (SlowQueryLog(os.environ.get('TRIVIA_SLOW_QUERY_LOG', 'slow_queries.log'),
+                             float(os.environ['TRIVIA_SLOW_QUERY_MS']))
+                if os.environ.get('TRIVIA_SLOW_QUERY_MS') else None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank the statements in the slow query log by their total time.")
+    parser.add_argument("--log", default=os.environ.get('TRIVIA_SLOW_QUERY_LOG', 'slow_queries.log'))
+    parser.add_argument("--top", type=int, default=10, help="the number of statements to show (default: 10)")
+    parser.add_argument("--plans", action="store_true", help="print the plan of the slowest execution of each")
+    args = parser.parse_args()
+
+    worst = report(args.log, args.top)
+    if worst.empty:
+        print(f"No slow statements in {args.log}.")
+        exit()
+    width = 100
+    table = worst.drop(columns=['plan'])
+    table['statement'] = table['statement'].map(lambda s: s if len(s) <= width else s[:width - 3] + "...")
+    print(table.to_string(float_format=lambda x: f"{x:.1f}"))
+    if args.plans:
+        for i, row in worst.iterrows():
+            print(f"\n[{i}] {row['backend']}: {row['statement']}\n{row['plan'] or '(no plan)'}")
@@ -0,0 +1,66 @@
+import copy
+import os
+import sys
+import pytest
+
+# the modules of the project are at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _bit_or(doc, field_name, value):
+    # mongomock has no $bit update operator, the answered questions bitmaps only use "or"
+    doc[field_name] = int(doc.get(field_name, 0)) | int(value['or'])
+
+
+def _positional_find_and_modify(find_and_modify):
+    # mongomock updates the document found by find_one_and_update by its _id alone, so the positional operator
+    # ("questions.$" of the embedded records) matches the first element instead of the one in the query
+    def wrapper(self, query, projection=None, update=None, upsert=False, sort=None, return_document=False,
+                **kwargs):
+        fields = [field for op in (update or {}).values() if isinstance(op, dict) for field in op]
+        if upsert or not any('.$' in field for field in fields):
+            return find_and_modify(self, query, projection, update, upsert, sort, return_document, **kwargs)
+        old = copy.deepcopy(self.find_one(query, projection=projection, sort=sort))  # shares the elements
+        if old is None:
+            return None
+        self._update(dict(query, _id=old['_id']), update, False)
+        return self.find_one({'_id': old['_id']}, projection) if return_document else old
+    return wrapper
+
+
+@pytest.fixture
+def mongomock_client(monkeypatch):
+    """ Makes DbMongodb (and so AsyncDbMongodb) connect to a new in-memory mongomock client."""
+    mongomock = pytest.importorskip("mongomock")
+    import mongomock.collection
+    import db_mongodb
+    monkeypatch.setitem(mongomock.collection._updaters, '$bit', _bit_or)
+    monkeypatch.setattr(mongomock.collection.Collection, '_find_and_modify',
+                        _positional_find_and_modify(mongomock.collection.Collection._find_and_modify))
+    monkeypatch.setattr(db_mongodb, 'MongoClient', mongomock.MongoClient)
+
+
+@pytest.fixture(params=['embedded', 'collection'])
+def mongo_db(request, mongomock_client):
+    """ A DbMongodb of each records storage over an in-memory mongomock client."""
+    from db_mongodb import DbMongodb
+    db = DbMongodb(records_storage=request.param)
+    yield db
+    db.close()
+
+
+@pytest.fixture(params=['sqlite', 'columnar', 'embedded', 'collection'])
+def db(request, tmp_path):
+    """ A database of each synchronous backend that runs here: sqlite, columnar and both mongomock storages."""
+    if request.param == 'sqlite':
+        from db_sqlite import DbSqlite
+        database = DbSqlite(str(tmp_path / "trivia.db"))
+    elif request.param == 'columnar':
+        from db_columnar import DbColumnar
+        database = DbColumnar()
+    else:
+        request.getfixturevalue('mongomock_client')
+        from db_mongodb import DbMongodb
+        database = DbMongodb(records_storage=request.param)
+    yield database
+    database.close()
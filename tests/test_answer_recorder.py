@@ -0,0 +1,75 @@
+import pytest
+from answer_recorder import AnswerRecorder
+from db_columnar import DbColumnar
+from question_cache import QuestionCache
+
+
+class FlakyDb(DbColumnar):
+    # a database whose writes fail while fail is set, like a database that is down
+    fail = False
+
+    def update_correct_many(self, records):
+        if self.fail:
+            raise ConnectionError("database is down")
+        return super().update_correct_many(records)
+
+
+def _setup(db):
+    db.add_questions([{'category': 'Test', 'type': 'boolean', 'difficulty': 'easy',
+                       'question': f"Question {i}?", 'correct_answer': 'True'} for i in range(3)])
+    ids = [q['id'] for q in db.get_all_questions('Test', 'easy')]
+    return ids, db.add_user("alice")
+
+
+def _correct(db):
+    results = db.get_results_by('user')
+    return results['Correct'].sum(), results['Incorrect'].sum()
+
+
+def test_answers_recorded_after_a_flush_are_replayed(tmp_path):
+    journal = str(tmp_path / "answers.journal")
+    db = FlakyDb()
+    ids, user = _setup(db)
+    recorder = AnswerRecorder(db, journal_path=journal, flush_interval=0.01, retry_interval=0.01)
+    recorder.start()
+    recorder.record(ids[0], user, True)
+    assert recorder.flush(timeout=5)
+
+    # the process dies while the database is down
+    db.fail = True
+    recorder.record(ids[1], user, False)
+    with open(journal, 'rb') as f:
+        assert f.read().startswith(b'{"seq": 2')
+    recorder.close(timeout=5)
+    assert _correct(db) == (1, 0)
+
+    db.fail = False
+    replay = AnswerRecorder(db, journal_path=journal, flush_interval=0.01)
+    replay.start()
+    assert replay.stats()['replayed'] == 1
+    assert replay.flush(timeout=5)
+    replay.close()
+    assert _correct(db) == (1, 1)
+
+
+def test_a_journal_is_used_by_one_recorder_at_a_time(tmp_path):
+    journal = str(tmp_path / "answers.journal")
+    db = DbColumnar()
+    ids, user = _setup(db)
+    first = AnswerRecorder(db, journal_path=journal, flush_interval=0.01)
+    first.start()
+    second = AnswerRecorder(db, journal_path=journal, flush_interval=0.01)
+    with pytest.raises(RuntimeError):
+        second.start()
+    first.record(ids[0], user, True)
+    assert first.flush(timeout=5)
+    first.close()
+    second.start()
+    second.record(ids[1], user, False)
+    assert second.flush(timeout=5)
+    second.close()
+    assert _correct(db) == (1, 1)
+
+
+def test_journal_is_named_after_the_wrapped_backend():
+    assert AnswerRecorder(QuestionCache(DbColumnar())).journal_path == "answers_DbColumnar.journal"
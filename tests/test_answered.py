@@ -0,0 +1,53 @@
+from dal import DAL, AnsweredSeqs
+
+
+def _bucket(db, count, category='Answered'):
+    db.add_questions([{'category': category, 'type': 'boolean', 'difficulty': 'easy',
+                       'question': f"{category} {i}?", 'correct_answer': 'True'} for i in range(count)])
+    return {q['id']: q['seq'] for q in db.get_all_questions(category, 'easy')}
+
+
+def test_get_answered_has_the_numbers_of_the_answered_questions(db):
+    seqs = _bucket(db, 5)
+    assert sorted(seqs.values()) == [1, 2, 3, 4, 5]
+    user = db.add_user("alice")
+    answered = list(seqs)[:2]
+    db.update_correct(answered[0], user, 1)
+    db.update_correct_many([(answered[1], user, 0)])
+    assert sorted(db.get_answered(user, 'Answered', 'easy')) == sorted(seqs[q_id] for q_id in answered)
+    assert len(db.get_answered(user, 'Other', 'easy')) == 0
+    assert len(db.get_answered(db.add_user("bob"), 'Answered', 'easy')) == 0
+
+
+def test_large_batches_set_the_same_bits(db):
+    # more than one bitmap word, and a batch large enough for the grouped path of the columnar backend
+    seqs = _bucket(db, 3 * AnsweredSeqs.WORD_BITS)
+    users = [db.add_user(f"user{i}") for i in range(3)]
+    ids = list(seqs)
+    records = [(q_id, users[i % 3], 1) for i, q_id in enumerate(ids)]
+    db.update_correct_many(records)
+    for u, user in enumerate(users):
+        expected = sorted(seqs[q_id] for i, q_id in enumerate(ids) if i % 3 == u)
+        assert sorted(db.get_answered(user, 'Answered', 'easy')) == expected
+    db.rebuild_stats()
+    assert sorted(db.get_answered(users[0], 'Answered', 'easy')) == sorted(seqs[q_id] for q_id in ids[::3])
+
+
+def test_sampling_a_mostly_answered_bucket_draws_the_unanswered_numbers():
+    size = 1000
+    unanswered = {5, 37, 640, 999}
+    answered = AnsweredSeqs()
+    for seq in range(1, size + 1):
+        if seq not in unanswered:
+            answered.add(seq)
+    drawn = set()
+    for _ in range(50):
+        seqs = DAL._sample_seqs(size, 2, answered)
+        assert len(set(seqs)) == 2 and set(seqs) <= unanswered
+        drawn.update(seqs)
+    assert drawn == unanswered
+    assert sorted(DAL._sample_seqs(size, 10, answered)) == sorted(unanswered)
+    # the answered numbers that were not tried fill up the rest
+    seqs = DAL._sample_unanswered(size, 6, answered, {5, 999, 3})
+    assert len(set(seqs)) == 6 and {37, 640} <= set(seqs) and not {5, 999, 3} & set(seqs)
+    assert sorted(AnsweredSeqs().sample(70, 100)) == list(range(1, 71))
@@ -0,0 +1,210 @@
+"""
+The conformance suite of the AsyncDAL implementations: every implementation must have the coroutines of the DAL
+    with the same arguments, and return the same values and raise the same exceptions as the blocking DAL.
+"""
+import asyncio
+import inspect
+import json
+import uuid
+import pytest
+from async_dal import ExecutorAsyncDAL
+from dal import DAL
+
+
+def _sqlite(request, tmp_path):
+    from db_sqlite import DbSqlite
+    return ExecutorAsyncDAL(DbSqlite(str(tmp_path / "trivia.db")))
+
+
+def _columnar(request, tmp_path):
+    from db_columnar import DbColumnar
+    return ExecutorAsyncDAL(DbColumnar())
+
+
+def _mongomock(request, tmp_path):
+    request.getfixturevalue('mongomock_client')
+    from db_mongodb import DbMongodb
+    return ExecutorAsyncDAL(DbMongodb(records_storage=DbMongodb.RECORDS_COLLECTION))
+
+
+def _async_mongodb(request, tmp_path):
+    request.getfixturevalue('mongomock_client')
+    from async_db_mongodb import AsyncDbMongodb
+    return AsyncDbMongodb(max_workers=4)
+
+
+def _async_sql_server(request, tmp_path):
+    pyodbc = pytest.importorskip("pyodbc", exc_type=ImportError)  # also without the odbc driver manager
+    from async_db_sql_server import AsyncDbSqlServer
+    db = AsyncDbSqlServer(max_workers=4, pool_timeout=5)
+    try:
+        asyncio.run(db.get_categories())
+    except pyodbc.Error as e:
+        asyncio.run(db.close())
+        pytest.skip(f"no sql server: {e}")
+    return db
+
+
+IMPLEMENTATIONS = {
+    'executor_sqlite': _sqlite,
+    'executor_columnar': _columnar,
+    'executor_mongomock': _mongomock,
+    'async_mongodb': _async_mongodb,
+    'async_sql_server': _async_sql_server,
+}
+
+
+@pytest.fixture(params=list(IMPLEMENTATIONS))
+def async_db(request, tmp_path):
+    db = IMPLEMENTATIONS[request.param](request, tmp_path)
+    yield db
+    asyncio.run(db.close())
+
+
+def _questions(category, count):
+    return [{'category': category, 'type': 'boolean', 'difficulty': 'easy',
+             'question': f"{category} {i}?", 'correct_answer': 'True'} for i in range(count)]
+
+
+def _names():
+    # unique names, the suite may run against a shared database server
+    suffix = uuid.uuid4().hex[:8]
+    return f"Async {suffix}", f"async_user_{suffix}"
+
+
+def test_implements_the_dal(async_db):
+    for name in DAL.__abstractmethods__:
+        if name.startswith('_'):
+            continue
+        method = getattr(async_db, name)
+        if name == 'export_rows':
+            assert inspect.isasyncgenfunction(method), name
+        else:
+            assert inspect.iscoroutinefunction(method), name
+        expected = inspect.signature(getattr(DAL, name)).parameters
+        assert list(inspect.signature(method).parameters) == list(expected)[1:], name
+
+
+def test_questions(async_db):
+    category, _ = _names()
+
+    async def scenario():
+        result = await async_db.add_questions(_questions(category, 5))
+        assert result.added == 5 and not result.failures
+        assert (await async_db.add_questions(_questions(category, 1))).duplicates == 1
+        assert category in await async_db.get_categories()
+        assert await async_db.get_difficulties(category) == ['easy']
+        assert len(await async_db.get_all_questions(category, 'easy')) == 5
+        questions = await async_db.get_questions(3, category, 'easy')
+        assert len(questions) == 3 and len({q['id'] for q in questions}) == 3
+        await async_db.remove_category(category)
+        assert category not in await async_db.get_categories()
+
+    asyncio.run(scenario())
+
+
+def test_answers_and_stats(async_db):
+    category, name = _names()
+
+    async def scenario():
+        await async_db.add_questions(_questions(category, 3))
+        ids = [q['id'] for q in await async_db.get_all_questions(category, 'easy')]
+        user = await async_db.add_user(name)
+        assert await async_db.add_user(name) == user
+        await async_db.update_correct(ids[0], user, 1)
+        result = await async_db.update_correct_many([(ids[1], user, 1), (ids[2], user, 0)])
+        assert result.added == 2 and not result.failures
+
+        assert len(await async_db.get_answered(user, category, 'easy')) == 3
+        # the answered questions are drawn last
+        unanswered = await async_db.get_questions(1, category, 'easy', exclude_answered=True, user=user)
+        assert len(unanswered) == 1
+
+        results = await async_db.get_results_by('user')
+        # the name column of users differs between the implementations
+        row = results[results[results.columns[0]] == name].iloc[0]
+        assert (row['Correct'], row['Incorrect']) == (2, 1)
+        rank = await async_db.get_user_rank(name)
+        assert (rank['correct'], rank['incorrect']) == (2, 1)
+        page, _ = await async_db.get_leaderboard(limit=rank['rank'] + 10)
+        assert name in list(page['Name'])
+        await async_db.rebuild_stats()
+        assert await async_db.get_user_rank(name) == rank
+
+        # ids survive a round trip through json (e.g. a journal)
+        assert async_db.decode_id(json.loads(json.dumps(async_db.encode_id(user)))) == user
+        await async_db.remove_category(category)
+
+    asyncio.run(scenario())
+
+
+def test_errors(async_db):
+    category, name = _names()
+
+    async def scenario():
+        await async_db.add_questions(_questions(category, 1))
+        question = (await async_db.get_all_questions(category, 'easy'))[0]['id']
+        user = await async_db.add_user(name)
+        await async_db.remove_category(category)
+        with pytest.raises(ValueError):
+            await async_db.update_correct(question, user, 1)
+        result = await async_db.update_correct_many([(question, user, 1)])
+        assert result.added == 0 and [index for index, _ in result.failures] == [0]
+        with pytest.raises(ValueError):
+            await async_db.get_results_by('question')
+        with pytest.raises(ValueError):
+            await async_db.get_questions(1, category, 'easy', exclude_answered=True)
+
+    asyncio.run(scenario())
+
+
+def test_hidden_category(async_db):
+    category, _ = _names()
+
+    async def scenario():
+        await async_db.add_questions(_questions(category, 4))
+        assert await async_db.hide_category(category)
+        assert await async_db.get_questions(2, category, 'easy') == []
+        assert category not in await async_db.get_categories()
+        assert await async_db.purge_categories(batch_size=2)
+        assert await async_db.get_all_questions(category, 'easy') == []
+
+    asyncio.run(scenario())
+
+
+def test_export(async_db):
+    category, _ = _names()
+
+    async def scenario():
+        watermark = await async_db.export_watermark()
+        await async_db.add_questions(_questions(category, 5))
+        for since in [None, watermark]:
+            batches = [batch async for batch in async_db.export_rows('questions', since, batch_size=2)]
+            assert all(len(batch) <= 2 for batch in batches)
+            rows = [row for batch in batches for row in batch if row[1] == category]
+            assert len(rows) == 5 and all(len(row) == len(DAL.EXPORT_TABLES['questions']) for row in rows)
+        with pytest.raises(ValueError):
+            async for _ in async_db.export_rows('nothing'):
+                pass
+        hashed, duplicates = await async_db.backfill_question_hashes()
+        assert isinstance(hashed, int) and isinstance(duplicates, list)
+        await async_db.remove_category(category)
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_calls(async_db):
+    category, name = _names()
+
+    async def scenario():
+        await async_db.add_questions(_questions(category, 10))
+        ids = [q['id'] for q in await async_db.get_all_questions(category, 'easy')]
+        users = await asyncio.gather(*[async_db.add_user(f"{name}_{i}") for i in range(10)])
+        await asyncio.gather(*[async_db.update_correct(q, u, 1) for q in ids for u in users])
+        samples = await asyncio.gather(*[async_db.get_questions(5, category, 'easy') for _ in range(20)])
+        assert all(len(questions) == 5 for questions in samples)
+        for i in range(10):
+            assert (await async_db.get_user_rank(f"{name}_{i}"))['correct'] == 10
+        await async_db.remove_category(category)
+
+    asyncio.run(scenario())
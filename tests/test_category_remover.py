@@ -0,0 +1,29 @@
+import threading
+from category_remover import CategoryRemover
+from db_sqlite import DbSqlite
+
+
+def test_concurrent_removals_are_counted(tmp_path):
+    # sqlite deletes the hidden categories in batches
+    db = DbSqlite(str(tmp_path / "trivia.db"))
+    categories = [f"Removed {i}" for i in range(20)]
+    db.add_questions([{'category': category, 'type': 'boolean', 'difficulty': 'easy',
+                       'question': f"{category} {i}?", 'correct_answer': 'True'}
+                      for category in categories for i in range(3)])
+    remover = CategoryRemover(db, batch_size=2, batch_interval=0)
+    remover.start()
+    try:
+        threads = [threading.Thread(target=lambda names=categories[i::4]: [remover.remove(n) for n in names])
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert remover.wait(timeout=10)
+    finally:
+        remover.close()
+    stats = remover.stats()
+    assert stats['requested'] == stats['removed'] == 20
+    assert stats['deleted_questions'] == 60 and stats['removing'] is None
+    assert db.get_categories() == []
+    db.close()
@@ -0,0 +1,63 @@
+import pytest
+from connection_pool import ConnectionPool
+
+
+class BrokenLink(Exception):
+    pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.rollbacks = 0
+
+    def close(self):
+        self.closed = True
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def _pool(**kwargs):
+    return ConnectionPool(FakeConnection, max_size=2, discard_on=(BrokenLink,), reset=lambda c: c.rollback(),
+                          **kwargs)
+
+
+def test_other_errors_reset_and_reuse_the_connection():
+    pool = _pool()
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            raise ValueError("duplicate key")
+    assert not conn.closed and conn.rollbacks == 1
+    with pool.connection() as again:
+        assert again is conn
+    assert pool.stats()['created'] == 1
+
+
+def test_discard_on_errors_close_the_connection():
+    pool = _pool()
+    with pytest.raises(BrokenLink):
+        with pool.connection() as conn:
+            raise BrokenLink()
+    assert conn.closed and conn.rollbacks == 0
+    with pool.connection() as again:
+        assert again is not conn
+
+
+def test_failed_reset_discards_the_connection():
+    def reset(conn):
+        raise BrokenLink()
+
+    pool = ConnectionPool(FakeConnection, discard_on=(BrokenLink,), reset=reset)
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            raise ValueError()
+    assert conn.closed
+
+
+def test_default_discards_on_any_error():
+    pool = ConnectionPool(FakeConnection)
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            raise ValueError()
+    assert conn.closed
@@ -0,0 +1,23 @@
+import pytest
+from db_columnar import DbColumnar
+
+
+def test_save_and_load_keep_the_data(tmp_path):
+    path = str(tmp_path / "trivia.npz")
+    db = DbColumnar()
+    db.add_questions([{'category': 'Saved', 'type': 'multiple', 'difficulty': 'easy', 'question': f"Saved {i}?",
+                       'correct_answer': 'Yes', 'incorrect_answers': ['No', 'Maybe']} for i in range(3)])
+    ids = [q['id'] for q in db.get_all_questions('Saved', 'easy')]
+    user = db.add_user("alice")
+    db.update_correct_many([(ids[0], user, 1), (ids[1], user, 0)])
+    watermark = db.export_watermark()
+    db.save(path)
+
+    loaded = DbColumnar()
+    loaded.load(path)
+    assert loaded.get_all_questions('Saved', 'easy') == db.get_all_questions('Saved', 'easy')
+    assert loaded.get_user_rank("alice") == {'rank': 1, 'correct': 1, 'incorrect': 1}
+    assert sorted(loaded.get_answered(user, 'Saved', 'easy')) == sorted(db.get_answered(user, 'Saved', 'easy'))
+    assert loaded.export_watermark() == watermark + 1
+    with pytest.raises(ValueError):
+        loaded.add_question('Saved', 'multiple', 'easy', "saved  0?", 'Yes', ['No'])
@@ -0,0 +1,129 @@
+import pytest
+
+
+def _add_questions(db, category="Mongo", count=3):
+    db.add_questions([{
+        'category': category,
+        'type': 'boolean',
+        'difficulty': 'easy',
+        'question': f"{category} {i}?",
+        'correct_answer': 'True'
+    } for i in range(count)])
+    return [q['id'] for q in db.get_all_questions(category, 'easy')]
+
+
+def _user_results(db, user_name):
+    df = db.get_results_by('user')
+    row = df[df['Name'] == user_name].iloc[0]
+    return int(row['Correct']), int(row['Incorrect'])
+
+
+def test_update_correct_counts_single_records(mongo_db):
+    q1, q2, _ = _add_questions(mongo_db)
+    user = mongo_db.add_user("single")
+    mongo_db.update_correct(q1, user, 1)
+    mongo_db.update_correct(q2, user, 0)
+    mongo_db.update_correct(q2, user, 1)  # an existing record is changed, not counted again
+    assert _user_results(mongo_db, "single") == (2, 0)
+    with pytest.raises(ValueError):
+        mongo_db.update_correct("000000000000000000000000", user, 1)
+
+
+def test_update_correct_many_matches_single_updates(mongo_db):
+    q1, q2, q3, q4 = _add_questions(mongo_db, count=4)
+    user = mongo_db.add_user("batch")
+    mongo_db.update_correct(q1, user, 0)
+    result = mongo_db.update_correct_many([
+        (q1, user, 1),  # changes the existing record
+        (q2, user, 0),
+        (q2, user, 1),  # only the last answer of a pair is kept
+        (q3, user, 0),
+        ("000000000000000000000000", user, 1),
+    ])
+    assert result.added == 3
+    assert [index for index, _ in result.failures] == [4]
+    assert _user_results(mongo_db, "batch") == (2, 1)
+    # the answered questions are only drawn when there are not enough others
+    assert [q['id'] for q in mongo_db.get_questions(1, "Mongo", "easy", user=user, exclude_answered=True)] == [q4]
+    mongo_db.rebuild_stats()
+    assert _user_results(mongo_db, "batch") == (2, 1)
+
+
+@pytest.mark.parametrize('crash_at', ['records', 'counters'])
+def test_purge_resumed_after_a_crash_does_not_subtract_twice(mongo_db, monkeypatch, crash_at):
+    kept, = _add_questions(mongo_db, "Kept", count=1)
+    removed, = _add_questions(mongo_db, "Removed", count=1)
+    user = mongo_db.add_user("purged")
+    mongo_db.update_correct_many([(kept, user, 1), (removed, user, 1)])
+    assert mongo_db.hide_category("Removed")
+
+    # the process dies while deleting the records of the batch, or after they are deleted and before
+    # the counters are updated
+    def crash(*args, **kwargs):
+        raise ConnectionError("the process died")
+
+    with monkeypatch.context() as patch:
+        if crash_at == 'records':
+            collection = type(mongo_db.database.records)
+            patch.setattr(collection, 'delete_many', crash)
+            patch.setattr(collection, 'update_many', crash)
+        else:
+            patch.setattr(mongo_db, '_inc_stats', crash)
+        with pytest.raises(ConnectionError):
+            mongo_db.purge_categories()
+    assert mongo_db.purge_categories()
+    assert "Removed" not in mongo_db.get_categories()
+    # the counters may still include the deleted record, but never lose the kept one
+    assert _user_results(mongo_db, "purged")[0] >= 1
+    mongo_db.rebuild_stats()
+    assert _user_results(mongo_db, "purged") == (1, 0)
+
+
+def _scores(db):
+    return {doc["correct"]: doc["users"] for doc in db.database.scores.find({"users": {"$ne": 0}})}
+
+
+def test_scores_follow_the_counters_of_the_users(mongo_db):
+    kept, = _add_questions(mongo_db, "Kept", count=1)
+    removed = _add_questions(mongo_db, "Removed", count=2)
+    answers = {"ann": [(kept, 1)], "bob": [(kept, 1)] + [(q_id, 1) for q_id in removed], "cid": [(removed[0], 0)]}
+    for name, records in answers.items():
+        user = mongo_db.add_user(name)
+        mongo_db.update_correct_many([(q_id, user, correct) for q_id, correct in records])
+    assert _scores(mongo_db) == {0: 1, 1: 1, 3: 1}
+    # bob moves down to ann, cid is left without answers and leaves the leaderboard
+    assert mongo_db.hide_category("Removed")
+    assert mongo_db.purge_categories()
+    assert _scores(mongo_db) == {1: 2}
+    mongo_db.rebuild_stats()
+    assert _scores(mongo_db) == {1: 2}
+
+
+class _RetriedSession:
+    # a session whose first transaction fails on a counter created by a concurrent transaction
+    def __init__(self, attempts):
+        self.attempts = attempts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def with_transaction(self, write):
+        from pymongo.errors import DuplicateKeyError
+        self.attempts.append(write)
+        if len(self.attempts) == 1:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        return write(None)
+
+
+def test_transactions_are_repeated_after_duplicate_keys(mongo_db, monkeypatch):
+    q_id, = _add_questions(mongo_db, count=1)
+    user = mongo_db.add_user("retried")
+    attempts = []
+    monkeypatch.setattr(mongo_db, '_transactions', True)
+    monkeypatch.setattr(mongo_db._client, 'start_session', lambda: _RetriedSession(attempts), raising=False)
+    mongo_db.update_correct(q_id, user, 1)
+    assert len(attempts) == 2
+    assert _user_results(mongo_db, "retried") == (1, 0)
@@ -0,0 +1,35 @@
+import pytest
+from game import GameRound
+
+
+class ListRecorder:
+    # an AnswerRecorder that keeps the recorded answers in a list
+    def __init__(self):
+        self.answers = []
+
+    def record(self, question, user, correct):
+        self.answers.append((question, user, correct))
+
+
+QUESTIONS = [
+    {'id': 1, 'type': 'boolean', 'question': "Is it?", 'correct_answer': 'True'},
+    {'id': 2, 'type': 'multiple', 'question': "Which &amp; why?", 'correct_answer': 'A &amp; B',
+     'wrong_answers': ['C', 'D']},
+]
+
+
+def test_a_round_records_the_answers_and_keeps_the_score():
+    recorder = ListRecorder()
+    game_round = GameRound('alice', QUESTIONS, recorder)
+    with pytest.raises(ValueError):
+        game_round.answer('True')  # not presented yet
+    options = game_round.options()
+    assert sorted(options) == ['False', 'True'] and game_round.options() == options
+    assert game_round.answer('False') is False
+    assert sorted(game_round.options()) == ['A &amp; B', 'C', 'D']
+    assert game_round.answer('A & B') is True  # as displayed, html unescaped
+    assert game_round.finished and game_round.question is None
+    assert game_round.score() == {'correct': 1, 'answered': 2, 'total': 2}
+    assert recorder.answers == [(1, 'alice', 0), (2, 'alice', 1)]
+    with pytest.raises(ValueError):
+        game_round.answer('C')
@@ -0,0 +1,55 @@
+def _answer(db, scores):
+    # adds a user for every name, answering as many questions correctly as its score and one incorrectly
+    db.add_questions([{'category': 'Leaderboard', 'type': 'boolean', 'difficulty': 'easy',
+                       'question': f"Leaderboard {i}?", 'correct_answer': 'True'} for i in range(10)])
+    ids = [q['id'] for q in db.get_all_questions('Leaderboard', 'easy')]
+    users = {}
+    for name, score in scores.items():
+        users[name] = db.add_user(name)
+        db.update_correct_many([(q_id, users[name], 1) for q_id in ids[:score]] + [(ids[-1], users[name], 0)])
+    return ids, users
+
+
+def _pages(db, limit):
+    rows, after = [], None
+    while True:
+        page, after = db.get_leaderboard(limit, after=after)
+        rows += [tuple(row) for row in page[['Name', 'Rank', 'Correct', 'Incorrect']].itertuples(index=False)]
+        if after is None:
+            return rows
+
+
+SCORES = {'ann': 5, 'bob': 3, 'cid': 5, 'dan': 0, 'eve': 3, 'fay': 7}
+
+
+def test_ties_share_a_rank(db):
+    _answer(db, SCORES)
+    ranks = {name: rank for name, rank, _, _ in _pages(db, 10)}
+    assert ranks == {'fay': 1, 'ann': 2, 'cid': 2, 'bob': 4, 'eve': 4, 'dan': 6}
+    for name, score in SCORES.items():
+        assert db.get_user_rank(name) == {'rank': ranks[name], 'correct': score, 'incorrect': 1}
+    assert db.get_user_rank('nobody') is None
+
+
+def test_pages_follow_the_cursor(db):
+    _answer(db, SCORES)
+    whole = _pages(db, 10)
+    assert len(whole) == len(SCORES)
+    assert [correct for _, _, correct, _ in whole] == sorted(SCORES.values(), reverse=True)
+    for limit in (1, 2, 4):
+        assert _pages(db, limit) == whole
+
+
+def test_changed_answers_move_the_users(db):
+    ids, users = _answer(db, SCORES)
+    # dan answers every question correctly, two of ann's correct answers become incorrect
+    db.update_correct_many([(q_id, users['dan'], 1) for q_id in ids])
+    db.update_correct(ids[0], users['ann'], 0)
+    db.update_correct(ids[1], users['ann'], 0)
+    assert db.get_user_rank('dan') == {'rank': 1, 'correct': 10, 'incorrect': 0}
+    assert db.get_user_rank('fay')['rank'] == 2
+    assert db.get_user_rank('ann') == {'rank': 4, 'correct': 3, 'incorrect': 3}
+    assert db.get_user_rank('cid')['rank'] == 3
+    before = _pages(db, 3)
+    db.rebuild_stats()
+    assert _pages(db, 3) == before
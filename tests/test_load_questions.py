@@ -0,0 +1,34 @@
+import json
+from db_columnar import DbColumnar
+from db_sqlite import DbSqlite
+from load_questions import _process_chunk, load
+
+
+def _line(question, **changes):
+    q = {'category': 'Loader', 'type': 'boolean', 'difficulty': 'easy', 'question': question,
+         'correct_answer': 'True', 'incorrect_answers': ['False']}
+    q.update(changes)
+    return (json.dumps(q) + "\n").encode()
+
+
+def test_rows_that_are_not_objects_are_rejected():
+    rows = [b'[1,2]\n', b'null\n', b'5\n', b'{"question": \n', _line("Valid?"), _line("Bad?", difficulty='extreme')]
+    valid, valid_rows, rejected = _process_chunk(DbSqlite, 1, rows, True)
+    assert [q['question'] for q in valid] == ["Valid?"] and valid_rows == [5]
+    assert [(row, data) for row, _, data in rejected] == [
+        (1, '[1,2]'), (2, 'null'), (3, '5'), (4, '{"question": '), (6, _line("Bad?", difficulty='extreme').decode().strip())
+    ]
+
+
+def test_load_writes_the_rejected_lines(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    path.write_bytes(_line("First?") + b'[1,2]\n' + _line("Second?") + b'null\n' + _line("First?"))
+    rejects = tmp_path / "rejects.jsonl"
+    db = DbColumnar()
+    report = load(db, str(path), chunk_size=2, workers=1, rejects_path=str(rejects))
+    assert (report['rows'], report['added'], report['duplicates'], report['rejected']) == (5, 2, 1, 2)
+    assert [json.loads(line) for line in rejects.read_text().splitlines()] == [
+        {'row': 2, 'reason': "Not a JSON object.", 'data': '[1,2]'},
+        {'row': 4, 'reason': "Not a JSON object.", 'data': 'null'},
+    ]
+    assert len(db.get_all_questions('Loader', 'easy')) == 2
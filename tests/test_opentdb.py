@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from db_columnar import DbColumnar
+from opentdb import OpenTdbClient, OpenTdbError, bulk_import
+
+
+class StubApi(ThreadingHTTPServer):
+    # an opentdb api on localhost with a small question bank.
+    # the first rate_limited questions requests are refused, with http 429 if http_429 is set.
+
+    def __init__(self, questions=7, rate_limited=0, http_429=False):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.bank = [{'category': 'Stub', 'type': 'boolean', 'difficulty': 'easy', 'question': f"Stub {i}?",
+                      'correct_answer': 'True', 'incorrect_answers': ['False']} for i in range(questions)]
+        self.rate_limited = rate_limited
+        self.http_429 = http_429
+        self.tokens = {}  # token: the indexes of the questions it returned
+        self.amounts = []  # the amount of every questions request
+        self.request_times = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with self.server.lock:
+            if url.path == '/api_token.php':
+                self._token(params)
+            elif url.path == '/api.php':
+                self._questions(params)
+            else:
+                self.send_error(404)
+
+    def _token(self, params):
+        if params['command'] == 'request':
+            token = f"token{len(self.server.tokens)}"
+            self.server.tokens[token] = set()
+            return self._send({'response_code': 0, 'token': token})
+        if params['token'] not in self.server.tokens:
+            return self._send({'response_code': OpenTdbClient.TOKEN_NOT_FOUND})
+        self.server.tokens[params['token']] = set()
+        self._send({'response_code': 0})
+
+    def _questions(self, params):
+        amount = int(params['amount'])
+        self.server.amounts.append(amount)
+        self.server.request_times.append(time.monotonic())
+        if self.server.rate_limited:
+            self.server.rate_limited -= 1
+            if self.server.http_429:
+                return self.send_error(429)
+            return self._send({'response_code': OpenTdbClient.RATE_LIMIT, 'results': []})
+        token = params.get('token')
+        seen = self.server.tokens[token] if token else set()
+        unseen = [i for i in range(len(self.server.bank)) if i not in seen]
+        if len(unseen) < amount:
+            # like opentdb, nothing is returned when there are not enough questions
+            code = OpenTdbClient.TOKEN_EMPTY if token else OpenTdbClient.NO_RESULTS
+            return self._send({'response_code': code, 'results': []})
+        seen.update(unseen[:amount])
+        self._send({'response_code': 0, 'results': [self.server.bank[i] for i in unseen[:amount]]})
+
+    def _send(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api(request):
+    api = StubApi(**getattr(request, 'param', {}))
+    thread = threading.Thread(target=api.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield api
+    api.shutdown()
+    api.server_close()
+
+
+@pytest.mark.parametrize('stub_api', [{'rate_limited': 2}, {'rate_limited': 2, 'http_429': True}], indirect=True)
+def test_rate_limit_is_retried_with_backoff(stub_api):
+    with OpenTdbClient(stub_api.url, rate=None, backoff=0.05) as client:
+        assert len(client.questions(3)) == 3
+        assert client.stats() == {'requests': 3, 'retries': 2}
+    first, second, third = stub_api.request_times
+    # the delay doubles on every retry
+    assert second - first >= 0.05 and third - second >= 0.1
+
+
+@pytest.mark.parametrize('stub_api', [{'rate_limited': 10}], indirect=True)
+def test_rate_limit_gives_up_after_max_retries(stub_api):
+    with OpenTdbClient(stub_api.url, rate=None, backoff=0.01, max_retries=2) as client:
+        with pytest.raises(OpenTdbError) as error:
+            client.questions(1)
+    assert error.value.response_code == OpenTdbClient.RATE_LIMIT
+    assert len(stub_api.amounts) == 3
+
+
+def test_token_reset(stub_api):
+    with OpenTdbClient(stub_api.url, rate=None) as client:
+        token = client.request_token()
+        assert len(client.questions(7, token=token)) == 7
+        with pytest.raises(OpenTdbError) as error:
+            client.questions(1, token=token)
+        assert error.value.response_code == OpenTdbClient.TOKEN_EMPTY
+        client.reset_token(token)
+        assert len(client.questions(7, token=token)) == 7
+        with pytest.raises(OpenTdbError) as error:
+            client.questions(8)
+        assert error.value.response_code == OpenTdbClient.NO_RESULTS
+
+
+def test_bulk_import_halves_the_request_until_exhausted(stub_api):
+    db = DbColumnar()
+    with OpenTdbClient(stub_api.url, rate=None) as client:
+        report = bulk_import(db, 20, client=client, workers=1)
+    assert report['exhausted']
+    assert (report['fetched'], report['added']) == (7, 7)
+    # 20 and 10 are more than the bank, 5 fits, the last 2 fit after 5 was refused and then nothing is left
+    assert stub_api.amounts == [20, 10, 5, 5, 2, 2, 1]
+    assert len(db.get_all_questions('Stub', 'easy')) == 7
@@ -0,0 +1,97 @@
+import pytest
+from db_columnar import DbColumnar
+from question_cache import QuestionCache
+
+
+class CountingDb(DbColumnar):
+    # counts the reads that the cache should save
+    def __init__(self):
+        super().__init__()
+        self.loads = 0
+        self.samples = 0
+
+    def get_all_questions(self, category, difficulty):
+        self.loads += 1
+        return super().get_all_questions(category, difficulty)
+
+    def get_questions(self, amount, category, difficulty, exclude_answered=False, user=None):
+        self.samples += 1
+        return super().get_questions(amount, category, difficulty, exclude_answered, user)
+
+
+def _add(cache, count, category='Cache'):
+    cache.add_questions([{'category': category, 'type': 'boolean', 'difficulty': 'easy',
+                          'question': f"{category} {i}?", 'correct_answer': 'True'} for i in range(count)])
+
+
+def test_bucket_is_loaded_once():
+    db = CountingDb()
+    cache = QuestionCache(db)
+    _add(cache, 5)
+    for _ in range(3):
+        assert len(cache.get_questions(3, 'Cache', 'easy')) == 3
+    assert db.loads == 1 and db.samples == 0
+    assert cache.cache_stats()['hits'] == 2
+
+    # adding a question reloads the bucket
+    _add(cache, 1, 'Cache')
+    cache.get_questions(3, 'Cache', 'easy')
+    assert db.loads == 2
+
+
+def test_uncacheable_bucket_is_not_loaded_again():
+    db = CountingDb()
+    cache = QuestionCache(db, max_bytes=100)
+    _add(cache, 5)
+    # the first request is served from the loaded questions, the next ones by the database
+    for _ in range(3):
+        assert len(cache.get_questions(2, 'Cache', 'easy')) == 2
+    assert db.loads == 1 and db.samples == 2
+    stats = cache.cache_stats()
+    assert stats['uncacheable'] == 1 and stats['buckets'] == 0
+
+    # invalidation forgets that the bucket was too large
+    cache.invalidate('Cache')
+    cache.get_questions(2, 'Cache', 'easy')
+    assert db.loads == 2
+
+
+def test_uncacheable_bucket_is_checked_again_after_ttl(monkeypatch):
+    import question_cache
+    now = [1000.0]
+    monkeypatch.setattr(question_cache.time, 'monotonic', lambda: now[0])
+    db = CountingDb()
+    cache = QuestionCache(db, max_bytes=100, ttl=60)
+    _add(cache, 5)
+    cache.get_questions(2, 'Cache', 'easy')
+    cache.get_questions(2, 'Cache', 'easy')
+    assert db.loads == 1
+    now[0] += 61
+    cache.get_questions(2, 'Cache', 'easy')
+    assert db.loads == 2
+
+
+def test_exclude_answered_filters_the_cached_bucket():
+    db = CountingDb()
+    cache = QuestionCache(db)
+    _add(cache, 5)
+    user = cache.add_user("alice")
+    ids = [q['id'] for q in cache.get_all_questions('Cache', 'easy')]
+    cache.update_correct_many([(q_id, user, 1) for q_id in ids[:3]])
+    db.loads = 0
+
+    picked = cache.get_questions(2, 'Cache', 'easy', exclude_answered=True, user=user)
+    assert sorted(q['id'] for q in picked) == sorted(ids[3:])
+    assert all('seq' not in q for q in picked)
+    # the answered questions fill the rest
+    picked = cache.get_questions(4, 'Cache', 'easy', exclude_answered=True, user=user)
+    assert len(picked) == 4 and set(ids[3:]) <= {q['id'] for q in picked}
+    # the bucket was loaded once and the database never sampled it
+    assert db.loads == 1 and db.samples == 0
+
+
+def test_exclude_answered_requires_a_user():
+    cache = QuestionCache(CountingDb())
+    _add(cache, 1)
+    with pytest.raises(ValueError):
+        cache.get_questions(1, 'Cache', 'easy', exclude_answered=True)
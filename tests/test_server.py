@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from answer_recorder import AnswerRecorder
+from db_columnar import DbColumnar
+from server import GameServer
+
+
+@pytest.fixture
+def game_server(tmp_path):
+    db = DbColumnar()
+    db.add_questions([{'category': 'Server', 'type': 'boolean', 'difficulty': 'easy',
+                       'question': f"Server {i}?", 'correct_answer': 'True'} for i in range(3)])
+    recorder = AnswerRecorder(db, journal_path=str(tmp_path / "answers.journal"), flush_interval=0.01)
+    recorder.start()
+    server = GameServer(db, recorder=recorder)
+    yield server
+    recorder.close()
+    server.close()
+
+
+def _run(server, scenario):
+    # runs the scenario with a client of the server running in-process
+    async def run():
+        async with TestClient(TestServer(server.make_app())) as client:
+            await scenario(client)
+
+    asyncio.run(run())
+
+
+def test_game_flow(game_server):
+    async def scenario(client):
+        assert await (await client.get('/categories')).json() == ['Server']
+        assert await (await client.get('/categories/Server/difficulties')).json() == ['easy']
+        response = await client.post('/sessions', json={'user': 'alice', 'category': 'Server',
+                                                        'difficulty': 'easy', 'amount': 2})
+        assert response.status == 201
+        session = (await response.json())['session']
+        question = await (await client.get(f'/sessions/{session}/question')).json()
+        assert question['n'] == 1
+        response = await client.post(f'/sessions/{session}/answer',
+                                     json={'answer': question['answers'].index('True')})
+        assert (await response.json())['correct'] is True
+        assert await (await client.get(f'/sessions/{session}/score')).json() == \
+            {'correct': 1, 'answered': 1, 'total': 2}
+        assert (await client.delete(f'/sessions/{session}')).status == 200
+        assert (await client.get(f'/sessions/{session}/score')).status == 404
+
+    _run(game_server, scenario)
+    assert game_server.recorder.flush(timeout=5)
+    assert game_server.db.get_user_rank('alice')['correct'] == 1
+
+
+@pytest.mark.parametrize('body', [
+    {'user': 'bob', 'category': 'Server', 'difficulty': 'impossible'},
+    {'user': 'bob', 'category': 'Server', 'difficulty': None},
+    {'user': 'bob', 'category': ['Server'], 'difficulty': 'easy'},
+    {'user': 'bob', 'difficulty': 'easy'},
+    {'user': 'bob', 'category': 'Server', 'difficulty': 'easy', 'amount': 0},
+    {'user': 5, 'category': 'Server', 'difficulty': 'easy'},
+    {'user': '', 'category': 'Server', 'difficulty': 'easy'},
+])
+def test_invalid_session_is_bad_request(game_server, body):
+    async def scenario(client):
+        response = await client.post('/sessions', json=body)
+        assert response.status == 400
+        assert 'error' in await response.json()
+
+    _run(game_server, scenario)
+
+
+def test_unknown_category_is_not_found(game_server):
+    async def scenario(client):
+        response = await client.post('/sessions', json={'user': 'bob', 'category': 'Nothing', 'difficulty': 'easy'})
+        assert response.status == 404
+
+    _run(game_server, scenario)